@@ -0,0 +1,113 @@
+"""
+Answer cache for the FAQ bot: an in-process LRU with TTL in front of an optional
+shared key-value backend (DynamoDB, or anything with the same get/put shape).
+
+Keys are built by the caller from the FAQ version, the normalized question, the
+retrieved entry ids and the model settings, so a FAQ reload changes every key and
+old answers simply stop being hit; the local LRU is also dropped on a version change.
+"""
+import hashlib, json, threading, time
+from collections import OrderedDict
+
+def make_key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+class DictBackend:
+    """In-memory stand-in for a shared backend (tests, local runs)."""
+
+    def __init__(self, clock=time.time):
+        self.items = {}
+        self.clock = clock
+
+    def get(self, key):
+        hit = self.items.get(key)
+        if hit is None or hit[1] <= self.clock():
+            return None
+        return hit[0]
+
+    def put(self, key, value, ttl):
+        self.items[key] = (value, self.clock() + ttl)
+
+class DynamoDBBackend:
+    """Table with string hash key `k`, JSON value `v` and a TTL attribute `expires_at`."""
+
+    def __init__(self, table_name, client):
+        self.table_name = table_name
+        self.client = client
+
+    def get(self, key):
+        item = self.client.get_item(TableName=self.table_name, Key={"k": {"S": key}}).get("Item")
+        # DynamoDB TTL deletion is lazy, so expiry is checked here too
+        if not item or int(item["expires_at"]["N"]) <= time.time():
+            return None
+        return json.loads(item["v"]["S"])
+
+    def put(self, key, value, ttl):
+        self.client.put_item(TableName=self.table_name, Item={
+            "k": {"S": key},
+            "v": {"S": json.dumps(value)},
+            "expires_at": {"N": str(int(time.time() + ttl))},
+        })
+
+class AnswerCache:
+    def __init__(self, max_entries=256, ttl_seconds=3600, backend=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.backend = backend
+        self.clock = clock
+        self._items = OrderedDict()  # key -> (value, expires_at)
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = self.shared_hits = self.misses = self.errors = 0
+
+    def set_version(self, version):
+        with self._lock:
+            if version != self._version:
+                self._items.clear()
+                self._version = version
+
+    def get(self, key):
+        now = self.clock()
+        with self._lock:
+            hit = self._items.get(key)
+            if hit is not None and hit[1] > now:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return hit[0]
+            if hit is not None:
+                del self._items[key]
+        value = None
+        if self.backend is not None:
+            try:
+                value = self.backend.get(key)
+            except Exception:
+                self.errors += 1  # a flaky shared cache must not fail the request
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+            self._store(key, value, now)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value, self.clock())
+        if self.backend is not None:
+            try:
+                self.backend.put(key, value, self.ttl)
+            except Exception:
+                self.errors += 1
+
+    def _store(self, key, value, now):
+        if self.max_entries <= 0:
+            return
+        self._items[key] = (value, now + self.ttl)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "shared_hits": self.shared_hits, "misses": self.misses,
+                    "errors": self.errors, "size": len(self._items)}
@@ -0,0 +1,104 @@
+"""
+BM25 ranking over FAQ question/answer fields, held as term-major sparse matrices.
+
+Each field is stored CSC-style with NumPy arrays: for term id t, the postings are
+doc_ids[indptr[t]:indptr[t+1]] with their precomputed BM25 weights. Scoring a query
+is a sparse matrix-vector product, done for a whole batch of queries with a single
+np.bincount over (query, doc) cells.
+"""
+import numpy as np
+
+# cap on the dense (queries x docs) score block materialized per batch step
+_MAX_CELLS = 4_000_000
+
+class _Field:
+    def __init__(self, docs, vocab, k1, b):
+        n_docs = len(docs)
+        rows, cols, tfs = [], [], []
+        lengths = np.zeros(n_docs, dtype=np.float32)
+        for d, tokens in enumerate(docs):
+            lengths[d] = len(tokens)
+            counts = {}
+            for tk in tokens:
+                counts[tk] = counts.get(tk, 0) + 1
+            for tk, c in counts.items():
+                rows.append(vocab.setdefault(tk, len(vocab)))
+                cols.append(d)
+                tfs.append(c)
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.cols = np.asarray(cols, dtype=np.int32)
+        self.tfs = np.asarray(tfs, dtype=np.float32)
+        self.lengths = lengths
+        self.n_docs = n_docs
+        self.k1, self.b = k1, b
+
+    def finalize(self, n_terms):
+        # sort by term so each term's postings are one contiguous slice
+        order = np.argsort(self.rows, kind="stable")
+        rows, cols, tfs = self.rows[order], self.cols[order], self.tfs[order]
+        df = np.bincount(rows, minlength=n_terms).astype(np.float32)
+        idf = np.log1p((self.n_docs - df + 0.5) / (df + 0.5))
+        avgdl = float(self.lengths.mean()) if self.n_docs else 0.0
+        norm = self.k1 * (1.0 - self.b + self.b * self.lengths[cols] / (avgdl or 1.0))
+        self.weights = (idf[rows] * tfs * (self.k1 + 1.0) / (tfs + norm)).astype(np.float32)
+        self.doc_ids = cols
+        self.indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(df.astype(np.int64), out=self.indptr[1:])
+        del self.rows, self.cols, self.tfs
+
+class Bm25Index:
+    def __init__(self, q_docs, a_docs, k1=1.2, b=0.75, answer_weight=0.3):
+        self.vocab = {}
+        self.n_docs = len(q_docs)
+        self.answer_weight = answer_weight
+        self.fields = [_Field(q_docs, self.vocab, k1, b), _Field(a_docs, self.vocab, k1, b)]
+        for f in self.fields:
+            f.finalize(len(self.vocab))
+
+    def _query_terms(self, tokens):
+        counts = {}
+        for tk in tokens:
+            t = self.vocab.get(tk)
+            if t is not None:
+                counts[t] = counts.get(t, 0) + 1
+        return counts
+
+    def score_batch(self, queries):
+        """(len(queries), n_docs) float32 scores for tokenized queries."""
+        n = self.n_docs
+        out = np.zeros((len(queries), n), dtype=np.float32)
+        if not n:
+            return out
+        step = max(1, _MAX_CELLS // n)
+        for start in range(0, len(queries), step):
+            chunk = [self._query_terms(q) for q in queries[start:start + step]]
+            cells = np.zeros(len(chunk) * n, dtype=np.float64)
+            for field, fw in zip(self.fields, (1.0, self.answer_weight)):
+                idx, w = [], []
+                for qi, terms in enumerate(chunk):
+                    for t, c in terms.items():
+                        lo, hi = field.indptr[t], field.indptr[t + 1]
+                        idx.append(field.doc_ids[lo:hi] + qi * n)
+                        w.append(field.weights[lo:hi] * (c * fw))
+                if idx:
+                    cells += np.bincount(np.concatenate(idx), weights=np.concatenate(w), minlength=len(cells))
+            out[start:start + len(chunk)] = cells.reshape(len(chunk), n)
+        return out
+
+    def top_k(self, queries, k=5):
+        """Per query, the k best (doc_id, score) pairs; ties go to the lower doc id."""
+        scores = self.score_batch(queries)
+        k = min(k, self.n_docs)
+        results = []
+        for row in scores:
+            if k <= 0:
+                results.append([])
+                continue
+            part = np.argpartition(-row, k - 1)[:k] if k < len(row) else np.arange(len(row))
+            # argpartition is arbitrary among ties at the cut; take those in doc order instead
+            cut = row[part].min()
+            above = np.flatnonzero(row > cut)
+            above = above[np.lexsort((above, -row[above]))]
+            pool = np.concatenate([above, np.flatnonzero(row == cut)[:k - len(above)]])
+            results.append([(int(d), float(row[d])) for d in pool])
+        return results
@@ -0,0 +1,80 @@
+"""
+Dense (embedding) retrieval for the FAQ bot.
+
+Vectors are computed once when the FAQ is published (tools/upload_faq.py) and
+stored next to faq.json as one float32 .npy of shape (2, N, D): row 0 holds the
+question embeddings, row 1 the answer embeddings, all L2-normalized. The Lambda
+memory-maps that file, so only the query embedding is computed per request.
+
+The .npy carries the sha256 of the faq.json it was built from as S3 metadata; the
+Lambda falls back to lexical retrieval when that does not match the loaded FAQ, or
+when the file is missing.
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+def vectors_key(faq_key: str) -> str:
+    return faq_key.rsplit(".", 1)[0] + ".vectors.npy"
+
+def embed_texts(client, model_id, texts, input_type="search_document", workers=1):
+    """Embed texts with a Bedrock embedding model (Titan or Cohere request shapes). Titan
+    takes one text per call; `workers` > 1 makes those calls concurrently."""
+    if model_id.startswith("cohere."):
+        out = []
+        for i in range(0, len(texts), 96):  # Cohere batch limit
+            body = {"texts": texts[i:i + 96], "input_type": input_type}
+            resp = client.invoke_model(modelId=model_id, body=json.dumps(body).encode("utf-8"),
+                                       contentType="application/json", accept="application/json")
+            out.extend(json.loads(resp["body"].read())["embeddings"])
+        return _normalized(out)
+    def embed(text):
+        body = {"inputText": text or " "}
+        resp = client.invoke_model(modelId=model_id, body=json.dumps(body).encode("utf-8"),
+                                   contentType="application/json", accept="application/json")
+        return json.loads(resp["body"].read())["embedding"]
+
+    if workers > 1 and len(texts) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(texts))) as pool:
+            return _normalized(list(pool.map(embed, texts)))
+    return _normalized([embed(text) for text in texts])
+
+def _normalized(rows):
+    arr = np.asarray(rows, dtype=np.float32)
+    norms = np.linalg.norm(arr, axis=-1, keepdims=True)
+    return arr / np.where(norms == 0, 1, norms)
+
+def build_vectors(embed, faqs):
+    """(2, N, D) float32 array for the FAQ entries; embed(texts) -> (len(texts), D)."""
+    questions = embed([it.get("question", "") for it in faqs])
+    answers = embed([it.get("answer", "") for it in faqs])
+    return np.stack([questions, answers]).astype(np.float32)
+
+def load_vectors(path):
+    return np.load(path, mmap_mode="r")
+
+class DenseIndex:
+    def __init__(self, vectors, answer_weight=0.3):
+        if vectors.ndim != 3 or vectors.shape[0] != 2:
+            raise ValueError(f"expected (2, N, D) vectors, got {vectors.shape}")
+        self.vectors = vectors
+        self.n_docs = vectors.shape[1]
+        self.answer_weight = answer_weight
+
+    def top_k(self, query_vecs, k=5):
+        """Per query vector, the k best (doc_id, cosine score) pairs; ties go to the lower id."""
+        q = np.asarray(query_vecs, dtype=np.float32)
+        scores = q @ self.vectors[0].T
+        if self.answer_weight:
+            scores += self.answer_weight * (q @ self.vectors[1].T)
+        k = min(k, self.n_docs)
+        results = []
+        for row in scores:
+            if k <= 0:
+                results.append([])
+                continue
+            part = np.argpartition(-row, k - 1)[:k] if k < len(row) else np.arange(len(row))
+            part = part[np.lexsort((part, -row[part]))]
+            results.append([(int(d), float(row[d])) for d in part])
+        return results
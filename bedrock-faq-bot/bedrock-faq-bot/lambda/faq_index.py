@@ -0,0 +1,291 @@
+"""
+Lexical FAQ index shared by the qna Lambda and tools/upload_faq.py.
+
+Tokens are interned to ids and every structure is a flat array, so the same
+index can be built in memory from faq.json or mapped straight out of the binary
+artifact that upload_faq.py publishes next to it (<stem>.index.bin).
+
+Artifact layout (little-endian):
+  header   MAGIC, VERSION u32, section count u32, sha256 of the source faq.json
+  table    per section: name (16s), typecode (1s), offset u64, byte length u64
+  sections 8-byte aligned arrays, read through memoryview.cast without copying
+"""
+import array, hashlib, heapq, mmap, re, struct, sys
+
+MAGIC = b"FAQIDX\0\0"
+VERSION = 2  # bump whenever tokenize() or the layout changes
+NGRAM = 3
+
+_HEADER = struct.Struct("<8sII32s")
+_SECTION = struct.Struct("<16s1sQQ")
+HEADER_SIZE = _HEADER.size
+
+def tokenize(text: str):
+    text = text.lower()
+    text = re.sub(r"[^a-z0-9\s]", " ", text)
+    return [t for t in text.split() if t]
+
+def source_digest(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+def index_key(faq_key: str) -> str:
+    return faq_key.rsplit(".", 1)[0] + ".index.bin"
+
+def _csr(rows, typecode="I"):
+    """Flatten a list of id lists into (offsets, values) arrays."""
+    offsets = array.array("Q", [0])
+    values = array.array(typecode)
+    for row in rows:
+        values.extend(row)
+        offsets.append(len(values))
+    return offsets, values
+
+class FaqEntries:
+    """Read-only list of {"question", "answer"} dicts decoded lazily from a UTF-8 blob."""
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets  # 2 * N + 1: question i, then answer i
+        self._blob = blob
+
+    def __len__(self):
+        return (len(self._offsets) - 1) // 2
+
+    def _text(self, j):
+        return bytes(self._blob[self._offsets[j]:self._offsets[j + 1]]).decode("utf-8")
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return {"question": self._text(2 * i), "answer": self._text(2 * i + 1)}
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+class LexicalIndex:
+    """Postings and per-entry token ids for the Jaccard + substring-bonus ranking."""
+
+    def __init__(self, vocab, gram_list, arrays):
+        # q_fwd_off/q_fwd, a_fwd_off/a_fwd: entry -> question / answer token ids
+        # q_post_off/q_post, a_post_off/a_post: token id -> entry ids (ascending)
+        # gram_off/gram_ids: char n-gram (gram_list order) -> ids of question tokens containing it
+        for name, arr in arrays.items():
+            setattr(self, name, arr)
+        self.vocab = vocab  # token strings, id = position
+        self.token_ids = dict(zip(vocab, range(len(vocab))))
+        self.gram_list = gram_list
+        self.grams = {g: (self.gram_off[j], self.gram_off[j + 1]) for j, g in enumerate(gram_list)}
+        self.n_entries = len(self.q_fwd_off) - 1
+        self.retokenized = 0
+
+    @classmethod
+    def build(cls, faqs, previous=None, previous_faqs=None):
+        """Index faqs. With the previous index and its entries, token ids are kept
+        stable and only questions/answers whose text changed are re-tokenized."""
+        vocab_ids = dict(previous.token_ids) if previous is not None else {}
+        reuse_q, reuse_a = {}, {}
+        if previous is not None and previous_faqs is not None:
+            for j, item in enumerate(previous_faqs):
+                reuse_q.setdefault(item.get("question", ""), j)
+                reuse_a.setdefault(item.get("answer", ""), j)
+
+        q_rows, a_rows = [], []
+        retokenized = 0
+        for item in faqs:
+            for field, reuse, rows, fwd in (("question", reuse_q, q_rows, "q_fwd"), ("answer", reuse_a, a_rows, "a_fwd")):
+                text = item.get(field, "")
+                j = reuse.get(text)
+                if j is not None:
+                    off = getattr(previous, fwd + "_off")
+                    rows.append(list(getattr(previous, fwd)[off[j]:off[j + 1]]))
+                else:
+                    retokenized += 1
+                    rows.append(sorted({vocab_ids.setdefault(t, len(vocab_ids)) for t in tokenize(text)}))
+        q_post = [[] for _ in vocab_ids]
+        a_post = [[] for _ in vocab_ids]
+        for i, (qr, ar) in enumerate(zip(q_rows, a_rows)):
+            for t in qr:
+                q_post[t].append(i)
+            for t in ar:
+                a_post[t].append(i)
+        vocab = list(vocab_ids)
+        # every substring of length 1..NGRAM of a question token -> ids of the tokens containing it
+        gram_rows, done = {}, set()
+        if previous is not None:
+            for g, (lo, hi) in previous.grams.items():
+                ids = previous.gram_ids[lo:hi]
+                done.update(ids)
+                ids = [t for t in ids if q_post[t]]
+                if ids:
+                    gram_rows[g] = ids
+        for t, tk in enumerate(vocab):
+            if not q_post[t] or t in done:
+                continue
+            for g in {tk[i:i + n] for n in range(1, NGRAM + 1) for i in range(len(tk) - n + 1)}:
+                gram_rows.setdefault(g, []).append(t)
+        gram_list = sorted(gram_rows)
+        arrays = {}
+        arrays["q_fwd_off"], arrays["q_fwd"] = _csr(q_rows)
+        arrays["a_fwd_off"], arrays["a_fwd"] = _csr(a_rows)
+        arrays["q_post_off"], arrays["q_post"] = _csr(q_post)
+        arrays["a_post_off"], arrays["a_post"] = _csr(a_post)
+        arrays["gram_off"], arrays["gram_ids"] = _csr(gram_rows[g] for g in gram_list)
+        index = cls(vocab, gram_list, arrays)
+        index.retokenized = retokenized  # fields tokenized in this build (0 for artifacts)
+        return index
+
+    def _substring_ids(self, query_tokens):
+        """Ids of question tokens that contain some query token as a substring."""
+        matched = set()
+        for tk in query_tokens:
+            if len(tk) <= NGRAM:
+                lo, hi = self.grams.get(tk, (0, 0))
+                matched.update(self.gram_ids[lo:hi])
+                continue
+            spans = sorted((self.grams.get(tk[i:i + NGRAM], (0, 0)) for i in range(len(tk) - NGRAM + 1)),
+                           key=lambda s: s[1] - s[0])
+            cand = set(self.gram_ids[spans[0][0]:spans[0][1]])
+            for lo, hi in spans[1:]:
+                if not cand:
+                    break
+                cand.intersection_update(self.gram_ids[lo:hi])
+            matched.update(v for v in cand if tk in self.vocab[v])
+        return matched
+
+    def top_k(self, query_tokens, k=5, with_scores=False):
+        """Entry ids (or (id, score) pairs) in the order a stable sort by qna._score
+        would give, but only entries reachable from the query tokens are scored."""
+        if k <= 0:
+            return []
+        query_tokens = set(query_tokens)
+        ids = [self.token_ids[t] for t in query_tokens if t in self.token_ids]
+        q_hits, a_hits = {}, {}
+        for t in ids:
+            for i in self.q_post[self.q_post_off[t]:self.q_post_off[t + 1]]:
+                q_hits[i] = q_hits.get(i, 0) + 1
+            for i in self.a_post[self.a_post_off[t]:self.a_post_off[t + 1]]:
+                a_hits[i] = a_hits.get(i, 0) + 1
+        matched = self._substring_ids(query_tokens)
+
+        n = len(query_tokens)
+        candidates = []
+        for i in q_hits.keys() | a_hits.keys():
+            q_overlap = q_hits.get(i, 0)
+            a_overlap = a_hits.get(i, 0)
+            lo, hi = self.q_fwd_off[i], self.q_fwd_off[i + 1]
+            jaccard_q = q_overlap / ((n + hi - lo - q_overlap) or 1)
+            a_len = self.a_fwd_off[i + 1] - self.a_fwd_off[i]
+            jaccard_a = a_overlap / ((n + a_len - a_overlap) or 1)
+            # a shared question token is trivially a substring match
+            substr = 0.1 if q_overlap or not matched.isdisjoint(self.q_fwd[lo:hi]) else 0.0
+            candidates.append((-(0.7 * jaccard_q + 0.2 * jaccard_a + substr), i))
+
+        # entries with only the substring bonus all score 0.1; the lowest ids win the tie.
+        # They can only reach the top k when fewer than k scored entries beat 0.1.
+        if sum(1 for neg, _ in candidates if neg < -0.1) < k:
+            seen = {i for _, i in candidates}
+            last = None
+            streams = (self.q_post[self.q_post_off[t]:self.q_post_off[t + 1]] for t in matched)
+            for i in heapq.merge(*streams):
+                if len(candidates) - len(seen) >= k:
+                    break
+                if i != last and i not in seen:
+                    candidates.append((-0.1, i))
+                last = i
+
+        # pad with zero-score entries in file order, as the full sort would
+        if len(candidates) < k:
+            taken = {i for _, i in candidates}
+            for i in range(self.n_entries):
+                if len(candidates) >= k:
+                    break
+                if i not in taken:
+                    candidates.append((0.0, i))
+
+        top = heapq.nsmallest(k, candidates)
+        if with_scores:
+            return [(i, 0.0 - neg) for neg, i in top]  # no -0.0 for zero scores
+        return [i for _, i in top]
+
+def write_artifact(fp, faqs, source_sha256: str):
+    """Serialize the lexical index plus a question/answer text blob for faqs."""
+    index = LexicalIndex.build(faqs)
+    texts = []
+    for item in faqs:
+        texts.append(item.get("question", "").encode("utf-8"))
+        texts.append(item.get("answer", "").encode("utf-8"))
+    text_off = array.array("Q", [0])
+    for t in texts:
+        text_off.append(text_off[-1] + len(t))
+    sections = [
+        ("vocab", "B", "\n".join(index.vocab).encode("utf-8")),
+        ("grams", "B", "\n".join(index.gram_list).encode("utf-8")),
+        ("text", "B", b"".join(texts)),
+        ("text_off", "Q", text_off),
+    ]
+    for name in ("q_fwd_off", "q_fwd", "a_fwd_off", "a_fwd", "q_post_off", "q_post", "a_post_off", "a_post", "gram_off", "gram_ids"):
+        sections.append((name, getattr(index, name).typecode, getattr(index, name)))
+
+    payloads = []
+    for name, code, data in sections:
+        if isinstance(data, array.array):
+            if sys.byteorder != "little":
+                data = array.array(data.typecode, data)
+                data.byteswap()
+            data = data.tobytes()
+        payloads.append((name, code, data))
+    offset = _HEADER.size + _SECTION.size * len(payloads)
+    table = []
+    for name, code, data in payloads:
+        offset += -offset % 8
+        table.append(_SECTION.pack(name.encode(), code.encode(), offset, len(data)))
+        offset += len(data)
+    fp.write(_HEADER.pack(MAGIC, VERSION, len(payloads), bytes.fromhex(source_sha256)))
+    fp.write(b"".join(table))
+    pos = _HEADER.size + _SECTION.size * len(payloads)
+    for name, code, data in payloads:
+        pad = -pos % 8
+        fp.write(b"\0" * pad)
+        fp.write(data)
+        pos += pad + len(data)
+    return index
+
+def read_header(buf):
+    """(version, source sha256 hex) of an artifact, or None if it isn't one."""
+    if len(buf) < _HEADER.size:
+        return None
+    magic, version, _, digest = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        return None
+    return version, digest.hex()
+
+def load_artifact(path):
+    """Map an artifact file; returns (FaqEntries, LexicalIndex, source sha256 hex)."""
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header = read_header(mm)
+    if header is None or header[0] != VERSION:
+        mm.close()
+        raise ValueError(f"unsupported FAQ index artifact: {header}")
+    _, count, _ = _HEADER.unpack_from(mm, 0)[1:]
+    view = memoryview(mm)
+    sections = {}
+    for j in range(count):
+        name, code, offset, length = _SECTION.unpack_from(mm, _HEADER.size + j * _SECTION.size)
+        data = view[offset:offset + length]
+        code = code.decode()
+        if code != "B":
+            data = data.cast(code)
+            if sys.byteorder != "little":
+                data = array.array(code, data)
+                data.byteswap()
+        sections[name.rstrip(b"\0").decode()] = data
+    vocab = bytes(sections.pop("vocab")).decode("utf-8")
+    gram_list = bytes(sections.pop("grams")).decode("utf-8")
+    entries = FaqEntries(sections.pop("text_off"), sections.pop("text"))
+    index = LexicalIndex(vocab.split("\n") if vocab else [], gram_list.split("\n") if gram_list else [], sections)
+    return entries, index, header[1]
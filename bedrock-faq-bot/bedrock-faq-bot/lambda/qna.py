@@ -1,56 +1,245 @@
-import json, os, logging, boto3, re, string
-from botocore.config import Config
+import json, os, logging, boto3, re, shutil, string, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from botocore.exceptions import ClientError
+
+import answer_cache, bedrock_client, faq_index, metrics, session_store, tenant_cache
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))  # parallel Bedrock calls per batch
+# A batch must finish inside the 29 s function/API Gateway limit: at a few seconds per
+# answer, BATCH_CONCURRENCY x 3 rounds fits; questions not answered by BATCH_SECONDS
+# come back with an error to resend, instead of the whole batch timing out.
+BATCH_MAX_QUESTIONS = int(os.environ.get("BATCH_MAX_QUESTIONS", "24"))
+BATCH_SECONDS = float(os.environ.get("BATCH_SECONDS", "24"))
+
 region = os.environ.get("AWS_REGION", "us-east-1")
 s3 = boto3.client("s3", region_name=region)
-bedrock = boto3.client("bedrock-runtime", region_name=region, config=Config(retries={"max_attempts": 3}))
+# pooled, rate-limited and circuit-broken; the pool must cover the batch workers
+bedrock = bedrock_client.shared(pool_size=BATCH_CONCURRENCY)
 
 FAQ_BUCKET = os.environ["FAQ_BUCKET"]
 FAQ_KEY = os.environ.get("FAQ_KEY", "data/faq.json")
 BEDROCK_MODEL_ID = os.environ.get("BEDROCK_MODEL_ID", "anthropic.claude-3-sonnet-20240229-v1:0")
+RANKER = os.environ.get("RANKER", "jaccard")  # jaccard | bm25 | dense
+EMBED_MODEL_ID = os.environ.get("EMBED_MODEL_ID", "amazon.titan-embed-text-v2:0")
+FAQ_VECTORS_KEY = os.environ.get("FAQ_VECTORS_KEY", "")  # default: <FAQ_KEY stem>.vectors.npy
+FAQ_INDEX_KEY = os.environ.get("FAQ_INDEX_KEY", "")  # default: <FAQ_KEY stem>.index.bin
+FAQ_REFRESH_SECONDS = float(os.environ.get("FAQ_REFRESH_SECONDS", "60"))  # 0 = load once per container
+# Multi-tenant: a request's "tenant" (body) or X-Tenant-Id header selects FAQ_TENANT_KEY with
+# {tenant} filled in; requests without one use FAQ_KEY. Empty = single tenant.
+FAQ_TENANT_KEY = os.environ.get("FAQ_TENANT_KEY", "")  # e.g. tenants/{tenant}/faq.json
+FAQ_CACHE_MB = float(os.environ.get("FAQ_CACHE_MB", "64"))  # loaded tenant indexes per container (estimated)
 MAX_TOKENS = int(os.environ.get("MAX_TOKENS", "600"))
 TEMPERATURE = float(os.environ.get("TEMPERATURE", "0.2"))
+BEDROCK_API = os.environ.get("BEDROCK_API", "converse")  # converse | invoke (legacy invoke_model body)
+PROMPT_CACHE = os.environ.get("PROMPT_CACHE", "on") == "on"
+FULL_CONTEXT_MAX_CHARS = int(os.environ.get("FULL_CONTEXT_MAX_CHARS", "20000"))  # smaller FAQs go whole into the cached prefix
+# Confidence routing on the top retrieval score. Scores are on the ranker's own scale, so the
+# thresholds apply to RANKER's index only; empty = that ranker's default. jaccard has defaults
+# (0.8 means the question's tokens match an FAQ question exactly); bm25 scores are unbounded and
+# dense ones depend on the embedding model, so both route every question to a model until
+# thresholds tuned for them are set.
+ROUTE_DIRECT_SCORE = os.environ.get("ROUTE_DIRECT_SCORE", "")  # stored answer, no model call
+ROUTE_FAST_SCORE = os.environ.get("ROUTE_FAST_SCORE", "")      # FAST_MODEL_ID
+ROUTE_MIN_MARGIN = float(os.environ.get("ROUTE_MIN_MARGIN", "0.05"))     # top-1 lead below this = ambiguous
+FAST_MODEL_ID = os.environ.get("FAST_MODEL_ID", "amazon.nova-lite-v1:0")
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "256"))  # 0 = no in-process cache
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_TABLE = os.environ.get("ANSWER_CACHE_TABLE", "")  # optional shared DynamoDB table
+# Multi-turn sessions: {"session": true} starts one, later turns send the returned "session_id".
+# DynamoDB table; "local" keeps sessions in process (tests, local runs); empty = sessions off
+SESSION_TABLE = os.environ.get("SESSION_TABLE", "")
+SESSION_TTL = int(os.environ.get("SESSION_TTL", "3600"))  # idle seconds before a session is forgotten
+SESSION_TOKENS = int(os.environ.get("SESSION_TOKENS", "1000"))  # history budget: rolling summary + recent turns
+SESSION_TURNS = int(os.environ.get("SESSION_TURNS", "6"))  # recent turns kept verbatim
+SESSION_SUMMARY_TOKENS = int(os.environ.get("SESSION_SUMMARY_TOKENS", "200"))
+SESSION_SUMMARY_MODEL_ID = os.environ.get("SESSION_SUMMARY_MODEL_ID", FAST_MODEL_ID)  # empty = list the questions, no model call
+SESSION_REWRITE = os.environ.get("SESSION_REWRITE", "local")  # local | model | off: retrieval query for follow-ups
+
+_TENANT = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{8,128}$")
+_INDEXES = {}  # id(entries) -> index, for every snapshot held (current and retired)
+
+class UnknownTenant(Exception):
+    pass
+
+class _Snapshot:
+    """One tenant's FAQ: the current entries and index, the previous index (for requests
+    that started before a reload) and the freshness check state."""
+
+    def __init__(self, tenant):
+        self.tenant = tenant
+        if tenant:
+            self.key = FAQ_TENANT_KEY.format(tenant=tenant)
+            self.index_key, self.vectors_key = faq_index.index_key(self.key), ""
+        else:
+            self.key = FAQ_KEY
+            self.index_key, self.vectors_key = FAQ_INDEX_KEY or faq_index.index_key(FAQ_KEY), FAQ_VECTORS_KEY
+        self.faqs = self.index = self.retired = self.etag = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+
+def _evicted(tenant, snap):
+    for index in (snap.index, snap.retired):
+        if index is not None:
+            _INDEXES.pop(id(index["faqs"]), None)
+    metrics.count("tenant_evictions")
+    logger.info("Evicted FAQ tenant %r from the container cache", tenant)
+
+_FAQ_TENANTS = tenant_cache.TenantCache(int(FAQ_CACHE_MB * 2 ** 20), _evicted)
+
+_ANSWER_CACHE = answer_cache.AnswerCache(
+    ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL,
+    answer_cache.DynamoDBBackend(ANSWER_CACHE_TABLE, boto3.client("dynamodb", region_name=region))
+    if ANSWER_CACHE_TABLE else None)
 
-_FAQ_CACHE = None
+if SESSION_TABLE == "local":
+    _SESSIONS = session_store.DictStore()
+elif SESSION_TABLE:
+    _SESSIONS = session_store.DynamoDBStore(SESSION_TABLE, boto3.client("dynamodb", region_name=region))
+else:
+    _SESSIONS = None
+
+_tokenize = faq_index.tokenize
 
 def _normalize(text: str):
-    text = text.lower()
-    text = re.sub(r"[^a-z0-9\s]", " ", text)
-    tokens = [t for t in text.split() if t]
-    return set(tokens)
-
-def _load_faqs():
-    global _FAQ_CACHE
-    if _FAQ_CACHE is not None:
-        return _FAQ_CACHE
-    resp = s3.get_object(Bucket=FAQ_BUCKET, Key=FAQ_KEY)
-    body = resp["Body"].read()
-    faqs = json.loads(body.decode("utf-8"))
-    # precompute tokens for quick scoring
-    for item in faqs:
-        item["_q_tokens"] = _normalize(item.get("question", ""))
-        item["_a_tokens"] = _normalize(item.get("answer", ""))
-    _FAQ_CACHE = faqs
-    logger.info("Loaded %d FAQ entries", len(faqs))
-    return _FAQ_CACHE
+    return set(_tokenize(text))
+
+def _refresh_due(snap):
+    return FAQ_REFRESH_SECONDS > 0 and time.monotonic() - snap.checked >= FAQ_REFRESH_SECONDS
+
+def _first_load(tenant):
+    snap = _Snapshot(tenant)
+    _refresh_faqs(snap)
+    metrics.count("tenant_loads")
+    return snap, _snapshot_bytes(snap)
+
+def _load_faqs(tenant=""):
+    """The tenant's FAQ entries ("" = FAQ_KEY). A tenant missing from the container cache
+    is loaded once, however many requests ask for it concurrently."""
+    snap = _FAQ_TENANTS.get(tenant, lambda: _first_load(tenant))
+    # during a reload other requests keep the current snapshot
+    if not _refresh_due(snap) or not snap.lock.acquire(blocking=False):
+        return snap.faqs
+    try:
+        if _refresh_due(snap) and _refresh_faqs(snap):
+            _FAQ_TENANTS.resize(tenant, _snapshot_bytes(snap))
+    finally:
+        snap.lock.release()
+    return snap.faqs
+
+def _snapshot_bytes(snap):
+    return tenant_cache.approx_bytes([snap.index, snap.retired])
+
+def _refresh_faqs(snap):
+    """Load the tenant's FAQ, or swap in a new snapshot if the S3 object's ETag changed.
+    True when entries were (re)loaded."""
+    snap.checked = time.monotonic()
+    try:
+        head = s3.head_object(Bucket=FAQ_BUCKET, Key=snap.key)
+    except ClientError as e:
+        if snap.faqs is None:
+            if snap.tenant and e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                raise UnknownTenant(snap.tenant) from e
+            raise
+        logger.warning("FAQ freshness check failed; keeping the loaded snapshot", exc_info=True)
+        return False
+    if snap.faqs is not None and head.get("ETag") == snap.etag:
+        return False
+
+    with metrics.timed("faq_load"):
+        loaded = _load_artifact(head, snap)
+        if loaded is not None:
+            faqs, lexical = loaded
+            etag, digest = head.get("ETag"), head.get("Metadata", {}).get("sha256")  # what the artifact was built from
+        else:
+            resp = s3.get_object(Bucket=FAQ_BUCKET, Key=snap.key)
+            body = resp["Body"].read()
+            faqs = json.loads(body.decode("utf-8"))
+            etag, digest = resp.get("ETag"), faq_index.source_digest(body)
+    with metrics.timed("index_build"):
+        if loaded is None:
+            previous = snap.index.get("lexical") if snap.index is not None else None
+            lexical = faq_index.LexicalIndex.build(faqs, previous, snap.faqs) if RANKER != "bm25" else None
+        index = _build_index(faqs, lexical, snap, digest)
+    index["version"] = etag
+
+    # publish the index before the entries so a reader of snap.faqs always finds its index
+    if snap.retired is not None:
+        _INDEXES.pop(id(snap.retired["faqs"]), None)
+    _INDEXES[id(faqs)] = index
+    snap.retired, snap.index = snap.index, index
+    reloaded = snap.faqs is not None
+    snap.faqs, snap.etag = faqs, etag
+    if not FAQ_TENANT_KEY:
+        _ANSWER_CACHE.set_version(etag)  # with tenants, the version and tenant in each key keep them apart
+    logger.info("%s %d FAQ entries for %s (%s)", "Reloaded" if reloaded else "Loaded", len(faqs),
+                snap.key, "index artifact" if loaded else "json")
+    if loaded is None and lexical is not None:
+        logger.info("Tokenized %d new or edited question/answer fields", lexical.retokenized)
+    return True
+
+@contextmanager
+def _downloaded(key, body=None):
+    """A /tmp copy of the object (or of `body`, its already opened stream), unique to this
+    load and removed after the block. Callers map it, and mappings stay valid after the
+    unlink, so /tmp is freed with the index and loads racing each other (a reload and an
+    eviction of one tenant) never share a file."""
+    path = f"/tmp/{key.replace('/', '_')}.{uuid.uuid4().hex[:12]}"
+    try:
+        if body is None:
+            s3.download_file(FAQ_BUCKET, key, path)
+        else:
+            with open(path, "wb") as f:
+                shutil.copyfileobj(body, f, 2 ** 20)
+        yield path
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _load_artifact(head, snap):
+    """(entries, LexicalIndex) mapped from the prebuilt artifact, or None if missing/stale."""
+    key = snap.index_key
+    try:
+        raw = s3.get_object(Bucket=FAQ_BUCKET, Key=key, Range=f"bytes=0-{faq_index.HEADER_SIZE - 1}")["Body"].read()
+    except ClientError:
+        logger.info("No FAQ index artifact at s3://%s/%s; parsing JSON", FAQ_BUCKET, key)
+        return None
+    header = faq_index.read_header(raw)
+    expected = head.get("Metadata", {}).get("sha256")
+    if header != (faq_index.VERSION, expected):
+        logger.warning("FAQ index artifact %s is stale or unsupported (%s); parsing JSON", key, header)
+        return None
+    with _downloaded(key) as path:
+        entries, lexical, digest = faq_index.load_artifact(path)
+    if digest != expected:  # replaced between the header check and the download
+        logger.warning("FAQ index artifact %s changed while loading; parsing JSON", key)
+        return None
+    return entries, lexical
 
 def _score(query_tokens, item):
+    # Reference ranking formula; faq_index.LexicalIndex.top_k reproduces its order.
+    q_tokens = _normalize(item.get("question", ""))
+    a_tokens = _normalize(item.get("answer", ""))
+
     # Jaccard on Q, light weight overlap on A, plus substring bonus
-    q_overlap = len(query_tokens & item["_q_tokens"])
-    q_union = len(query_tokens | item["_q_tokens"]) or 1
+    q_overlap = len(query_tokens & q_tokens)
+    q_union = len(query_tokens | q_tokens) or 1
     jaccard_q = q_overlap / q_union
 
-    a_overlap = len(query_tokens & item["_a_tokens"])
-    a_union = len(query_tokens | item["_a_tokens"]) or 1
+    a_overlap = len(query_tokens & a_tokens)
+    a_union = len(query_tokens | a_tokens) or 1
     jaccard_a = a_overlap / a_union
 
     # substring bonus if any query word appears as substring in question
     substr = 0.0
     for tk in query_tokens:
-        for qt in item["_q_tokens"]:
+        for qt in q_tokens:
             if tk in qt:
                 substr = 0.1
                 break
@@ -59,55 +248,467 @@ def _score(query_tokens, item):
 
     return 0.7 * jaccard_q + 0.2 * jaccard_a + substr
 
+def _build_index(faqs, lexical=None, snap=None, digest=None):
+    if RANKER == "bm25":
+        import bm25  # needs NumPy (Lambda layer); only loaded when selected
+        index = bm25.Bm25Index([_tokenize(it.get("question", "")) for it in faqs],
+                               [_tokenize(it.get("answer", "")) for it in faqs])
+        return {"faqs": faqs, "bm25": index}
+    if RANKER == "dense":
+        index = _load_dense_index(faqs, snap, digest)
+        if index is not None:
+            return {"faqs": faqs, "dense": index}
+    return {"faqs": faqs, "lexical": lexical or faq_index.LexicalIndex.build(faqs)}
+
+def _load_dense_index(faqs, snap=None, digest=None):
+    """DenseIndex from the vectors published with this FAQ, or None (lexical fallback) if
+    they are missing or were built from another version of it (their "sha256" metadata)."""
+    import dense  # needs NumPy (Lambda layer)
+    if snap is None or digest is None:
+        return None  # entries without their snapshot: which faq.json they came from is unknown
+    key = snap.vectors_key or dense.vectors_key(snap.key)
+    try:
+        resp = s3.get_object(Bucket=FAQ_BUCKET, Key=key)
+        if resp.get("Metadata", {}).get("sha256") != digest:
+            resp["Body"].close()
+            logger.warning("FAQ vectors %s were not built from this faq.json (stale?); falling back to "
+                           "lexical retrieval", key)
+            return None
+        with _downloaded(key, resp["Body"]) as path:  # the body checked above, not a later upload
+            vectors = dense.load_vectors(path)
+    except Exception as e:
+        logger.warning("No FAQ vectors at s3://%s/%s (%s); falling back to lexical retrieval", FAQ_BUCKET, key, e)
+        return None
+    if vectors.ndim != 3 or vectors.shape[:2] != (2, len(faqs)):
+        logger.warning("FAQ vectors %s do not match %d entries; falling back to lexical retrieval",
+                       vectors.shape, len(faqs))
+        return None
+    return dense.DenseIndex(vectors)
+
+def _embed_query(questions):
+    import dense
+    return dense.embed_texts(bedrock, EMBED_MODEL_ID, questions, input_type="search_query",
+                             workers=BATCH_CONCURRENCY)
+
+def _get_index(faqs):
+    """The index of a held snapshot's entries. A request looks it up once and keeps it in its
+    plan, so a reload or eviction while it runs does not matter; entries no longer held
+    (reloaded twice, or their tenant evicted) get an unversioned index built for the caller."""
+    index = _INDEXES.get(id(faqs))
+    if index is not None and index["faqs"] is faqs:
+        return index
+    return _build_index(faqs)
+
 def _retrieve(faqs, question, k=5):
-    q_tokens = _normalize(question)
-    ranked = sorted(faqs, key=lambda it: _score(q_tokens, it), reverse=True)
-    return ranked[:k]
+    return [faqs[i] for i in _retrieve_ids(faqs, [question], k)[0]]
+
+def _retrieve_batch(faqs, questions, k=5):
+    """Top-k per question; bm25/dense score the whole batch in one matrix product (tools/eval_retrieval.py)."""
+    return [[faqs[i] for i in ids] for ids in _retrieve_ids(faqs, questions, k)]
+
+def _retrieve_ids(faqs, questions, k=5):
+    return [[i for i, _ in row] for row in _retrieve_scored(faqs, questions, k)]
 
-def _build_prompt(question: str, top_items):
+def _retrieve_scored(faqs, questions, k=5, index=None):
+    """Per question, the top-k (entry id, score) pairs from the configured ranker."""
+    with metrics.timed("retrieval"):
+        if index is None:
+            index = _get_index(faqs)
+        if "bm25" in index:
+            return index["bm25"].top_k([_tokenize(q) for q in questions], k)
+        if "dense" in index:
+            return index["dense"].top_k(_embed_query(questions), k)
+        return [index["lexical"].top_k(_normalize(q), k, with_scores=True) for q in questions]
+
+_ROUTE_DEFAULTS = {"jaccard": (0.8, 0.45)}  # (direct, fast); rankers not listed: tiers off
+
+def _ranker(index):
+    """The ranker behind an index: RANKER, or jaccard where dense fell back to it."""
+    return "bm25" if "bm25" in index else "dense" if "dense" in index else "jaccard"
+
+def _thresholds(ranker):
+    """(direct, fast) score thresholds for that ranker's scores; None = tier off."""
+    direct, fast = _ROUTE_DEFAULTS.get(ranker, (None, None))
+    if ranker == RANKER:
+        direct = float(ROUTE_DIRECT_SCORE) if ROUTE_DIRECT_SCORE else direct
+        fast = float(ROUTE_FAST_SCORE) if ROUTE_FAST_SCORE else fast
+    return direct, fast
+
+def _route(scored, ranker="jaccard"):
+    """Pick the answer tier from retrieval confidence: direct, fast or full."""
+    direct, fast = _thresholds(ranker)
+    top = scored[0][1] if scored else 0.0
+    margin = top - scored[1][1] if len(scored) > 1 else top
+    if direct is not None and top >= direct and margin >= ROUTE_MIN_MARGIN:
+        tier, model = "direct", None
+    elif fast is not None and top >= fast and margin >= ROUTE_MIN_MARGIN and FAST_MODEL_ID:
+        tier, model = "fast", FAST_MODEL_ID
+    else:
+        tier, model = "full", BEDROCK_MODEL_ID
+    return {"tier": tier, "model": model, "score": round(top, 4), "margin": round(margin, 4)}
+
+def _answer_key(index, question, ids, model_id, tenant=""):
+    """None (do not cache) for an index that is not a loaded snapshot's: it has no version."""
+    version = index.get("version")
+    if version is None:
+        return None
+    tenant = (tenant,) if tenant else ()  # single-tenant keys stay as they were
+    return answer_cache.make_key(version, " ".join(_tokenize(question)), ids,
+                                 model_id, TEMPERATURE, MAX_TOKENS, *tenant)
+
+_SYSTEM_RULES = (
+    "You are a helpful FAQ assistant for a company.\n"
+    "- Use ONLY the provided FAQ context to answer.\n"
+    "- If the context doesn't contain the answer, say you don't know and suggest contacting support.\n"
+    "- Keep responses concise, with short bullet points when helpful.\n"
+)
+_INSTRUCTION = "Answer using information from the context. If insufficient, say you don't know."
+_HISTORY_INTRO = "Conversation so far (use it to tell what the question refers to; answer from the FAQ context):"
+_CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+def _format_context(items):
     context_lines = []
-    for idx, it in enumerate(top_items, 1):
+    for idx, it in enumerate(items, 1):
         q = it.get("question", "").strip()
         a = it.get("answer", "").strip()
         context_lines.append(f"{idx}. Q: {q}\n   A: {a}")
-    context = "\n".join(context_lines) if context_lines else "No FAQ items were retrieved."
+    return "\n".join(context_lines) if context_lines else "No FAQ items were retrieved."
 
-    system_rules = (
-        "You are a helpful FAQ assistant for a company.\n"
-        "- Use ONLY the provided FAQ context to answer.\n"
-        "- If the context doesn't contain the answer, say you don't know and suggest contacting support.\n"
-        "- Keep responses concise, with short bullet points when helpful.\n"
-    )
+def _format_history(history):
+    return f"{_HISTORY_INTRO}\n{history}\n\n" if history else ""
+
+def _build_prompt(question: str, top_items, history=""):
+    """Legacy invoke_model (Anthropic Messages) body, rules inlined into the user turn."""
+    context = _format_context(top_items)
 
     user_msg = (
         f"FAQ context:\n{context}\n\n"
+        f"{_format_history(history)}"
         f"User question: {question}\n\n"
-        "Answer using information from the context. If insufficient, say you don't know."
+        f"{_INSTRUCTION}"
     )
 
     body = {
         "anthropic_version": "bedrock-2023-05-31",
         "messages": [
-            {"role":"user","content":[{"type":"text","text": system_rules + "\n\n" + user_msg}]}
+            {"role":"user","content":[{"type":"text","text": _SYSTEM_RULES + "\n\n" + user_msg}]}
         ],
         "max_tokens": MAX_TOKENS,
         "temperature": TEMPERATURE
     }
     return body
 
-def _ask_bedrock(body):
-    resp = bedrock.invoke_model(
-        modelId=BEDROCK_MODEL_ID,
-        body=json.dumps(body).encode("utf-8"),
-        contentType="application/json",
-        accept="application/json",
-    )
-    payload = json.loads(resp["body"].read())
-    parts = payload.get("content", [])
-    if parts and isinstance(parts, list) and parts[0].get("type") == "text":
-        return parts[0]["text"].strip()
-    # Fallback shapes for other providers
-    return payload.get("outputText") or payload.get("generated_text") or json.dumps(payload)
+def _full_context(faqs, index=None):
+    """The whole FAQ as one context block when it is small enough, else None (once per snapshot)."""
+    if index is None:
+        index = _get_index(faqs)
+    if "full_context" not in index:
+        total = 0
+        for it in faqs:
+            total += len(it.get("question", "")) + len(it.get("answer", ""))
+            if total > FULL_CONTEXT_MAX_CHARS:
+                break
+        index["full_context"] = _format_context(faqs) if total <= FULL_CONTEXT_MAX_CHARS else None
+    return index["full_context"]
+
+def _build_converse(question, top_items, faqs, model_id, history="", index=None):
+    """Converse request: rules as the system prompt and, when the model can cache it, the
+    complete FAQ (if small) behind cache points, so every request shares that prefix.
+    Otherwise only the retrieved entries are sent: uncached, the whole FAQ would be paid for
+    on every call, and the rules alone are below the shortest prefix Bedrock caches.
+    Session history goes after the prefix, so conversations still share it."""
+    cache = PROMPT_CACHE and bedrock_client.prompt_cache_ok(model_id)
+    full = _full_context(faqs, index) if cache else None
+    point = [_CACHE_POINT] if full is not None else []
+    content = [{"text": f"FAQ context:\n{full if full is not None else _format_context(top_items)}"}] + point
+    content.append({"text": f"{_format_history(history)}User question: {question}\n\n{_INSTRUCTION}"})
+    return {
+        "modelId": model_id,
+        "system": [{"text": _SYSTEM_RULES}] + point,
+        "messages": [{"role": "user", "content": content}],
+        "inferenceConfig": {"maxTokens": MAX_TOKENS, "temperature": TEMPERATURE},
+    }
+
+def _use_invoke(model_id):
+    return BEDROCK_API == "invoke" and model_id.startswith("anthropic.")
+
+def _request(question, top_items, faqs, model_id, history, index=None):
+    with metrics.timed("prompt_build"):
+        if _use_invoke(model_id):
+            return _build_prompt(question, top_items, history)
+        return _build_converse(question, top_items, faqs, model_id, history, index)
+
+def _ask_model(question, top_items, faqs, model_id=None, priority=None, history="", index=None):
+    model_id = model_id or BEDROCK_MODEL_ID
+    invoke = _use_invoke(model_id)
+    request = _request(question, top_items, faqs, model_id, history, index)
+    if invoke:
+        return bedrock_client.invoke_text(request, model_id, priority)
+    # a model that rejects cache points gets the retrieved entries instead of the whole FAQ
+    resp = bedrock_client.converse(request, priority=priority,
+                                   rebuild=lambda: _request(question, top_items, faqs, model_id, history, index))
+    usage = resp.get("usage", {})
+    if usage.get("cacheReadInputTokens"):
+        logger.info("Prompt cache read %d input tokens", usage["cacheReadInputTokens"])
+    return bedrock_client.converse_text(resp)
+
+def _ask_model_stream(question, top_items, faqs, model_id=None, history="", index=None):
+    """Yield text deltas as the model generates them."""
+    model_id = model_id or BEDROCK_MODEL_ID
+    invoke = _use_invoke(model_id)
+    request = _request(question, top_items, faqs, model_id, history, index)
+    if invoke:
+        yield from bedrock_client.invoke_text_stream(request, model_id)
+        return
+    resp = bedrock_client.converse(request, stream=True,
+                                   rebuild=lambda: _request(question, top_items, faqs, model_id, history, index))
+    for event in resp["stream"]:
+        if "metadata" in event:
+            bedrock_client.record_usage(event["metadata"].get("usage"))
+        text = event.get("contentBlockDelta", {}).get("delta", {}).get("text")
+        if text:
+            yield text
+
+_FOLLOW_UP_WORDS = {"it", "its", "that", "this", "those", "these", "they", "them", "their", "same", "one"}
+_FOLLOW_UP_STARTS = ("and ", "also ", "what about ", "how about ", "what if ", "but ")
+_QUERY_CONTEXT_WORDS = 16  # carried over from earlier turns, so rewritten queries stay short
+_SESSION_SAVE_ATTEMPTS = 3
+_REWRITE_RULES = ("Rewrite the customer's last message as one standalone question, using the conversation "
+                  "only to fill in what it refers to. Reply with the question only.")
+_SUMMARY_RULES = ("Update the running summary of a customer support conversation with the new turns. Keep "
+                  "details the customer gave (plan, product, order) and what was already answered. Reply with "
+                  f"the summary only, in at most {SESSION_SUMMARY_TOKENS * 3 // 4} words.")
+
+def _is_follow_up(question):
+    words = _tokenize(question)
+    text = " ".join(words) + " "
+    return len(words) <= 4 or text.startswith(_FOLLOW_UP_STARTS) or not _FOLLOW_UP_WORDS.isdisjoint(words)
+
+def _rewrite_query(question, state):
+    """Retrieval query for a session turn. A follow-up ("what about Enterprise?") gets the
+    previous turn's query in front of it locally, or is rewritten by FAST_MODEL_ID with
+    SESSION_REWRITE=model; both only look at the last turns, so the cost stays flat.
+    _plan retrieves on this and on the question as asked, and averages the scores."""
+    if SESSION_REWRITE == "off":
+        return question
+    if SESSION_REWRITE == "model" and FAST_MODEL_ID:
+        recent = session_store.render_turns(state["turns"][-2:])
+        try:
+            with metrics.timed("rewrite"):
+                query = bedrock_client.ask(FAST_MODEL_ID, _REWRITE_RULES, f"{recent}\nUser: {question}", 100,
+                                           temperature=0.0, api=BEDROCK_API)
+            if query.strip():
+                return query.strip()
+        except Exception as e:
+            logger.warning("Query rewrite failed, using the local rewrite: %s", e)
+    context = _tokenize(state["turns"][-1]["query"])[-_QUERY_CONTEXT_WORDS:]
+    return " ".join(context + [question])
+
+def _summarize(summary, turns):
+    """Rolling summary: the previous summary plus the turns that left the window."""
+    if SESSION_SUMMARY_MODEL_ID:
+        text = f"Summary so far: {summary or '(none)'}\n\nNew turns:\n{session_store.render_turns(turns)}"
+        try:
+            with metrics.timed("session_summary"):
+                out = bedrock_client.ask(SESSION_SUMMARY_MODEL_ID, _SUMMARY_RULES, text, SESSION_SUMMARY_TOKENS,
+                                         temperature=0.0, api=BEDROCK_API)
+            return session_store.fold_text(out.strip(), [], SESSION_SUMMARY_TOKENS)
+        except Exception as e:
+            logger.warning("Session summary failed, keeping the questions only: %s", e)
+    return session_store.fold_text(summary, turns, SESSION_SUMMARY_TOKENS)
+
+def _fuse(rows, k):
+    """Average each entry's scores over several queries: the follow-up's own words keep
+    their weight, and the earlier turns' words break ties towards the conversation topic."""
+    totals = {}
+    for row in rows:
+        for i, score in row:
+            totals[i] = totals.get(i, 0.0) + score / len(rows)
+    return sorted(totals.items(), key=lambda x: -x[1])[:k]
+
+def _seed(history):
+    """Turns a client sends when it starts a session mid-chat: [{"question", "answer"}, ...]."""
+    if not isinstance(history, list) or len(history) > SESSION_TURNS or not all(
+            isinstance(t, dict) and isinstance(t.get("question"), str) and isinstance(t.get("answer"), str)
+            for t in history):
+        return None
+    state = session_store.new_state()
+    for t in history:
+        session_store.add_turn(state, t["question"], t["answer"], t["question"], max(1, SESSION_TOKENS // 4))
+    return state
+
+def _session(data, tenant):
+    """(session, error): None without "session_id"/"session"; {"session": true} starts a new one,
+    optionally seeded with the chat so far ("history"). A store outage leaves the turn
+    stateless rather than failing it."""
+    sid = data.get("session_id")
+    if sid is None and data.get("session") is not True:
+        return None, None
+    if _SESSIONS is None:
+        return None, "Sessions are not enabled"
+    if sid is None:
+        state = _seed(data.get("history", []))
+        if state is None:
+            return None, f"'history' must be a list of at most {SESSION_TURNS} question/answer pairs"
+        sid = uuid.uuid4().hex
+    elif not (isinstance(sid, str) and _SESSION_ID.match(sid)):
+        return None, "Invalid session_id"
+    key = f"{tenant}/{sid}" if tenant else sid  # tenants never see each other's sessions
+    if data.get("session_id") is None:
+        return {"id": sid, "key": key, "state": state, "version": 0}, None
+    try:
+        with metrics.timed("session_load"):
+            state, version = _SESSIONS.get(key)
+    except Exception as e:
+        logger.warning("Session %s not loaded: %s", sid, e)
+        state, version = None, None
+    return {"id": sid, "key": key, "state": state or session_store.new_state(), "version": version}, None
+
+def _remember(session, question, query, answer):
+    """Add the turn, compact, and save. If another turn of the session was saved meanwhile,
+    re-read it and apply this turn on top (a few times at most)."""
+    if session["version"] is None:
+        return
+    state, version = session["state"], session["version"]
+    for _ in range(_SESSION_SAVE_ATTEMPTS):
+        session_store.add_turn(state, question, answer, query, max(1, SESSION_TOKENS // 4))
+        if session_store.compact(state, SESSION_TURNS, SESSION_TOKENS, _summarize):
+            metrics.count("session_compactions")
+        try:
+            with metrics.timed("session_save"):
+                _SESSIONS.put(session["key"], state, version, SESSION_TTL)
+            return
+        except session_store.Conflict:
+            metrics.count("session_conflicts")
+        except Exception as e:
+            logger.warning("Session %s not saved: %s", session["id"], e)
+            return
+        try:
+            state, version = _SESSIONS.get(session["key"])
+        except Exception as e:
+            logger.warning("Session %s not saved: %s", session["id"], e)
+            return
+        state = state or session_store.new_state()
+    logger.warning("Session %s changed concurrently; turn not saved", session["id"])
+
+def _plan(question, faqs=None, scored=None, tenant="", session=None, index=None):
+    """Retrieve, route and check the answer cache; sets "answer" when no model call is needed.
+    In a session, a follow-up is retrieved on the rewritten query and the history goes to the
+    model; a question that stands on its own is planned (and cached) as if there were no session.
+    The plan keeps the snapshot's index for the rest of the request."""
+    if faqs is None:
+        faqs = _load_faqs(tenant)
+    if index is None:
+        index = _get_index(faqs)
+    query, history = question, ""
+    if session is not None and session["state"]["turns"] and _is_follow_up(question):
+        history = session_store.render(session["state"])
+        query = _rewrite_query(question, session["state"])
+        metrics.count("history_tokens", session_store.estimate_tokens(history))
+    if scored is None and query != question:
+        scored = _fuse(_retrieve_scored(faqs, [question, query], k=10, index=index), k=5)
+    elif scored is None:
+        scored = _retrieve_scored(faqs, [question], k=5, index=index)[0]
+    ids = [i for i, _ in scored]
+    top = [faqs[i] for i in ids]
+    route = _route(scored, _ranker(index))
+    plan = {"faqs": faqs, "index": index, "top": top, "route": route, "key": None, "cached": False,
+            "query": query, "history": history,
+            "sources": [{"question": t.get("question"), "answer": t.get("answer")} for t in top]}
+    if route["tier"] == "direct":
+        plan["answer"] = top[0].get("answer", "").strip()
+        return plan
+    if history:
+        return plan  # the answer depends on the conversation, so it is not cached
+    plan["key"] = _answer_key(index, question, ids, route["model"], tenant)
+    hit = _ANSWER_CACHE.get(plan["key"]) if plan["key"] is not None else None
+    if hit is not None:
+        plan["answer"], plan["cached"] = hit["answer"], True
+    return plan
+
+def _answer(question, plan, priority=None):
+    answer = plan.get("answer")
+    if answer is None:
+        answer = _ask_model(question, plan["top"], plan["faqs"], plan["route"]["model"], priority,
+                            plan["history"], plan["index"])
+        if plan["key"] is not None:
+            _ANSWER_CACHE.put(plan["key"], {"answer": answer})
+    return answer
+
+def _answer_batch(questions, tenant=""):
+    """Answer many questions: one retrieval pass, identical normalized questions
+    answered once, model calls spread over a bounded thread pool. Questions still
+    unanswered after BATCH_SECONDS get an error; those not started are never sent."""
+    deadline = time.monotonic() + BATCH_SECONDS
+    faqs = _load_faqs(tenant)
+    index = _get_index(faqs)
+    norms = [" ".join(_tokenize(q)) for q in questions]
+    first = {}
+    for q, n in zip(questions, norms):
+        if n:
+            first.setdefault(n, q)
+    unique = list(first)
+    scored = _retrieve_scored(faqs, [first[n] for n in unique], k=5, index=index)
+    plans = {n: _plan(first[n], faqs, s, tenant, index=index) for n, s in zip(unique, scored)}
+
+    pending = [n for n in unique if "answer" not in plans[n]]
+    pool = ThreadPoolExecutor(max_workers=min(BATCH_CONCURRENCY, len(pending))) if pending else None
+    futures = {n: pool.submit(_answer, first[n], plans[n], bedrock_client.BATCH) for n in pending}
+
+    results = []
+    for q, n in zip(questions, norms):
+        if not n:
+            results.append({"question": q, "error": "Empty question"})
+            continue
+        plan = plans[n]
+        item = {"question": q, "sources": plan["sources"], "route": plan["route"], "cached": plan["cached"]}
+        try:
+            item["answer"] = (futures[n].result(timeout=max(0.0, deadline - time.monotonic()))
+                              if n in futures else plan["answer"])
+        except FutureTimeout:
+            item["error"] = "Not answered within the batch time limit; send it again"
+        except Exception as e:
+            logger.warning("Batch item failed: %s", e)
+            item["error"] = str(e)
+        results.append(item)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _stream_answer(question, tenant="", session=None):
+    """Server-sent events: `sources` first, then `delta` text chunks, then `done` (or `error`).
+    A session turn is saved after `done`, once the client has the whole answer."""
+    plan = _plan(question, tenant=tenant, session=session)
+    head = {"sources": plan["sources"], "route": plan["route"]}
+    if session is not None:
+        head.update(session_id=session["id"], query=plan["query"])
+    yield _sse("sources", head)
+    if "answer" in plan:
+        answer = plan["answer"]
+        yield _sse("delta", {"text": answer})
+    else:
+        parts = []
+        started = time.perf_counter()
+        try:
+            for text in _ask_model_stream(question, plan["top"], plan["faqs"], plan["route"]["model"],
+                                          plan["history"], plan["index"]):
+                if not parts:
+                    metrics.record("first_token", (time.perf_counter() - started) * 1000.0)
+                parts.append(text)
+                yield _sse("delta", {"text": text})
+        except Exception as e:
+            logger.exception("Bedrock stream failed")
+            yield _sse("error", {"error": str(e)})
+            return
+        answer = "".join(parts).strip()
+        if plan["key"] is not None:
+            _ANSWER_CACHE.put(plan["key"], {"answer": answer})
+    yield _sse("done", {"cached": plan["cached"]})
+    if session is not None:
+        _remember(session, question, plan["query"], answer)
 
 def _resp(status, body):
     return {
@@ -115,12 +716,56 @@ def _resp(status, body):
         "headers": {
             "content-type": "application/json",
             "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "Content-Type,Authorization",
+            "Access-Control-Allow-Headers": "Content-Type,Authorization,X-Tenant-Id",
             "Access-Control-Allow-Methods": "OPTIONS,POST,GET"
         },
         "body": json.dumps(body)
     }
 
+def _tenant(data, headers):
+    """(tenant, error): the body's "tenant" or the X-Tenant-Id header, "" for the default FAQ."""
+    headers = {k.lower(): v for k, v in (headers or {}).items()}
+    tenant = data.get("tenant") or headers.get("x-tenant-id") or ""
+    if tenant and not FAQ_TENANT_KEY:
+        return None, "Tenants are not enabled"
+    if tenant and not (isinstance(tenant, str) and _TENANT.match(tenant)):
+        return None, "Invalid tenant"
+    return tenant, None
+
+def _post(path, data, tenant):
+    if path.endswith("/ask/batch"):
+        if "session" in data or "session_id" in data:
+            return _resp(400, {"error":"Sessions are not supported by /ask/batch"})
+        questions = data.get("questions")
+        if not isinstance(questions, list) or not questions or not all(isinstance(q, str) for q in questions):
+            return _resp(400, {"error":"'questions' must be a non-empty list of strings"})
+        if len(questions) > BATCH_MAX_QUESTIONS:
+            return _resp(400, {"error":f"At most {BATCH_MAX_QUESTIONS} questions per batch"})
+        return _resp(200, {"results": _answer_batch([q.strip() for q in questions], tenant)})
+    question = (data.get("question") or "").strip()
+    if not question:
+        return _resp(400, {"error":"Missing 'question' in body"})
+    session, error = _session(data, tenant)
+    if error:
+        return _resp(400, {"error": error})
+    if data.get("stream") or path.endswith("/ask/stream"):
+        # API Gateway buffers this body; stream_server.py delivers the same events incrementally
+        resp = _resp(200, None)
+        resp["headers"]["content-type"] = "text/event-stream"
+        resp["body"] = "".join(_stream_answer(question, tenant, session))
+        return resp
+    plan = _plan(question, tenant=tenant, session=session)
+    try:
+        answer = _answer(question, plan)
+    except bedrock_client.Unavailable as e:
+        return _resp(503, {"error": str(e)})
+    body = {"answer": answer, "sources": plan["sources"], "cached": plan["cached"], "route": plan["route"]}
+    if session is not None:
+        _remember(session, question, plan["query"], answer)
+        body.update(session_id=session["id"], query=plan["query"])
+    return _resp(200, body)
+
+@metrics.invocation
 def lambda_handler(event, context):
     method = event.get("httpMethod", "GET")
     path = event.get("path", "/")
@@ -128,7 +773,8 @@ def lambda_handler(event, context):
         return _resp(200, {"ok": True})
 
     if method == "GET" and (path.endswith("/health") or path == "/health"):
-        return _resp(200, {"ok": True, "service": "faq-bot"})
+        return _resp(200, {"ok": True, "service": "faq-bot", "answer_cache": _ANSWER_CACHE.stats(),
+                           "tenants": _FAQ_TENANTS.stats()})
 
     if method == "POST":
         body_raw = event.get("body") or "{}"
@@ -136,15 +782,12 @@ def lambda_handler(event, context):
             data = json.loads(body_raw)
         except Exception:
             return _resp(400, {"error":"Invalid JSON"})
-        question = (data.get("question") or "").strip()
-        if not question:
-            return _resp(400, {"error":"Missing 'question' in body"})
-        faqs = _load_faqs()
-        top = _retrieve(faqs, question, k=5)
-        bedrock_body = _build_prompt(question, top)
-        answer = _ask_bedrock(bedrock_body)
-
-        sources = [{"question": t.get("question"), "answer": t.get("answer")} for t in top]
-        return _resp(200, {"answer": answer, "sources": sources})
+        tenant, error = _tenant(data, event.get("headers"))
+        if error:
+            return _resp(400, {"error": error})
+        try:
+            return _post(path, data, tenant)
+        except UnknownTenant:
+            return _resp(404, {"error": "Unknown tenant"})
 
     return _resp(404, {"error":"Not found"})
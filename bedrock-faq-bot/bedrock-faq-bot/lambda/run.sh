@@ -0,0 +1,3 @@
+#!/bin/sh
+# Entry point for the streaming Lambda (Lambda Web Adapter runs this as the web app)
+exec python3 stream_server.py
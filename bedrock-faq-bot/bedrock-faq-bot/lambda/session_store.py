@@ -0,0 +1,134 @@
+"""
+Conversation memory for the FAQ bot: per-session state kept within a fixed token budget,
+behind a pluggable store (DynamoDB, or an in-process dict for tests and local runs).
+
+A session's state is {"summary": str, "turns": [{"q", "a", "query"}], "n": turns so far}.
+The most recent turns are kept verbatim (a sliding window); older ones are folded into
+the rolling summary by `compact`, so the history sent to the model, and the stored item,
+stop growing after the first few turns.
+
+Stores hold (state, version) and `put` only succeeds against the version that was read,
+so two concurrent turns of one session cannot silently drop each other's writes.
+"""
+import json, threading, time
+from collections import OrderedDict
+
+CHARS_PER_TOKEN = 4  # same estimate as bedrock_client's rate limiter
+
+class Conflict(Exception):
+    """The session changed since it was read."""
+
+def estimate_tokens(text) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+class DictStore:
+    """In-memory stand-in for a shared store (tests, local runs); sessions stay in one process.
+    Expired sessions are dropped as they are met, and the least recently written beyond
+    max_items are dropped on put."""
+
+    def __init__(self, max_items=10000, clock=time.time):
+        self.items = OrderedDict()  # key -> (JSON state, version, expires_at), oldest write first
+        self.max_items = max_items
+        self.clock = clock
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        hit = self.items.get(key)
+        if hit is not None and hit[2] <= now:
+            del self.items[key]
+            return None
+        return hit
+
+    def get(self, key):
+        with self._lock:
+            hit = self._live(key, self.clock())
+            if hit is None:
+                return None, 0
+            return json.loads(hit[0]), hit[1]
+
+    def put(self, key, state, version, ttl):
+        now = self.clock()
+        with self._lock:
+            hit = self._live(key, now)
+            if (hit[1] if hit is not None else 0) != version:
+                raise Conflict(key)
+            self.items[key] = (json.dumps(state), version + 1, now + ttl)
+            self.items.move_to_end(key)
+            # writes are in expiry order (one TTL), so expired sessions collect at the front
+            while self.items and (len(self.items) > self.max_items or next(iter(self.items.values()))[2] <= now):
+                self.items.popitem(last=False)
+
+class DynamoDBStore:
+    """Table with string hash key `k`, JSON value `v`, version `n` and a TTL attribute `expires_at`."""
+
+    def __init__(self, table_name, client):
+        self.table_name = table_name
+        self.client = client
+
+    def get(self, key):
+        item = self.client.get_item(TableName=self.table_name, Key={"k": {"S": key}},
+                                    ConsistentRead=True).get("Item")
+        if not item or int(item["expires_at"]["N"]) <= time.time():
+            return None, int(item["n"]["N"]) if item else 0
+        return json.loads(item["v"]["S"]), int(item["n"]["N"])
+
+    def put(self, key, state, version, ttl):
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={"k": {"S": key}, "v": {"S": json.dumps(state)}, "n": {"N": str(version + 1)},
+                      "expires_at": {"N": str(int(time.time() + ttl))}},
+                ConditionExpression="attribute_not_exists(k) OR n = :n",
+                ExpressionAttributeValues={":n": {"N": str(version)}},
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            raise Conflict(key)
+
+def new_state():
+    return {"summary": "", "turns": [], "n": 0}
+
+def _clip(text, max_tokens):
+    limit = max_tokens * CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[:limit].rstrip() + " ..."
+
+def add_turn(state, question, answer, query, max_tokens):
+    """Append a turn; its answer is clipped so one long reply cannot fill the budget alone."""
+    state["turns"].append({"q": question, "a": _clip(answer, max_tokens), "query": query})
+    state["n"] = state.get("n", 0) + 1
+
+def render_turns(turns):
+    return "\n".join(f"User: {t['q']}\nAssistant: {t['a']}" for t in turns)
+
+def render(state) -> str:
+    """History for the prompt: the rolling summary, then the recent turns verbatim."""
+    parts = []
+    if state["summary"]:
+        parts.append(f"Summary of the earlier conversation: {state['summary']}")
+    if state["turns"]:
+        parts.append(render_turns(state["turns"]))
+    return "\n\n".join(parts)
+
+def history_tokens(state) -> int:
+    return estimate_tokens(render(state))
+
+def fold_text(summary, turns, max_tokens) -> str:
+    """Model-free summary: the user's questions, newest kept when it overflows."""
+    text = " ".join([summary] + [f"Asked: {t['q']}" for t in turns]).strip()
+    limit = max_tokens * CHARS_PER_TOKEN
+    return text if len(text) <= limit else "... " + text[-limit:].lstrip()
+
+def compact(state, max_turns, max_tokens, summarize) -> bool:
+    """Fold the oldest turns into the summary once the window or the token budget is
+    exceeded. It folds down to half the window, so `summarize(summary, turns)` runs every
+    few turns rather than on every one. Returns True if anything was folded."""
+    turns = state["turns"]
+    if len(turns) <= max_turns and history_tokens(state) <= max_tokens:
+        return False
+    keep = min(len(turns) - 1, max(1, max_turns // 2))
+    while keep > 1 and estimate_tokens(state["summary"] + render_turns(turns[-keep:])) > max_tokens:
+        keep -= 1
+    if keep <= 0:
+        return False
+    folded, state["turns"] = turns[:-keep], turns[-keep:]
+    state["summary"] = summarize(state["summary"], folded)
+    return True
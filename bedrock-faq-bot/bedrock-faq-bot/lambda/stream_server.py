@@ -0,0 +1,80 @@
+"""
+Streaming front for the FAQ bot.
+
+Python Lambdas can't write a response stream from a plain handler, so the
+streaming function runs this small HTTP server behind the AWS Lambda Web Adapter
+(AWS_LWA_INVOKE_MODE=response_stream) and a RESPONSE_STREAM function URL. Each SSE
+frame from qna._stream_answer is flushed as its own HTTP chunk, so `sources`
+reach the browser before the model starts and text shows up token by token.
+
+Run locally with: FAQ_BUCKET=<bucket> python stream_server.py
+"""
+import json, os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics, qna
+
+PORT = int(os.environ.get("AWS_LWA_PORT", os.environ.get("PORT", "8080")))
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _headers(self, status, content_type, chunked=False, length=None):
+        self.send_response(status)
+        self.send_header("content-type", content_type)
+        self.send_header("cache-control", "no-cache")
+        if chunked:
+            self.send_header("transfer-encoding", "chunked")
+        else:
+            self.send_header("content-length", str(length or 0))
+        self.end_headers()
+
+    def _json(self, status, body):
+        raw = json.dumps(body).encode("utf-8")
+        self._headers(status, "application/json", length=len(raw))
+        self.wfile.write(raw)
+
+    def _chunk(self, text):
+        raw = text.encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(raw), raw))
+        self.wfile.flush()
+
+    def do_OPTIONS(self):
+        self._headers(200, "text/plain")
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/health"):
+            return self._json(200, {"ok": True, "service": "faq-bot-stream"})
+        self._json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        try:
+            data = json.loads(self.rfile.read(int(self.headers.get("content-length") or 0)) or b"{}")
+        except ValueError:
+            return self._json(400, {"error": "Invalid JSON"})
+        question = (data.get("question") or "").strip()
+        if not question:
+            return self._json(400, {"error": "Missing 'question' in body"})
+        tenant, error = qna._tenant(data, dict(self.headers.items()))
+        if error:
+            return self._json(400, {"error": error})
+        try:
+            qna._load_faqs(tenant)  # before the 200, so an unknown tenant still gets a 404
+        except qna.UnknownTenant:
+            return self._json(404, {"error": "Unknown tenant"})
+        session, error = qna._session(data, tenant)
+        if error:
+            return self._json(400, {"error": error})
+        self._headers(200, "text/event-stream", chunked=True)
+        with metrics.scope():
+            try:
+                for frame in qna._stream_answer(question, tenant, session):
+                    self._chunk(frame)
+            except Exception as e:
+                qna.logger.exception("Streaming answer failed")
+                self._chunk(qna._sse("error", {"error": str(e)}))
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+if __name__ == "__main__":
+    ThreadingHTTPServer(("0.0.0.0", PORT), Handler).serve_forever()
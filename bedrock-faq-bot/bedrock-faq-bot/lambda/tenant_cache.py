@@ -0,0 +1,132 @@
+"""
+Per-tenant cache for the FAQ bot: an LRU of loaded tenant snapshots bounded by their
+estimated memory rather than by count, with single-flight loading.
+
+`get(tenant, load)` returns the cached value, or calls `load()` -> (value, bytes) once,
+however many requests ask for the same cold tenant at the same time: the others wait
+for that load and share its result (or its exception; a failed load is not cached).
+After an insert or a `resize`, least recently used tenants are evicted until the total
+fits the budget. The tenant just loaded is never evicted, so one tenant larger than the
+whole budget is still served (alone).
+"""
+import array, sys, threading
+from collections import OrderedDict
+
+def approx_bytes(obj) -> int:
+    """Rough memory held by an index structure: arrays and NumPy arrays by their buffer
+    size, strings and containers by sys.getsizeof, objects through their __dict__/__slots__."""
+    seen, stack, total = set(), [obj], 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or o is None or isinstance(o, (bool, int, float)):
+            continue
+        seen.add(id(o))
+        if isinstance(o, (str, bytes, bytearray)):
+            total += sys.getsizeof(o)
+        elif isinstance(o, memoryview):
+            total += o.nbytes
+        elif isinstance(o, array.array):
+            total += sys.getsizeof(o)
+        elif hasattr(o, "nbytes") and hasattr(o, "dtype"):  # NumPy (memory-mapped too), without importing it
+            total += o.nbytes
+        elif isinstance(o, dict):
+            total += sys.getsizeof(o)
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            total += sys.getsizeof(o)
+            stack.extend(o)
+        elif hasattr(o, "__dict__") or hasattr(type(o), "__slots__"):
+            total += sys.getsizeof(o)
+            stack.extend(getattr(o, "__dict__", {}).values())
+            stack.extend(getattr(o, s, None) for s in getattr(type(o), "__slots__", ()))
+        else:
+            total += sys.getsizeof(o)
+    return total
+
+class _Flight:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = self.error = None
+
+class TenantCache:
+    def __init__(self, budget_bytes, on_evict=None):
+        self.budget = budget_bytes
+        self.on_evict = on_evict  # on_evict(tenant, value), called outside the lock
+        self._items = OrderedDict()  # tenant -> (value, bytes), least recently used first
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = self.misses = self.waits = self.evictions = self.errors = 0
+
+    def get(self, tenant, load):
+        with self._lock:
+            hit = self._items.get(tenant)
+            if hit is not None:
+                self._items.move_to_end(tenant)
+                self.hits += 1
+                return hit[0]
+            flight = self._flights.get(tenant)
+            leader = flight is None
+            if leader:
+                flight = self._flights[tenant] = _Flight()
+                self.misses += 1
+            else:
+                self.waits += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            value, size = load()
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                del self._flights[tenant]
+                self.errors += 1
+            flight.done.set()
+            raise
+        flight.value = value
+        with self._lock:
+            del self._flights[tenant]
+            self._items[tenant] = (value, size)
+            self.bytes += size
+            evicted = self._evict()
+        flight.done.set()
+        self._evicted(evicted)
+        return value
+
+    def resize(self, tenant, size):
+        """A cached tenant's value changed size (e.g. it was reloaded)."""
+        with self._lock:
+            if tenant not in self._items:
+                return
+            value, old = self._items[tenant]
+            self._items[tenant] = (value, size)
+            self._items.move_to_end(tenant)
+            self.bytes += size - old
+            evicted = self._evict()
+        self._evicted(evicted)
+
+    def _evict(self):
+        evicted = []
+        while self.bytes > self.budget and len(self._items) > 1:
+            tenant, (value, size) = self._items.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+            evicted.append((tenant, value))
+        return evicted
+
+    def _evicted(self, evicted):
+        if self.on_evict is not None:
+            for tenant, value in evicted:
+                self.on_evict(tenant, value)
+
+    def stats(self):
+        with self._lock:
+            return {"tenants": len(self._items), "mb": round(self.bytes / 2 ** 20, 2),
+                    "budget_mb": round(self.budget / 2 ** 20, 2), "hits": self.hits, "misses": self.misses,
+                    "waits": self.waits, "evictions": self.evictions, "errors": self.errors}
@@ -26,6 +26,7 @@ provider "aws" {
 locals {
   project          = var.project
   lambda_src_dir   = "${path.module}/../lambda"
+  shared_src_dir   = "${path.module}/../../../shared"
   faq_key          = "data/faq.json"
   bedrock_model_id = var.bedrock_model_id
   tags = merge(var.tags, { Project = local.project })
@@ -60,6 +61,44 @@ resource "aws_s3_bucket_public_access_block" "faq" {
   restrict_public_buckets = true
 }
 
+########################
+# Optional shared answer cache (DynamoDB)
+########################
+resource "aws_dynamodb_table" "answer_cache" {
+  count        = var.shared_answer_cache ? 1 : 0
+  name         = "${local.project}-answer-cache-${random_id.suffix.hex}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "k"
+  attribute {
+    name = "k"
+    type = "S"
+  }
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+  tags = local.tags
+}
+
+########################
+# Optional conversation memory (DynamoDB)
+########################
+resource "aws_dynamodb_table" "sessions" {
+  count        = var.session_memory ? 1 : 0
+  name         = "${local.project}-sessions-${random_id.suffix.hex}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "k"
+  attribute {
+    name = "k"
+    type = "S"
+  }
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+  tags = local.tags
+}
+
 ########################
 # IAM for Lambda
 ########################
@@ -83,6 +122,12 @@ data "aws_iam_policy_document" "qna_policy_doc" {
     actions = ["s3:GetObject"]
     resources = ["${aws_s3_bucket.faq.arn}/*"]
   }
+  statement {
+    # so a missing tenant object is a 404 (unknown tenant) rather than a 403
+    effect    = "Allow"
+    actions   = ["s3:ListBucket"]
+    resources = [aws_s3_bucket.faq.arn]
+  }
   statement {
     effect   = "Allow"
     actions  = ["bedrock:InvokeModel", "bedrock:InvokeModelWithResponseStream"]
@@ -93,6 +138,22 @@ data "aws_iam_policy_document" "qna_policy_doc" {
     actions = ["logs:CreateLogGroup", "logs:CreateLogStream", "logs:PutLogEvents"]
     resources = ["*"]
   }
+  dynamic "statement" {
+    for_each = aws_dynamodb_table.answer_cache
+    content {
+      effect    = "Allow"
+      actions   = ["dynamodb:GetItem", "dynamodb:PutItem"]
+      resources = [statement.value.arn]
+    }
+  }
+  dynamic "statement" {
+    for_each = aws_dynamodb_table.sessions
+    content {
+      effect    = "Allow"
+      actions   = ["dynamodb:GetItem", "dynamodb:PutItem"]
+      resources = [statement.value.arn]
+    }
+  }
 }
 
 resource "aws_iam_role_policy" "qna_policy" {
@@ -104,31 +165,106 @@ resource "aws_iam_role_policy" "qna_policy" {
 ########################
 # Package & Lambda
 ########################
+# bedrock_client.py and metrics.py live once, in shared/ at the repository root
+data "archive_file" "shared_layer_zip" {
+  type        = "zip"
+  output_path = "${path.module}/build/shared_layer.zip"
+  source {
+    filename = "python/bedrock_client.py"
+    content  = file("${local.shared_src_dir}/bedrock_client.py")
+  }
+  source {
+    filename = "python/metrics.py"
+    content  = file("${local.shared_src_dir}/metrics.py")
+  }
+}
+
+resource "aws_lambda_layer_version" "shared" {
+  layer_name          = "${local.project}-shared"
+  filename            = data.archive_file.shared_layer_zip.output_path
+  source_code_hash    = data.archive_file.shared_layer_zip.output_base64sha256
+  compatible_runtimes = ["python3.11"]
+}
+
 data "archive_file" "qna_zip" {
   type        = "zip"
-  source_file = "${local.lambda_src_dir}/qna.py"
+  source_dir  = local.lambda_src_dir
+  excludes    = ["__pycache__"]
   output_path = "${path.module}/build/qna.zip"
 }
 
+locals {
+  qna_env = {
+    FAQ_BUCKET          = aws_s3_bucket.faq.bucket
+    FAQ_KEY             = local.faq_key
+    BEDROCK_MODEL_ID    = local.bedrock_model_id
+    RANKER              = var.ranker
+    EMBED_MODEL_ID      = var.embed_model_id
+    FAQ_REFRESH_SECONDS = "60"
+    FAQ_TENANT_KEY      = var.faq_tenant_key
+    FAQ_CACHE_MB        = var.faq_cache_mb
+    ANSWER_CACHE_TABLE  = var.shared_answer_cache ? aws_dynamodb_table.answer_cache[0].name : ""
+    SESSION_TABLE       = var.session_memory ? aws_dynamodb_table.sessions[0].name : ""
+    FAST_MODEL_ID       = var.fast_model_id
+    ROUTE_DIRECT_SCORE  = var.route_direct_score
+    ROUTE_FAST_SCORE    = var.route_fast_score
+    BATCH_CONCURRENCY   = "8"
+    BEDROCK_API         = "converse"
+    PROMPT_CACHE        = "on"
+    MAX_TOKENS          = "600"
+    TEMPERATURE         = "0.2"
+  }
+}
+
 resource "aws_lambda_function" "qna" {
   function_name = "${local.project}-qna"
   role          = aws_iam_role.qna.arn
   runtime       = "python3.11"
   handler       = "qna.lambda_handler"
   filename      = data.archive_file.qna_zip.output_path
-  timeout       = 20
+  timeout       = 29 # API Gateway's integration limit; batches run close to it
+  layers        = concat([aws_lambda_layer_version.shared.arn], var.lambda_layers)
   environment {
-    variables = {
-      FAQ_BUCKET       = aws_s3_bucket.faq.bucket
-      FAQ_KEY          = local.faq_key
-      BEDROCK_MODEL_ID = local.bedrock_model_id
-      MAX_TOKENS       = "600"
-      TEMPERATURE      = "0.2"
-    }
+    variables = local.qna_env
   }
   tags = local.tags
 }
 
+########################
+# Optional streaming endpoint (Lambda Web Adapter + RESPONSE_STREAM function URL)
+########################
+resource "aws_lambda_function" "qna_stream" {
+  count         = var.enable_streaming ? 1 : 0
+  function_name = "${local.project}-qna-stream"
+  role          = aws_iam_role.qna.arn
+  runtime       = "python3.11"
+  handler       = "run.sh"
+  filename      = data.archive_file.qna_zip.output_path
+  timeout       = 60
+  layers        = concat([var.web_adapter_layer_arn, aws_lambda_layer_version.shared.arn], var.lambda_layers)
+  environment {
+    variables = merge(local.qna_env, {
+      AWS_LAMBDA_EXEC_WRAPPER      = "/opt/bootstrap"
+      AWS_LWA_INVOKE_MODE          = "response_stream"
+      AWS_LWA_READINESS_CHECK_PATH = "/health"
+      PORT                         = "8080"
+    })
+  }
+  tags = local.tags
+}
+
+resource "aws_lambda_function_url" "qna_stream" {
+  count              = var.enable_streaming ? 1 : 0
+  function_name      = aws_lambda_function.qna_stream[0].function_name
+  authorization_type = "NONE"
+  invoke_mode        = "RESPONSE_STREAM"
+  cors {
+    allow_origins = ["*"]
+    allow_methods = ["POST", "GET"]
+    allow_headers = ["content-type", "x-tenant-id"]
+  }
+}
+
 ########################
 # API Gateway (REST)
 ########################
@@ -198,7 +334,7 @@ resource "aws_api_gateway_integration_response" "ask_options_200" {
   http_method = aws_api_gateway_method.ask_options.http_method
   status_code = aws_api_gateway_method_response.ask_options_200.status_code
   response_parameters = {
-    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization'",
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization,X-Tenant-Id'",
     "method.response.header.Access-Control-Allow-Methods" = "'OPTIONS,POST,GET'",
     "method.response.header.Access-Control-Allow-Origin"  = "'*'"
   }
@@ -206,6 +342,29 @@ resource "aws_api_gateway_integration_response" "ask_options_200" {
   depends_on = [aws_api_gateway_integration.ask_options_integration]
 }
 
+# POST /ask/batch
+resource "aws_api_gateway_resource" "ask_batch" {
+  rest_api_id = aws_api_gateway_rest_api.api.id
+  parent_id   = aws_api_gateway_resource.ask.id
+  path_part   = "batch"
+}
+
+resource "aws_api_gateway_method" "ask_batch_post" {
+  rest_api_id   = aws_api_gateway_rest_api.api.id
+  resource_id   = aws_api_gateway_resource.ask_batch.id
+  http_method   = "POST"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_integration" "ask_batch_post_integration" {
+  rest_api_id             = aws_api_gateway_rest_api.api.id
+  resource_id             = aws_api_gateway_resource.ask_batch.id
+  http_method             = aws_api_gateway_method.ask_batch_post.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.qna.invoke_arn
+}
+
 # GET /health
 resource "aws_api_gateway_resource" "health" {
   rest_api_id = aws_api_gateway_rest_api.api.id
@@ -245,12 +404,14 @@ resource "aws_api_gateway_deployment" "deployment" {
     redeploy = sha1(join(",", [
       aws_api_gateway_integration.ask_post_integration.id,
       aws_api_gateway_integration.ask_options_integration.id,
+      aws_api_gateway_integration.ask_batch_post_integration.id,
       aws_api_gateway_integration.health_get_integration.id
     ]))
   }
   depends_on = [
     aws_api_gateway_integration.ask_post_integration,
     aws_api_gateway_integration.ask_options_integration,
+    aws_api_gateway_integration.ask_batch_post_integration,
     aws_api_gateway_integration.health_get_integration
   ]
 }
@@ -275,6 +436,11 @@ output "api_invoke_url" {
   description = "Execution ARN (use https URL below)"
 }
 
+output "stream_url" {
+  value       = var.enable_streaming ? aws_lambda_function_url.qna_stream[0].function_url : ""
+  description = "Streaming (SSE) endpoint; paste into the web UI's Stream URL field"
+}
+
 output "api_base_url" {
   value       = "https://${aws_api_gateway_rest_api.api.id}.execute-api.${var.region}.amazonaws.com/${aws_api_gateway_stage.prod.stage_name}"
   description = "Base URL like https://xxxx.execute-api.<region>.amazonaws.com/prod"
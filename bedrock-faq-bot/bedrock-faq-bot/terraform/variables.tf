@@ -19,6 +19,78 @@ variable "bedrock_model_id" {
   default     = "anthropic.claude-3-sonnet-20240229-v1:0"
 }
 
+variable "fast_model_id" {
+  description = "Cheaper model for medium-confidence questions (empty = always use bedrock_model_id)"
+  type        = string
+  default     = "amazon.nova-lite-v1:0"
+}
+
+variable "route_direct_score" {
+  description = "Top retrieval score at or above which the stored FAQ answer is returned without a model call, on var.ranker's scale; empty = 0.8 for jaccard, off for bm25 and dense"
+  type        = string
+  default     = ""
+}
+
+variable "route_fast_score" {
+  description = "Top retrieval score at or above which fast_model_id answers instead of bedrock_model_id, on var.ranker's scale; empty = 0.45 for jaccard, off for bm25 and dense"
+  type        = string
+  default     = ""
+}
+
+variable "ranker" {
+  description = "FAQ retrieval backend: jaccard (pure Python), bm25 or dense (both need a NumPy layer)"
+  type        = string
+  default     = "jaccard"
+}
+
+variable "embed_model_id" {
+  description = "Bedrock embedding model for ranker = dense (same model passed to tools/upload_faq.py)"
+  type        = string
+  default     = "amazon.titan-embed-text-v2:0"
+}
+
+variable "faq_tenant_key" {
+  description = "FAQ object key per tenant, e.g. tenants/{tenant}/faq.json; empty serves the single FAQ at faq_key"
+  type        = string
+  default     = ""
+}
+
+variable "faq_cache_mb" {
+  description = "Memory budget per container for loaded tenant FAQ indexes (least recently used are dropped)"
+  type        = string
+  default     = "64"
+}
+
+variable "lambda_layers" {
+  description = "Layer ARNs for the qna Lambda (e.g. a NumPy layer when ranker = bm25)"
+  type        = list(string)
+  default     = []
+}
+
+variable "shared_answer_cache" {
+  description = "Create a DynamoDB table so cached answers are shared across Lambda containers"
+  type        = bool
+  default     = false
+}
+
+variable "session_memory" {
+  description = "Create a DynamoDB table for multi-turn session memory; without it, session requests get a 400"
+  type        = bool
+  default     = true
+}
+
+variable "enable_streaming" {
+  description = "Deploy a second, streaming Lambda behind a RESPONSE_STREAM function URL"
+  type        = bool
+  default     = false
+}
+
+variable "web_adapter_layer_arn" {
+  description = "AWS Lambda Web Adapter layer (x86_64) for the streaming Lambda; adjust the region"
+  type        = string
+  default     = "arn:aws:lambda:ap-south-1:753240598075:layer:LambdaAdapterLayerX86:24"
+}
+
 variable "tags" {
   description = "Common tags"
   type        = map(string)
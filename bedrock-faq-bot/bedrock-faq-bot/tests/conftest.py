@@ -0,0 +1,19 @@
+import os, sys
+
+import pytest
+
+# qna reads these at import; the tests never call AWS
+os.environ.setdefault("FAQ_BUCKET", "test")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("METRICS", "off")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "shared"))
+# fakes.py: the in-process S3 and Bedrock the load test runs against
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "loadtest"))
+
+@pytest.fixture
+def backend():
+    """loadtest fakes with no simulated latency; `backend.client(service)` makes a client.
+    Modules that made their clients at import get them with monkeypatch.setattr."""
+    import fakes
+    return fakes.Backend(time_scale=0)
@@ -0,0 +1,103 @@
+import json, os, threading, time
+
+import pytest
+
+import answer_cache, dense, qna
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "faq.json")
+
+class FakeModel:
+    """_ask_model stand-in that records calls and the most questions in flight at once."""
+
+    def __init__(self, delay=0.02, fail=(), hang=()):
+        self.delay, self.fail, self.hang = delay, set(fail), set(hang)
+        self.calls, self.active, self.peak = [], 0, 0
+        self.lock = threading.Lock()
+
+    def __call__(self, question, top, faqs, model_id, priority=None, history="", index=None):
+        with self.lock:
+            self.calls.append(question)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(1.0 if question in self.hang else self.delay)
+            if question in self.fail:
+                raise RuntimeError("ThrottlingException")
+            return f"answer to {question}"
+        finally:
+            with self.lock:
+                self.active -= 1
+
+@pytest.fixture
+def model(monkeypatch):
+    with open(DATA) as f:
+        faqs = json.load(f)
+    monkeypatch.setattr(qna, "_load_faqs", lambda tenant="": faqs)
+    monkeypatch.setattr(qna, "RANKER", "jaccard")
+    monkeypatch.setitem(qna._INDEXES, id(faqs), qna._build_index(faqs))
+    monkeypatch.setattr(qna, "_ANSWER_CACHE", answer_cache.AnswerCache(64, 60))
+    fake = FakeModel()
+    monkeypatch.setattr(qna, "_ask_model", fake)
+    return fake
+
+def test_identical_normalized_questions_are_answered_once(model):
+    results = qna._answer_batch(["Do you have a mobile app?", "do you have a MOBILE app", "How do I get help?"])
+    assert sorted(model.calls) == ["Do you have a mobile app?", "How do I get help?"]
+    assert results[0]["answer"] == results[1]["answer"] == "answer to Do you have a mobile app?"
+    assert [r["question"] for r in results][1] == "do you have a MOBILE app"
+
+def test_one_failed_or_empty_question_does_not_fail_the_batch(model):
+    model.fail.add("How do I get help?")
+    results = qna._answer_batch(["Do you have a mobile app?", "", "How do I get help?"])
+    assert results[0]["answer"] == "answer to Do you have a mobile app?"
+    assert results[1] == {"question": "", "error": "Empty question"}
+    assert "ThrottlingException" in results[2]["error"] and "answer" not in results[2]
+
+def test_model_calls_stay_within_the_concurrency_bound(monkeypatch, model):
+    monkeypatch.setattr(qna, "BATCH_CONCURRENCY", 3)
+    questions = [f"is there a discount for group {i}" for i in range(10)]
+    results = qna._answer_batch(questions)
+    assert all("answer" in r for r in results) and len(model.calls) == 10
+    assert 1 < model.peak <= 3
+
+def test_questions_past_the_deadline_come_back_as_errors(monkeypatch, model):
+    monkeypatch.setattr(qna, "BATCH_SECONDS", 0.3)
+    model.hang.add("How do I get help?")
+    started = time.monotonic()
+    results = qna._answer_batch(["How do I get help?", "Do you have a mobile app?"])
+    assert time.monotonic() - started < 0.9
+    assert "time limit" in results[0]["error"]
+    assert results[1]["answer"] == "answer to Do you have a mobile app?"
+    while model.active:  # let the abandoned call finish before the fixture's cache is undone
+        time.sleep(0.05)
+
+def test_batches_over_the_cap_are_rejected(model):
+    resp = qna._post("/ask/batch", {"questions": ["x"] * (qna.BATCH_MAX_QUESTIONS + 1)}, "")
+    assert resp["statusCode"] == 400 and not model.calls
+
+def test_titan_query_embeddings_run_concurrently():
+    class Client:
+        active = peak = 0
+        lock = threading.Lock()
+
+        def invoke_model(self, modelId, body, **kw):
+            with self.lock:
+                Client.active += 1
+                Client.peak = max(Client.peak, Client.active)
+            time.sleep(0.02)
+            with self.lock:
+                Client.active -= 1
+            text = json.loads(body)["inputText"]
+            return {"body": FakeBody(json.dumps({"embedding": [len(text), 1.0]}))}
+
+    class FakeBody:
+        def __init__(self, data):
+            self.data = data
+
+        def read(self):
+            return self.data
+
+    texts = ["a", "bb", "ccc", "dddd"]
+    vectors = dense.embed_texts(Client(), "amazon.titan-embed-text-v2:0", texts, workers=4)
+    assert Client.peak > 1
+    assert vectors.shape == (4, 2) and vectors[3][0] > vectors[0][0]  # input order kept
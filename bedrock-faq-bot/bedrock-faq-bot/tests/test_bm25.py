@@ -0,0 +1,47 @@
+import json, os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+import bm25, qna
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "faq.json")
+
+def _index(questions, answers=None, **kw):
+    answers = answers or [""] * len(questions)
+    return bm25.Bm25Index([q.split() for q in questions], [a.split() for a in answers], **kw)
+
+def test_rare_terms_outweigh_common_ones():
+    index = _index(["reset account password", "close account", "export account data", "account plan"])
+    (top, _), *_ = index.top_k([["account", "password"]], k=4)[0]
+    assert top == 0
+    scores = index.score_batch([["account"], ["password"]])
+    assert scores[1, 0] > scores[0, 0] > 0 and scores[1, 1] == 0
+
+def test_shorter_fields_score_higher_for_the_same_match():
+    index = _index(["refund policy", "refund policy for orders shipped to another country"])
+    assert [d for d, _ in index.top_k([["refund"]], k=2)[0]] == [0, 1]
+
+def test_answers_count_less_than_questions():
+    questions, answers = ["shipping times", "returns"], ["returns are accepted for 30 days", "we ship in 3 days"]
+    ranked = _index(questions, answers).top_k([["returns"]], k=2)[0]
+    assert ranked[0][0] == 1 and 0 < ranked[1][1] < ranked[0][1]
+    assert _index(questions, answers, answer_weight=0.0).top_k([["returns"]], k=2)[0][1][1] == 0
+
+def test_ties_go_to_the_lower_entry_and_unknown_terms_score_zero():
+    index = _index(["billing help", "billing help", "billing help"])
+    assert [d for d, _ in index.top_k([["billing"]], k=2)[0]] == [0, 1]
+    assert all(s == 0 for _, s in index.top_k([["nothing", "matches"]], k=3)[0])
+    assert _index([]).top_k([["billing"]], k=3) == [[]]
+
+def test_a_batch_ranks_as_its_questions_do_one_at_a_time(monkeypatch):
+    with open(DATA) as f:
+        faqs = json.load(f)
+    monkeypatch.setattr(qna, "RANKER", "bm25")
+    monkeypatch.setitem(qna._INDEXES, id(faqs), qna._build_index(faqs))
+    monkeypatch.setattr(bm25, "_MAX_CELLS", 2 * len(faqs))  # several score blocks per batch
+    questions = ["how do i reset my password", "cancel subscription", "shipping", "do you offer support"]
+    batch = qna._retrieve_batch(faqs, questions, k=3)
+    assert batch == [qna._retrieve(faqs, q, k=3) for q in questions]
+    assert batch[0][0]["question"] == "How do I reset my password?"
+    assert batch[1][0]["question"] == "Can I cancel my subscription?"
@@ -0,0 +1,78 @@
+import io, json, os, random
+
+import pytest
+
+import faq_index, qna
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "faq.json")
+WORDS = ("how do i reset change cancel my password account plan order refund shipping the a to is it "
+         "on for can what why where invoice card app mobile team export delete data enterprise pro "
+         "ab abc abcd x").split()
+
+def _corpus(n, seed):
+    rng = random.Random(seed)
+    faqs = [{"question": " ".join(rng.choices(WORDS, k=rng.randint(2, 9))) + "?",
+             "answer": " ".join(rng.choices(WORDS, k=rng.randint(0, 20)))} for _ in range(n)]
+    faqs += faqs[:5]  # duplicates, so ties are broken by position
+    faqs.append({"question": "", "answer": ""})
+    return faqs
+
+def _queries(seed):
+    rng = random.Random(seed)
+    queries = [" ".join(rng.choices(WORDS, k=rng.randint(1, 6))) for _ in range(150)]
+    # substring-only matches, short grams, nothing at all, empty
+    return queries + ["pass", "ncel", "a", "x", "zzz unknown", "", "abc", "ord ref", "PASSWORD!!"]
+
+def _reference(faqs, query):
+    """The original ranking: a stable sort of every entry by qna._score."""
+    tokens = qna._normalize(query)
+    return sorted(((qna._score(tokens, item), i) for i, item in enumerate(faqs)), key=lambda x: -x[0])
+
+def _assert_same(index, faqs, queries):
+    for query in queries:
+        reference = _reference(faqs, query)
+        for k in (1, 5, 12):
+            expected = reference[:k]
+            got = index.top_k(qna._normalize(query), k, with_scores=True)
+            assert [i for i, _ in got] == [i for _, i in expected], (query, k)
+            assert [s for _, s in got] == pytest.approx([s for s, _ in expected]), (query, k)
+
+@pytest.mark.parametrize("n, seed", [(40, 1), (400, 2), (3000, 3)])
+def test_top_k_matches_full_scan(n, seed):
+    faqs = _corpus(n, seed)
+    _assert_same(faq_index.LexicalIndex.build(faqs), faqs, _queries(seed))
+
+def test_top_k_matches_full_scan_on_sample_faq():
+    with open(DATA) as f:
+        faqs = json.load(f)
+    queries = ["return policy", "how long does shipping take", "reset password", "tech support enterprise",
+               "cancel", "ship", "pass", "weather"]
+    _assert_same(faq_index.LexicalIndex.build(faqs), faqs, queries)
+
+def test_incremental_build_and_artifact_rank_the_same():
+    faqs = _corpus(300, 4)
+    previous = faq_index.LexicalIndex.build(faqs)
+    edited = [dict(item) for item in faqs[:250]]
+    edited[3]["question"] = "how do i export my invoice data"
+    edited.append({"question": "brand new question about abcd", "answer": "and its answer"})
+    queries = _queries(5)
+    _assert_same(faq_index.LexicalIndex.build(edited, previous, faqs), edited, queries)
+
+    buf = io.BytesIO()
+    faq_index.write_artifact(buf, edited, "0" * 64)
+    path = os.path.join(os.environ.get("TMPDIR", "/tmp"), f"faq-index-test-{os.getpid()}.bin")
+    with open(path, "wb") as f:
+        f.write(buf.getvalue())
+    try:
+        entries, lexical, _ = faq_index.load_artifact(path)
+        assert list(entries) == edited
+        _assert_same(lexical, edited, queries)
+    finally:
+        os.remove(path)
+
+def test_substring_only_entries_beat_weak_answer_matches():
+    # answer-only matches score 0.2 * 1/3 here, below the 0.1 substring bonus of the last entry
+    faqs = [{"question": f"question {i}", "answer": "zeta alpha beta"} for i in range(8)]
+    faqs.append({"question": "about zetas", "answer": "none"})
+    _assert_same(faq_index.LexicalIndex.build(faqs), faqs, ["zeta"])
+    assert faq_index.LexicalIndex.build(faqs).top_k({"zeta"}, 1) == [8]
@@ -0,0 +1,72 @@
+import json, os
+
+import pytest
+from botocore.exceptions import ClientError
+
+import bedrock_client, qna
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "faq.json")
+MODEL = "test.model-v1:0"
+
+@pytest.fixture
+def faqs(monkeypatch):
+    with open(DATA) as f:
+        faqs = json.load(f)
+    monkeypatch.setitem(qna._INDEXES, id(faqs), qna._build_index(faqs))
+    monkeypatch.setattr(bedrock_client, "_NO_PROMPT_CACHE", set())
+    return faqs
+
+def _points(request):
+    blocks = request["system"] + request["messages"][0]["content"]
+    return sum("cachePoint" in b for b in blocks)
+
+def _context(request):
+    return request["messages"][0]["content"][0]["text"]
+
+def test_small_faq_goes_whole_behind_cache_points(faqs):
+    request = qna._build_converse("How long does shipping take?", faqs[1:2], faqs, MODEL)
+    assert _points(request) == 2
+    assert all(it["question"] in _context(request) for it in faqs)
+
+@pytest.mark.parametrize("uncached", ["prompt_cache_off", "model_rejected_cache_points"])
+def test_without_caching_only_the_retrieved_entries_are_sent(monkeypatch, faqs, uncached):
+    if uncached == "prompt_cache_off":
+        monkeypatch.setattr(qna, "PROMPT_CACHE", False)
+    else:
+        bedrock_client._NO_PROMPT_CACHE.add(MODEL)
+    request = qna._build_converse("How long does shipping take?", faqs[1:2], faqs, MODEL)
+    assert _points(request) == 0
+    assert faqs[1]["question"] in _context(request) and faqs[0]["question"] not in _context(request)
+
+def test_large_faq_sends_the_retrieved_entries_without_cache_points(monkeypatch, faqs):
+    monkeypatch.setattr(qna, "FULL_CONTEXT_MAX_CHARS", 100)
+    request = qna._build_converse("How long does shipping take?", faqs[1:2], faqs, MODEL)
+    assert _points(request) == 0 and faqs[0]["question"] not in _context(request)
+
+class FakeClient:
+    """converse() that rejects cache points like a model without prompt caching."""
+
+    def __init__(self):
+        self.requests = []
+
+    def converse(self, priority=None, **request):
+        self.requests.append(request)
+        if _points(request):
+            raise ClientError({"Error": {"Code": "ValidationException",
+                                         "Message": "This model doesn't support caching"}}, "Converse")
+        return {"output": {"message": {"content": [{"text": "Within 5 days."}]}}, "usage": {}}
+
+def test_rejected_cache_points_are_retried_with_the_retrieved_entries(monkeypatch, faqs):
+    client = FakeClient()
+    monkeypatch.setattr(bedrock_client, "shared", lambda: client)
+    assert qna._ask_model("How long does shipping take?", faqs[1:2], faqs, MODEL) == "Within 5 days."
+    first, retry = client.requests
+    assert faqs[0]["question"] in _context(first)
+    assert _points(retry) == 0 and faqs[0]["question"] not in _context(retry)
+    qna._ask_model("How long does shipping take?", faqs[1:2], faqs, MODEL)
+    assert len(client.requests) == 3 and _points(client.requests[2]) == 0
+
+def test_ask_places_no_cache_point():
+    client = FakeClient()
+    assert bedrock_client.ask(MODEL, "Summarize.", "Some text.", 100, client=client) == "Within 5 days."
+    assert len(client.requests) == 1 and client.requests[0]["system"] == [{"text": "Summarize."}]
@@ -0,0 +1,184 @@
+import io, json, os
+
+import pytest
+from botocore.exceptions import ClientError
+
+import answer_cache, faq_index, qna, tenant_cache
+
+FAQS = [{"question": "How do I reset my password?", "answer": "Use the reset link."},
+        {"question": "How much does the Pro plan cost?", "answer": "$20 per user per month."},
+        {"question": "How long does shipping take?", "answer": "3-5 business days."}]
+
+class S3:
+    """The fake S3 client qna gets, with helpers to publish a FAQ; `calls` counts reads per
+    (operation, key) and `downloads` records each download's local path."""
+
+    def __init__(self, backend):
+        self.backend, self.client, self.downloads = backend, backend.client("s3"), []
+        self.calls = backend.object_calls
+
+    def put(self, key, body, metadata=None):
+        self.backend.store(qna.FAQ_BUCKET, key, body, metadata)
+
+    def put_faqs(self, faqs, artifact=True):
+        raw = json.dumps(faqs).encode("utf-8")
+        digest = faq_index.source_digest(raw)
+        if artifact:
+            out = io.BytesIO()
+            faq_index.write_artifact(out, faqs, digest)
+            self.put(faq_index.index_key(qna.FAQ_KEY), out.getvalue())
+        self.put(qna.FAQ_KEY, raw, {"sha256": digest})
+
+    def download_file(self, Bucket, Key, Filename):
+        self.downloads.append(Filename)
+        return self.client.download_file(Bucket, Key, Filename)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+@pytest.fixture
+def s3(monkeypatch, backend):
+    fake = S3(backend)
+    monkeypatch.setattr(qna, "s3", fake)
+    monkeypatch.setattr(qna, "_FAQ_TENANTS", tenant_cache.TenantCache(2 ** 30, qna._evicted))
+    monkeypatch.setattr(qna, "_ANSWER_CACHE", answer_cache.AnswerCache(16, 60))
+    monkeypatch.setattr(qna, "FAQ_REFRESH_SECONDS", 1e-9)  # every request checks the ETag
+    return fake
+
+def test_unchanged_etag_keeps_the_snapshot(s3):
+    s3.put_faqs(FAQS, artifact=False)
+    first = qna._load_faqs()
+    assert first == FAQS
+    checks = s3.calls["HeadObject", qna.FAQ_KEY]
+    assert qna._load_faqs() is first and qna._load_faqs() is first
+    assert s3.calls["HeadObject", qna.FAQ_KEY] == checks + 2
+    assert s3.calls["GetObject", qna.FAQ_KEY] == 1
+
+def test_new_etag_swaps_in_new_entries_and_keeps_the_previous_index(s3):
+    s3.put_faqs(FAQS, artifact=False)
+    old = qna._load_faqs()
+    edited = FAQS[:2] + [{"question": "Do you ship abroad?", "answer": "Yes, to 40 countries."}]
+    s3.put_faqs(edited, artifact=False)
+    new = qna._load_faqs()
+    assert new == edited
+    # a request that read the old entries before the swap still finds their index
+    assert qna._get_index(old)["faqs"] is old
+    assert qna._get_index(new)["faqs"] is new
+    assert qna._retrieve(new, "ship abroad", k=1) == [edited[2]]
+
+    s3.put_faqs(FAQS, artifact=False)
+    assert qna._load_faqs() == FAQS
+    assert id(old) not in qna._INDEXES  # retired after a second reload
+
+def test_not_rechecked_before_the_refresh_interval(s3, monkeypatch):
+    s3.put_faqs(FAQS, artifact=False)
+    monkeypatch.setattr(qna, "FAQ_REFRESH_SECONDS", 3600)
+    first = qna._load_faqs()
+    s3.put_faqs(FAQS[:1], artifact=False)
+    assert qna._load_faqs() is first
+    assert s3.calls["HeadObject", qna.FAQ_KEY] == 1
+
+def test_failed_freshness_check_keeps_the_loaded_snapshot(s3, monkeypatch):
+    s3.put_faqs(FAQS, artifact=False)
+    first = qna._load_faqs()
+
+    def head_object(**kwargs):
+        raise ClientError({"Error": {"Code": "SlowDown"}}, "HeadObject")
+    monkeypatch.setattr(s3.client, "head_object", head_object)
+    assert qna._load_faqs() is first
+
+def test_reload_from_the_index_artifact(s3):
+    s3.put_faqs(FAQS)
+    assert list(qna._load_faqs()) == FAQS
+    s3.put_faqs(FAQS[::-1])
+    assert list(qna._load_faqs()) == FAQS[::-1]
+    assert s3.calls["GetObject", qna.FAQ_KEY] == 0  # entries came from the artifact both times
+    assert qna._retrieve(qna._load_faqs(), "reset password", k=1) == [FAQS[0]]
+
+def test_stale_artifact_falls_back_to_json(s3):
+    s3.put_faqs(FAQS)
+    stale = s3.backend.get(qna.FAQ_BUCKET, faq_index.index_key(qna.FAQ_KEY))
+    s3.put_faqs(FAQS[:2], artifact=False)
+    s3.backend.objects[qna.FAQ_BUCKET, faq_index.index_key(qna.FAQ_KEY)] = stale  # built from the previous faq.json
+    assert qna._load_faqs() == FAQS[:2]
+    assert s3.calls["GetObject", qna.FAQ_KEY] == 1
+
+def test_answers_cached_before_a_reload_are_not_served_after_it(s3):
+    s3.put_faqs(FAQS, artifact=False)
+    question = "What does the Pro plan cost for a team of five?"
+    plan = qna._plan(question)
+    assert plan["route"]["tier"] != "direct" and not plan["cached"]
+    qna._ANSWER_CACHE.put(plan["key"], {"answer": "$100 per month."})
+    assert qna._plan(question)["answer"] == "$100 per month."
+
+    s3.put_faqs([dict(FAQS[0]), {"question": FAQS[1]["question"], "answer": "$25 per user per month."}, FAQS[2]],
+                artifact=False)
+    replanned = qna._plan(question)
+    assert not replanned["cached"] and "answer" not in replanned
+
+@pytest.mark.parametrize("dropped", ["reloaded_twice", "evicted"])
+def test_a_request_keeps_its_index_after_the_snapshot_is_dropped(s3, monkeypatch, dropped):
+    s3.put_faqs(FAQS, artifact=False)
+    question = "What does the Pro plan cost for a team of five?"
+    plan = qna._plan(question)
+    if dropped == "reloaded_twice":
+        for faqs in (FAQS[::-1], FAQS[1:]):
+            s3.put_faqs(faqs, artifact=False)
+            qna._load_faqs()
+    else:
+        qna._FAQ_TENANTS.budget = 1
+        qna._FAQ_TENANTS.get("acme", lambda: qna._first_load(""))
+    assert id(plan["faqs"]) not in qna._INDEXES
+
+    builds = []
+    monkeypatch.setattr(qna, "_build_index", lambda *a, **kw: builds.append(a))
+    monkeypatch.setattr(qna, "_ask_model", lambda q, top, faqs, model, priority, history, index:
+                        "$100 per month." if index is plan["index"] else "wrong index")
+    assert qna._answer(question, plan) == "$100 per month."
+    assert qna._build_converse(question, plan["top"], plan["faqs"], "test.model-v1:0", index=plan["index"])
+    assert not builds
+    assert plan["key"] is not None and qna._ANSWER_CACHE.get(plan["key"]) == {"answer": "$100 per month."}
+
+def test_entries_no_snapshot_holds_are_not_cached_under_a_version(s3):
+    faqs = [dict(it) for it in FAQS]
+    plan = qna._plan("What does the Pro plan cost for a team of five?", faqs=faqs)
+    assert "version" not in plan["index"] and plan["key"] is None
+
+def test_each_load_maps_its_own_download(s3):
+    s3.put_faqs(FAQS)
+    first = qna._load_faqs()
+    s3.put_faqs(FAQS[::-1])
+    second = qna._load_faqs()
+    qna._FAQ_TENANTS.get("acme", lambda: qna._first_load(""))  # another snapshot of the same key
+    assert len(set(s3.downloads)) == len(s3.downloads) == 3
+    # the files are gone, so an eviction cannot pull one from under a concurrent load ...
+    assert not any(os.path.exists(path) for path in s3.downloads)
+    # ... and the mappings still serve the entries
+    assert list(first) == FAQS and list(second) == FAQS[::-1]
+
+def test_dense_vectors_are_used_only_with_the_faq_they_were_built_from(s3, monkeypatch):
+    np = pytest.importorskip("numpy")
+    import dense
+    monkeypatch.setattr(qna, "RANKER", "dense")
+
+    def put_vectors(faqs):
+        out = io.BytesIO()
+        np.save(out, np.ones((2, len(faqs), 4), dtype=np.float32))
+        digest = faq_index.source_digest(json.dumps(faqs).encode("utf-8"))
+        s3.put(dense.vectors_key(qna.FAQ_KEY), out.getvalue(), {"sha256": digest})
+
+    put_vectors(FAQS)
+    s3.put_faqs(FAQS, artifact=False)
+    assert "dense" in qna._get_index(qna._load_faqs())
+    # same number of entries, new text: the old vectors still have the right shape
+    edited = [dict(it, answer=it["answer"] + " (updated)") for it in FAQS]
+    s3.put_faqs(edited, artifact=False)
+    assert "dense" not in qna._get_index(qna._load_faqs())
+    put_vectors(edited)
+    s3.put_faqs(edited[::-1])  # reload through the artifact; the vectors' entry order is stale too
+    assert "dense" not in qna._get_index(qna._load_faqs())
+    put_vectors(edited[::-1])
+    s3.put_faqs(FAQS)
+    qna._load_faqs()
+    s3.put_faqs(edited[::-1])
+    assert "dense" in qna._get_index(qna._load_faqs())
@@ -0,0 +1,64 @@
+import json, os
+
+import numpy as np
+import pytest
+
+import dense, qna
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "faq.json")
+# each matches something in data/faq.json, but none of them is answered by it
+OFF_TOPIC = ["do you have a mobile app", "how do i get help", "is there a discount for students"]
+
+@pytest.fixture
+def faqs():
+    with open(DATA) as f:
+        return json.load(f)
+
+def _plan(monkeypatch, faqs, ranker, question, direct="", fast="", fallback=False):
+    monkeypatch.setattr(qna, "RANKER", ranker)
+    monkeypatch.setattr(qna, "ROUTE_DIRECT_SCORE", direct)
+    monkeypatch.setattr(qna, "ROUTE_FAST_SCORE", fast)
+    if ranker == "dense" and not fallback:
+        rng = np.random.default_rng(0)
+        vectors = dense._normalized(rng.normal(size=(2 * len(faqs), 16))).reshape(2, len(faqs), 16)
+        index = {"faqs": faqs, "dense": dense.DenseIndex(vectors.astype(np.float32))}
+        # a query embeds like the FAQ question it names, else like none of them
+        by_question = {it["question"]: vectors[0, i] for i, it in enumerate(faqs)}
+        monkeypatch.setattr(qna, "_embed_query", lambda qs: np.stack(
+            [by_question.get(q, np.full(16, 0.25, dtype=np.float32)) for q in qs]))
+    elif ranker == "dense":
+        index = {"faqs": faqs, "lexical": qna.faq_index.LexicalIndex.build(faqs)}  # vectors missing
+    else:
+        index = qna._build_index(faqs)
+    monkeypatch.setitem(qna._INDEXES, id(faqs), index)
+    return qna._plan(question, faqs=faqs)
+
+def test_jaccard_defaults_answer_an_exact_match_directly(monkeypatch, faqs):
+    plan = _plan(monkeypatch, faqs, "jaccard", "How do I reset my password?")
+    assert plan["route"]["tier"] == "direct" and plan["answer"] == faqs[3]["answer"]
+    assert _plan(monkeypatch, faqs, "jaccard", "what is the meaning of life")["route"]["tier"] == "full"
+
+@pytest.mark.parametrize("ranker", ["bm25", "dense"])
+@pytest.mark.parametrize("question", OFF_TOPIC + ["How do I reset my password?"])
+def test_bm25_and_dense_always_ask_a_model_by_default(monkeypatch, faqs, ranker, question):
+    plan = _plan(monkeypatch, faqs, ranker, question)
+    assert plan["route"]["tier"] == "full" and "answer" not in plan
+
+def test_bm25_scores_are_not_on_the_jaccard_scale(monkeypatch, faqs):
+    # why the jaccard defaults cannot carry over: off-topic questions outscore 0.8
+    plan = _plan(monkeypatch, faqs, "bm25", OFF_TOPIC[0])
+    assert plan["route"]["score"] > 0.8
+
+@pytest.mark.parametrize("ranker, direct, fast", [("bm25", "5", "3"), ("dense", "1.0", "0.8")])
+def test_explicit_thresholds_turn_the_tiers_on(monkeypatch, faqs, ranker, direct, fast):
+    exact = _plan(monkeypatch, faqs, ranker, "How do I reset my password?", direct, fast)
+    assert exact["route"]["tier"] == "direct" and exact["answer"] == faqs[3]["answer"]
+    for question in OFF_TOPIC:
+        assert _plan(monkeypatch, faqs, ranker, question, direct, fast)["route"]["tier"] != "direct"
+
+def test_dense_fallback_routes_on_the_jaccard_defaults(monkeypatch, faqs):
+    # thresholds set for dense scores do not apply to the lexical index it fell back to
+    plan = _plan(monkeypatch, faqs, "dense", "How do I reset my password?", "5", "5", fallback=True)
+    assert plan["route"]["tier"] == "direct"
+    plan = _plan(monkeypatch, faqs, "dense", "do you have a mobile app", "0.01", "0.01", fallback=True)
+    assert plan["route"]["tier"] != "direct"
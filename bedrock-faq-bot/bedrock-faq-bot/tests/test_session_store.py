@@ -0,0 +1,126 @@
+import json, time
+
+import boto3
+import pytest
+from botocore.stub import ANY, Stubber
+
+import session_store
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def _state(*questions):
+    state = session_store.new_state()
+    for q in questions:
+        session_store.add_turn(state, q, f"answer to {q}", q, 100)
+    return state
+
+def test_dict_store_versions_and_conflicts():
+    store = session_store.DictStore()
+    assert store.get("s") == (None, 0)
+    store.put("s", _state("a"), 0, 60)
+    state, version = store.get("s")
+    assert version == 1 and state["turns"][0]["q"] == "a"
+    with pytest.raises(session_store.Conflict):
+        store.put("s", _state("b"), 0, 60)  # written since version 0 was read
+    store.put("s", _state("a", "b"), 1, 60)
+    assert store.get("s")[1] == 2
+
+def test_dict_store_expires_and_bounds_sessions():
+    clock = Clock()
+    store = session_store.DictStore(max_items=3, clock=clock)
+    store.put("old", _state("a"), 0, 10)
+    clock.now += 11
+    assert store.get("old") == (None, 0)
+    store.put("old", _state("b"), 0, 10)  # an expired session starts over at version 0
+    for key in ("x", "y", "z"):
+        store.put(key, _state(key), 0, 60)
+    assert store.get("old") == (None, 0)  # least recently written beyond max_items
+    assert len(store.items) == 3
+
+def test_dict_store_drops_expired_sessions_on_put():
+    clock = Clock()
+    store = session_store.DictStore(clock=clock)
+    for i in range(100):
+        store.put(f"s{i}", _state("q"), 0, 10)
+    clock.now += 11
+    store.put("new", _state("q"), 0, 10)
+    assert list(store.items) == ["new"]
+
+@pytest.fixture
+def dynamodb():
+    client = boto3.client("dynamodb", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test")
+    with Stubber(client) as stub:
+        yield session_store.DynamoDBStore("sessions", client), stub
+        stub.assert_no_pending_responses()
+
+def _item(state, version, expires_at):
+    return {"k": {"S": "s"}, "v": {"S": json.dumps(state)}, "n": {"N": str(version)}, "expires_at": {"N": str(expires_at)}}
+
+def test_dynamodb_store_reads_consistently(dynamodb):
+    store, stub = dynamodb
+    key = {"TableName": "sessions", "Key": {"k": {"S": "s"}}, "ConsistentRead": True}
+    stub.add_response("get_item", {"Item": _item(_state("a"), 3, int(time.time()) + 60)}, key)
+    stub.add_response("get_item", {"Item": _item(_state("a"), 3, int(time.time()) - 1)}, key)
+    stub.add_response("get_item", {}, key)
+    assert store.get("s") == (_state("a"), 3)
+    assert store.get("s") == (None, 3)  # expired but not yet deleted: keep its version for the next put
+    assert store.get("s") == (None, 0)
+
+def test_dynamodb_store_conditional_put(dynamodb):
+    store, stub = dynamodb
+    expected = {"TableName": "sessions", "Item": ANY, "ConditionExpression": "attribute_not_exists(k) OR n = :n",
+                "ExpressionAttributeValues": {":n": {"N": "3"}}}
+    stub.add_response("put_item", {}, expected)
+    stub.add_client_error("put_item", "ConditionalCheckFailedException", expected_params=expected)
+    store.put("s", _state("a"), 3, 60)
+    with pytest.raises(session_store.Conflict):
+        store.put("s", _state("a"), 3, 60)
+
+def test_compact_keeps_recent_turns_within_the_budget():
+    state, folded = session_store.new_state(), []
+
+    def summarize(summary, turns):
+        folded.append([t["q"] for t in turns])
+        return session_store.fold_text(summary, turns, 50)
+
+    for i in range(40):
+        session_store.add_turn(state, f"question {i} " + "about shipping " * 5, "answer " * 200, f"q{i}", 60)
+        session_store.compact(state, 6, 400, summarize)
+        assert len(state["turns"]) <= 6 and session_store.history_tokens(state) <= 400
+    assert state["n"] == 40 and state["turns"][-1]["q"].startswith("question 39 ")
+    assert folded and all(folded)  # each fold removes at least one turn ...
+    assert sum(len(f) for f in folded) + len(state["turns"]) == 40  # ... and none is lost or folded twice
+    assert "question 39" not in state["summary"] and "Asked: question" in state["summary"]
+
+def test_compact_noop_within_limits():
+    state = _state("a", "b")
+    assert session_store.compact(state, 6, 1000, lambda s, t: pytest.fail("summarized")) is False
+    assert [t["q"] for t in state["turns"]] == ["a", "b"]
+
+def test_compact_folds_to_half_the_window():
+    state = _state(*"abcdefg")
+    assert session_store.compact(state, 6, 10000, lambda s, t: "|".join(x["q"] for x in t)) is True
+    assert state["summary"] == "a|b|c|d" and [t["q"] for t in state["turns"]] == ["e", "f", "g"]
+
+def test_long_answers_are_clipped_and_summaries_keep_the_newest_questions():
+    state = session_store.new_state()
+    session_store.add_turn(state, "q", "x" * 1000, "q", 10)
+    assert len(state["turns"][0]["a"]) <= 10 * session_store.CHARS_PER_TOKEN + 4
+    text = session_store.fold_text("", [{"q": f"question {i}"} for i in range(50)], 20)
+    assert len(text) <= 20 * session_store.CHARS_PER_TOKEN + 4 and text.endswith("Asked: question 49")
+
+def test_concurrent_turns_of_one_session_are_merged(monkeypatch):
+    import qna
+    monkeypatch.setattr(qna, "_SESSIONS", session_store.DictStore())
+    first, _ = qna._session({"session_id": "session-1"}, "acme")
+    second, _ = qna._session({"session_id": "session-1"}, "acme")  # read before the first is saved
+    qna._remember(first, "How much is Pro?", "How much is Pro?", "$20")
+    qna._remember(second, "Is SSO included?", "Is SSO included?", "No")
+    state, version = qna._SESSIONS.get("acme/session-1")
+    assert version == 2 and [t["q"] for t in state["turns"]] == ["How much is Pro?", "Is SSO included?"]
+    assert qna._SESSIONS.get("session-1") == (None, 0)  # keyed by tenant
@@ -0,0 +1,81 @@
+import threading, time
+
+import pytest
+
+import tenant_cache
+
+class Loads:
+    """load() stand-ins: each returns (tenant, size) after `delay`, or raises `error`."""
+
+    def __init__(self, delay=0.0, error=None):
+        self.delay, self.error, self.calls = delay, error, []
+
+    def __call__(self, tenant, size=10):
+        def load():
+            self.calls.append(tenant)
+            time.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+            return tenant, size
+        return load
+
+def _concurrently(n, fn):
+    results, errors = [None] * n, [None] * n
+
+    def run(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            errors[i] = e
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+def test_concurrent_misses_load_a_tenant_once():
+    cache, loads = tenant_cache.TenantCache(1000), Loads(delay=0.05)
+    results, errors = _concurrently(8, lambda: cache.get("acme", loads("acme")))
+    assert loads.calls == ["acme"] and results == ["acme"] * 8 and errors == [None] * 8
+    stats = cache.stats()
+    assert stats["misses"] == 1 and stats["waits"] + stats["hits"] == 7
+
+def test_a_failed_load_reaches_every_waiter_and_is_not_cached():
+    cache, loads = tenant_cache.TenantCache(1000), Loads(delay=0.05, error=RuntimeError("NoSuchKey"))
+    results, errors = _concurrently(4, lambda: cache.get("acme", loads("acme")))
+    assert loads.calls == ["acme"] and all(isinstance(e, RuntimeError) for e in errors)
+    assert cache.stats()["errors"] == 1
+    loads.error = None
+    assert cache.get("acme", loads("acme")) == "acme" and loads.calls == ["acme", "acme"]
+
+def test_least_recently_used_tenants_are_evicted_over_the_budget():
+    evicted = []
+    cache, loads = tenant_cache.TenantCache(25, lambda tenant, value: evicted.append(tenant)), Loads()
+    cache.get("a", loads("a"))
+    cache.get("b", loads("b"))
+    cache.get("a", loads("a"))  # b is now the least recently used
+    cache.get("c", loads("c"))
+    assert evicted == ["b"] and cache.bytes == 20
+    assert cache.get("b", loads("b")) == "b" and loads.calls == ["a", "b", "c", "b"]
+
+def test_a_tenant_larger_than_the_budget_is_still_served_alone():
+    evicted = []
+    cache, loads = tenant_cache.TenantCache(25, lambda tenant, value: evicted.append(tenant)), Loads()
+    cache.get("a", loads("a"))
+    assert cache.get("huge", loads("huge", size=100)) == "huge"
+    assert evicted == ["a"] and cache.stats()["tenants"] == 1
+
+def test_resize_evicts_others_to_fit():
+    evicted = []
+    cache, loads = tenant_cache.TenantCache(25, lambda tenant, value: evicted.append(tenant)), Loads()
+    cache.get("a", loads("a"))
+    cache.get("b", loads("b"))
+    cache.resize("a", 20)  # a reload grew it
+    assert evicted == ["b"] and cache.bytes == 20
+    cache.resize("b", 1)  # no longer cached: ignored
+    assert cache.bytes == 20
+
+@pytest.mark.parametrize("value, floor", [("x" * 1000, 1000), (list(range(100)), 800), ({"k": "v" * 500}, 500)])
+def test_approx_bytes_counts_contents(value, floor):
+    assert tenant_cache.approx_bytes(value) >= floor
@@ -0,0 +1,339 @@
+"""
+Retrieval and prompt-building benchmark for lambda/qna.py on synthetic FAQ corpora.
+Usage:
+  python tools/bench_retrieval.py --sizes 100,1000,10000,100000 --out bench.json
+  python tools/bench_retrieval.py --sizes 1000000 --queries 200 --repeat 1 --out bench-1m.json
+  python tools/bench_retrieval.py --sizes 100,1000,10000 --compare bench-main.json --out bench.json
+
+Corpora are generated from a fixed seed: support-style questions built from a domain
+vocabulary plus a Zipf-distributed long tail (product names, error codes) whose size
+grows with the corpus (Heaps' law), so larger corpora have longer posting lists and a
+larger vocabulary, as real ones do. Queries are paraphrases of random entries (words
+dropped, synonyms, filler), plus some that match nothing; the source entry is the
+expected answer.
+
+Per corpus size:
+  load          json.loads of the corpus, LexicalIndex build, artifact write and mapped load,
+                Bm25Index build (with NumPy); peak traced memory of each build
+  retrieval     per-query latency percentiles (us) for each ranker, bm25 batch throughput
+  quality       recall@k and MRR of the source entry, and agreement@k with the reference
+                ranking (a stable sort by qna._score over every entry) on a query sample
+  prompt        _build_prompt / _build_converse latency percentiles (us)
+
+Every timing is the median over --repeat passes. Results are JSON. With --compare,
+timings and memory that grew by more than --threshold, or quality that dropped, are
+listed and the exit status is 1. p99 latencies and build/load times swing more between
+runs of the same code, so they get --tail-threshold and a floor of 1 ms / 5 ms.
+RANKER=dense is not covered: it needs Bedrock embeddings.
+"""
+import argparse, gc, json, os, platform, random, resource, statistics, subprocess, sys, tempfile, time, tracemalloc
+
+os.environ.setdefault("FAQ_BUCKET", "bench")  # qna reads it at import; nothing is fetched
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("METRICS", "off")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "shared"))
+import faq_index, qna
+
+try:
+    import bm25  # needs NumPy
+except ImportError:
+    bm25 = None
+
+_VERBS = {
+    "reset": ["restore", "recover"], "change": ["update", "modify"], "cancel": ["stop", "end"],
+    "download": ["get", "save"], "export": ["download", "extract"], "delete": ["remove", "erase"],
+    "transfer": ["move", "migrate"], "renew": ["extend"], "verify": ["confirm", "validate"],
+    "connect": ["link", "pair"], "share": ["send"], "upgrade": ["improve"], "install": ["set up"],
+    "configure": ["set up", "adjust"], "enable": ["turn on", "activate"], "disable": ["turn off"],
+}
+_NOUNS = ("account password invoice subscription order refund shipment device app card plan profile "
+          "email address report team license backup key token integration workspace calendar "
+          "notification payment receipt voucher warranty contract policy firewall printer router").split()
+_QUALIFIERS = ("on mobile|from the dashboard|for my team|after the trial|in bulk|without losing data|"
+               "on a new device|for another user|before renewal|during checkout").split("|")
+_COMMON = ("the a to and of you your is in for it on can be with this that we are if or by not at from "
+           "will our have please use any when all more may then also only as new need after before").split()
+_FILLER = ["please", "quickly", "help", "can", "i", "how", "do", "what", "is", "the", "way"]
+_TEMPLATES = ["How do I {verb} my {noun} {qual}?", "Can I {verb} the {noun} {qual}?",
+              "What happens when I {verb} my {noun}?", "Why can't I {verb} my {noun} {qual}?",
+              "Is it possible to {verb} a {noun} {qual}?", "Where do I {verb} {noun} settings?"]
+_SYLLABLES = ["ka", "zen", "tri", "lo", "mar", "vex", "qui", "dor", "ne", "sol", "pix", "ra", "tum", "bel", "gor", "fi"]
+
+def _tail_vocab(rng, size):
+    words, seen = [], set()
+    while len(words) < size:
+        w = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if rng.random() < 0.15:
+            w += str(rng.randint(1, 999))  # model numbers, error codes
+        if w not in seen:
+            seen.add(w)
+            words.append(w)
+    return words
+
+def make_corpus(n, seed=7):
+    """n FAQ entries with a Zipf long tail of about 20 * tokens**0.55 words (Heaps' law)."""
+    rng = random.Random(seed)
+    tail = _tail_vocab(rng, max(200, int(20 * (n * 45) ** 0.55)))
+    cum, total = [], 0.0
+    for rank in range(1, len(tail) + 1):
+        total += 1.0 / rank ** 1.07
+        cum.append(total)
+    draw = lambda k: rng.choices(tail, cum_weights=cum, k=k)
+    verbs = list(_VERBS)
+    faqs = []
+    for _ in range(n):
+        verb, noun = rng.choice(verbs), rng.choice(_NOUNS)
+        names = draw(rng.randint(1, 3))
+        question = rng.choice(_TEMPLATES).format(verb=verb, noun=f"{names[0]} {noun}", qual=rng.choice(_QUALIFIERS))
+        if len(names) > 1:
+            question = question[:-1] + f" with {' '.join(names[1:])}?"
+        body = []
+        for _ in range(rng.randint(15, 60)):
+            r = rng.random()
+            body.append(rng.choice(_COMMON) if r < 0.55 else rng.choice(_NOUNS + verbs) if r < 0.8 else draw(1)[0])
+        answer = f"To {verb} your {noun}, " + " ".join(body) + "."
+        faqs.append({"question": question, "answer": answer})
+    return faqs
+
+def make_queries(faqs, count, seed=11, unmatched=0.1):
+    """[(query, expected entry id or None)]: paraphrased entry questions plus unmatched noise."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(count):
+        if rng.random() < unmatched:
+            out.append((" ".join(rng.choice(_SYLLABLES) * 3 for _ in range(3)), None))
+            continue
+        i = rng.randrange(len(faqs))
+        words = faq_index.tokenize(faqs[i]["question"])
+        kept = [w for w in words if rng.random() > 0.3] or words[:2]
+        kept = [rng.choice(_VERBS[w]) if w in _VERBS and rng.random() < 0.3 else w for w in kept]
+        kept += rng.sample(_FILLER, rng.randint(0, 2))
+        rng.shuffle(kept)
+        out.append((" ".join(kept), i))
+    return out
+
+def _percentiles(samples_us):
+    s = sorted(samples_us)
+    pick = lambda q: round(s[min(len(s) - 1, int(q * len(s)))], 2)
+    return {"p50_us": pick(0.50), "p90_us": pick(0.90), "p99_us": pick(0.99), "max_us": round(s[-1], 2),
+            "mean_us": round(statistics.fmean(s), 2)}
+
+def _latency(fn, inputs, repeat=1):
+    """Percentiles of fn(*args) over inputs; with repeat > 1 each statistic is the median
+    over the passes, which damps scheduler and frequency noise. Also returns the last results."""
+    passes = []
+    for _ in range(max(1, repeat)):
+        samples, results = [], []
+        for args in inputs:
+            started = time.perf_counter()
+            results.append(fn(*args))
+            samples.append((time.perf_counter() - started) * 1e6)
+        passes.append(_percentiles(samples))
+    return {key: round(statistics.median(p[key] for p in passes), 2) for key in passes[0]}, results
+
+def _timed(fn, repeat=1):
+    """fn() and its median wall time in ms over `repeat` runs."""
+    times = []
+    for _ in range(max(1, repeat)):
+        gc.collect()
+        started = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return result, round(statistics.median(times), 2)
+
+def _peak_mb(fn):
+    """Peak traced allocation while fn runs (a separate pass: tracing slows the timed runs)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+    finally:
+        tracemalloc.stop()
+
+def _quality(ranked, queries, k):
+    hits, rr, n = 0, 0.0, 0
+    for ids, (_, target) in zip(ranked, queries):
+        if target is None:
+            continue
+        n += 1
+        if target in ids[:k]:
+            hits += 1
+            rr += 1.0 / (ids.index(target) + 1)
+    return {f"recall_at_{k}": round(hits / n, 4) if n else None, "mrr": round(rr / n, 4) if n else None}
+
+def _reference_top_k(faqs, query, k):
+    """qna's reference ranking: every entry scored with qna._score, stable sort."""
+    tokens = qna._normalize(query)
+    scored = sorted(((qna._score(tokens, it), i) for i, it in enumerate(faqs)), key=lambda x: -x[0])
+    return [i for _, i in scored[:k]]
+
+def _agreement(ranked, reference, k):
+    return round(statistics.fmean(len(set(a[:k]) & set(b)) / k for a, b in zip(ranked, reference)), 4)
+
+def bench_size(n, args):
+    faqs = make_corpus(n, args.seed)
+    raw = json.dumps(faqs).encode("utf-8")
+    queries = make_queries(faqs, args.queries, args.seed + 1)
+    k = args.k
+    res = {"entries": n, "corpus_bytes": len(raw), "queries": len(queries)}
+
+    # load and index build
+    load = {}
+    parsed, load["json_parse_ms"] = _timed(lambda: json.loads(raw), args.repeat)
+    del parsed
+    lexical, load["lexical_build_ms"] = _timed(lambda: faq_index.LexicalIndex.build(faqs), args.repeat)
+    load["vocabulary"] = len(lexical.token_ids)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "faq.index.bin")
+        def write():
+            with open(path, "wb") as f:
+                faq_index.write_artifact(f, faqs, faq_index.source_digest(raw))
+        _, load["artifact_write_ms"] = _timed(write, args.repeat)
+        load["artifact_bytes"] = os.path.getsize(path)
+        mapped, load["artifact_load_ms"] = _timed(lambda: faq_index.load_artifact(path), args.repeat)
+        del mapped
+    if args.memory:
+        load["json_parse_peak_mb"] = _peak_mb(lambda: json.loads(raw))
+        load["lexical_build_peak_mb"] = _peak_mb(lambda: faq_index.LexicalIndex.build(faqs))
+    bm = None
+    if bm25 is not None:
+        build = lambda: bm25.Bm25Index([qna._tokenize(it["question"]) for it in faqs],
+                                       [qna._tokenize(it["answer"]) for it in faqs])
+        bm, load["bm25_build_ms"] = _timed(build, args.repeat)
+        if args.memory:
+            load["bm25_build_peak_mb"] = _peak_mb(build)
+    res["load"] = load
+
+    # retrieval latency and quality
+    rankers = {"jaccard": lambda q: [i for i, _ in lexical.top_k(qna._normalize(q), k, with_scores=True)]}
+    if bm is not None:
+        rankers["bm25"] = lambda q: [i for i, _ in bm.top_k([qna._tokenize(q)], k)[0]]
+    reference = None
+    sample = [q for q, _ in queries[:args.reference_queries]]
+    if n <= args.reference_max:
+        reference = [_reference_top_k(faqs, q, k) for q in sample]
+    res["retrieval"] = {}
+    for name, rank in rankers.items():
+        rank(queries[0][0])  # warm-up
+        out, ranked = _latency(rank, [(q,) for q, _ in queries], args.repeat)
+        out.update(_quality(ranked, queries, k))
+        out[f"agreement_at_{k}"] = _agreement(ranked, reference, k) if reference else None
+        res["retrieval"][name] = out
+    if bm is not None:
+        tokens = [qna._tokenize(q) for q, _ in queries]
+        _, ms = _timed(lambda: bm.top_k(tokens, k), args.repeat)
+        res["retrieval"]["bm25"]["batch_queries_per_s"] = round(len(tokens) / (ms / 1000), 1) if ms else None
+
+    # prompt build on the retrieved entries
+    qna._INDEXES[id(faqs)] = {"faqs": faqs, "lexical": lexical}  # so _build_converse finds the snapshot's index
+    res["prompt"] = {}
+    tops = [[faqs[i] for i in rankers["jaccard"](q)] for q, _ in queries]
+    for name, build in (("invoke", lambda q, top: qna._build_prompt(q, top)),
+                        ("converse", lambda q, top: qna._build_converse(q, top, faqs, qna.BEDROCK_MODEL_ID))):
+        res["prompt"][name] = _latency(build, [(q, top) for (q, _), top in zip(queries, tops)], args.repeat)[0]
+    qna._INDEXES.pop(id(faqs), None)
+    return res
+
+def _flatten(obj, prefix=""):
+    out = {}
+    for key, value in obj.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = value
+    return out
+
+_LOWER_IS_BETTER = ("_ms", "_us", "_mb", "_bytes")
+_NOISE_FLOOR = {"_ms": 5.0, "_us": 20.0, "_mb": 0.5, "_bytes": 0}  # smaller absolute changes are ignored
+_TAIL_FLOOR_US = 1000.0  # p99 of a sub-millisecond call moves by hundreds of us between identical runs
+_HIGHER_IS_BETTER = ("recall_at_", "mrr", "agreement_at_", "batch_queries_per_s")
+
+def _tolerance(leaf, threshold, tail_threshold):
+    """(growth factor, absolute floor) a lower-is-better metric may move by unflagged."""
+    unit = next(u for u in _LOWER_IS_BETTER if leaf.endswith(u))
+    if leaf.startswith("p99_"):
+        return tail_threshold, _TAIL_FLOOR_US
+    if unit == "_ms":  # builds and loads: one GC pause or page-cache miss shows up here
+        return tail_threshold, _NOISE_FLOOR[unit]
+    return threshold, _NOISE_FLOOR[unit]
+
+def compare(old, new, threshold, tail_threshold=1.5):
+    """Lines describing regressions of `new` against `old` (matched by corpus size)."""
+    before = {r["entries"]: _flatten(r) for r in old["results"]}
+    problems = []
+    for result in new["results"]:
+        prev = before.get(result["entries"])
+        if prev is None:
+            continue
+        for key, value in _flatten(result).items():
+            was = prev.get(key)
+            if was is None:
+                continue
+            leaf = key.rsplit(".", 1)[-1]
+            if leaf.startswith("max_"):
+                continue  # a single sample; too noisy to gate on
+            if leaf.endswith(_LOWER_IS_BETTER):
+                factor, floor = _tolerance(leaf, threshold, tail_threshold)
+                if was > 0 and value > was * factor and value - was > floor:
+                    problems.append(f"{result['entries']:>8} {key}: {was} -> {value} ({value / was:.2f}x)")
+            elif leaf.startswith(_HIGHER_IS_BETTER):
+                # throughput gets the same tolerance as timings; quality may not drop
+                worse = value * threshold < was if leaf.endswith("_per_s") else value < was - 0.01
+                if worse:
+                    problems.append(f"{result['entries']:>8} {key}: {was} -> {value}")
+    return problems
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="100,1000,10000,100000", help="Comma-separated corpus sizes (up to 1000000)")
+    ap.add_argument("--queries", type=int, default=1000, help="Queries per corpus size")
+    ap.add_argument("--k", type=int, default=5, help="Top-k, as qna retrieves")
+    ap.add_argument("--repeat", type=int, default=5, help="Passes per measurement (median of); 1 for quick large runs")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--reference-queries", type=int, default=50, help="Queries checked against the brute-force reference")
+    ap.add_argument("--reference-max", type=int, default=100000, help="Skip the reference above this many entries")
+    ap.add_argument("--no-memory", dest="memory", action="store_false", help="Skip the traced-memory passes")
+    ap.add_argument("--out", default=None, help="Write JSON here (default: stdout)")
+    ap.add_argument("--compare", default=None, help="Earlier results to check for regressions")
+    ap.add_argument("--threshold", type=float, default=1.25, help="Allowed slowdown/growth factor for --compare")
+    ap.add_argument("--tail-threshold", type=float, default=1.5, help="Same, for p99 latencies and build/load times")
+    args = ap.parse_args()
+
+    report = {"meta": {"commit": _git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+                       "ranker_bm25": bm25 is not None, "seed": args.seed, "k": args.k, "repeat": args.repeat,
+                       "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())},
+              "results": []}
+    for n in (int(s) for s in args.sizes.split(",") if s.strip()):
+        started = time.perf_counter()
+        report["results"].append(bench_size(n, args))
+        print(f"{n} entries: {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    report["meta"]["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            problems = compare(json.load(f), report, args.threshold, args.tail_threshold)
+        for line in problems:
+            print("REGRESSION", line, file=sys.stderr)
+        if problems:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Offline retrieval evaluation: rank logged questions against a FAQ with qna's rankers.
+Usage:
+  python tools/eval_retrieval.py --questions logged.jsonl
+  python tools/eval_retrieval.py --questions logged.jsonl --rankers bm25 --k 3 --out eval.json
+
+--questions holds one question per line: JSON with "question" and, where known,
+"expected" (the FAQ question that answers it), or plain text (nothing expected).
+Questions go through qna._retrieve_batch --batch at a time, so bm25 scores each batch
+with one sparse matrix product; jaccard ranks them one by one, as it does when serving.
+
+Per ranker: index build and retrieval time, questions per second, and recall@k and MRR
+of the expected entry over the questions that name one found in the FAQ. Expected
+entries missing from the FAQ are counted separately. With --out, every question's
+top-k FAQ questions are written too. RANKER=dense is not covered: it needs Bedrock
+embeddings.
+"""
+import argparse, json, os, sys, time
+
+os.environ.setdefault("FAQ_BUCKET", "eval")  # qna reads it at import; nothing is fetched
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("METRICS", "off")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "shared"))
+import qna
+
+def read_questions(path):
+    """[(question, expected FAQ question or None)] from a JSON-lines or plain-text file."""
+    logged = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                rec = json.loads(line)
+                logged.append((rec["question"], rec.get("expected")))
+            else:
+                logged.append((line, None))
+    return logged
+
+def evaluate(faqs, logged, ranker, k=5, batch=1000):
+    """Rank every logged question with one ranker; returns (summary, top-k FAQ questions)."""
+    saved, qna.RANKER = qna.RANKER, ranker
+    try:
+        started = time.perf_counter()
+        index = qna._build_index(faqs)
+        build_s = time.perf_counter() - started
+        qna._INDEXES[id(faqs)] = index  # so _retrieve_batch finds it, as it finds a loaded snapshot's
+        started = time.perf_counter()
+        ranked = []
+        for start in range(0, len(logged), batch):
+            top = qna._retrieve_batch(faqs, [q for q, _ in logged[start:start + batch]], k)
+            ranked.extend([it.get("question") for it in row] for row in top)
+        seconds = time.perf_counter() - started
+    finally:
+        qna._INDEXES.pop(id(faqs), None)
+        qna.RANKER = saved
+
+    known = {it.get("question") for it in faqs}
+    hits, rr, judged, unknown = 0, 0.0, 0, 0
+    for (_, expected), top in zip(logged, ranked):
+        if expected is None:
+            continue
+        if expected not in known:
+            unknown += 1
+            continue
+        judged += 1
+        if expected in top:
+            hits += 1
+            rr += 1.0 / (top.index(expected) + 1)
+    summary = {"build_s": round(build_s, 3), "seconds": round(seconds, 3),
+               "questions_per_s": round(len(logged) / seconds, 1) if seconds else None,
+               "judged": judged, "expected_not_in_faq": unknown,
+               f"recall_at_{k}": round(hits / judged, 4) if judged else None,
+               "mrr": round(rr / judged, 4) if judged else None}
+    return summary, ranked
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--questions", required=True, help="Logged questions, JSON lines or plain text")
+    ap.add_argument("--file", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "faq.json"),
+                    help="Local path to FAQ JSON")
+    ap.add_argument("--rankers", default="jaccard,bm25", help="Comma-separated: jaccard, bm25 (needs NumPy)")
+    ap.add_argument("--k", type=int, default=5, help="Top-k, as qna retrieves")
+    ap.add_argument("--batch", type=int, default=1000, help="Questions per _retrieve_batch call")
+    ap.add_argument("--out", default=None, help="Also write each question's top-k here (JSON)")
+    args = ap.parse_args()
+
+    with open(args.file) as f:
+        faqs = json.load(f)
+    logged = read_questions(args.questions)
+    report = {"faqs": len(faqs), "questions": len(logged), "k": args.k, "rankers": {}}
+    ranked = {}
+    for ranker in (r.strip() for r in args.rankers.split(",") if r.strip()):
+        report["rankers"][ranker], ranked[ranker] = evaluate(faqs, logged, ranker, args.k, args.batch)
+        print(f"{ranker}: {report['rankers'][ranker]['seconds']}s", file=sys.stderr)
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        rows = [{"question": q, "expected": e, **{r: top[n] for r, top in ranked.items()}}
+                for n, (q, e) in enumerate(logged)]
+        with open(args.out, "w") as f:
+            json.dump(dict(report, ranked=rows), f, indent=2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
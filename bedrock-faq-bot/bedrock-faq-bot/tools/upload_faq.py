@@ -2,18 +2,65 @@
 Helper: Upload the local data/faq.json to your Terraform-created S3 bucket.
 Usage:
   python tools/upload_faq.py --bucket <bucket-name> [--key data/faq.json]
+  python tools/upload_faq.py --bucket <bucket-name> --embed-model amazon.titan-embed-text-v2:0
+
+Alongside the JSON it publishes <key stem>.index.bin, a prebuilt lexical index the
+Lambda maps at cold start instead of parsing and tokenizing faq.json. faq.json is
+uploaded with its sha256 as object metadata so the Lambda can tell a stale index.
+
+With --embed-model, question/answer embeddings are computed once here and uploaded
+next to the FAQ as <key stem>.vectors.npy for RANKER=dense (requires NumPy), tagged with
+the same sha256 so the Lambda ignores vectors left from another version of the FAQ.
 """
-import argparse, json, boto3, os, sys
+import argparse, json, boto3, os, sys, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+import faq_index
+
+def upload_vectors(s3, faqs, bucket, key, digest, embed_model, region=None):
+    import numpy as np
+    import dense
+    bedrock = boto3.client("bedrock-runtime", region_name=region)
+    vectors = dense.build_vectors(
+        lambda texts: dense.embed_texts(bedrock, embed_model, texts, input_type="search_document"), faqs)
+    vec_key = dense.vectors_key(key)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "vectors.npy")
+        np.save(path, vectors)
+        s3.upload_file(path, bucket, vec_key, ExtraArgs={"Metadata": {"sha256": digest}})
+    print(f"Uploaded {vectors.shape} vectors ({embed_model}) -> s3://{bucket}/{vec_key}")
+
+def upload_index(s3, faqs, bucket, key, digest):
+    idx_key = faq_index.index_key(key)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.bin")
+        with open(path, "wb") as f:
+            faq_index.write_artifact(f, faqs, digest)
+        size = os.path.getsize(path)
+        s3.upload_file(path, bucket, idx_key)
+    print(f"Uploaded index v{faq_index.VERSION} ({size} bytes) -> s3://{bucket}/{idx_key}")
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--bucket", required=True, help="FAQ S3 bucket name")
     ap.add_argument("--key", default="data/faq.json", help="Object key")
     ap.add_argument("--file", default="../data/faq.json", help="Local path to FAQ JSON")
+    ap.add_argument("--embed-model", default=None, help="Bedrock embedding model for RANKER=dense (must match the Lambda's EMBED_MODEL_ID)")
+    ap.add_argument("--region", default=None, help="Region for the Bedrock embedding calls")
     args = ap.parse_args()
 
+    with open(args.file, "rb") as f:
+        raw = f.read()
+    faqs = json.loads(raw.decode("utf-8"))
+    digest = faq_index.source_digest(raw)
+
     s3 = boto3.client("s3")
-    s3.upload_file(args.file, args.bucket, args.key)
+    # derived artifacts go up first; until faq.json (and its sha256) is replaced,
+    # Lambdas see the new index as stale and keep parsing the old JSON
+    upload_index(s3, faqs, args.bucket, args.key, digest)
+    if args.embed_model:
+        upload_vectors(s3, faqs, args.bucket, args.key, digest, args.embed_model, args.region)
+    s3.upload_file(args.file, args.bucket, args.key, ExtraArgs={"Metadata": {"sha256": digest}})
     print(f"Uploaded {args.file} -> s3://{args.bucket}/{args.key}")
 
 if __name__ == "__main__":
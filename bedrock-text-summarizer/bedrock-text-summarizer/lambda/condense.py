@@ -0,0 +1,205 @@
+"""
+Extractive pre-condensation ahead of Bedrock summarization (needs NumPy, e.g. a layer).
+
+1. Boilerplate: lines near the top or bottom of many pages once digits are masked
+   (running headers and footers, "Page 3 of 40"), bare page numbers and
+   table-of-contents leader lines are dropped.
+2. Sentences are scored by TF-IDF centrality, the cosine similarity of each sentence to
+   the document centroid, computed with NumPy over a sparse (sentence, term) layout, so
+   there is no sentences x sentences matrix.
+3. The highest-scoring sentences are kept, in document order and on their original
+   pages, until the token budget is filled.
+
+Pages are read once up to the budget, and documents within it are returned unchanged.
+Longer ones are scored in passes over `reread()`, a fresh iterable of the same pages
+(e.g. from the page store), so memory holds the vocabulary and the kept sentences rather
+than the document; without `reread` the pages are kept in a list.
+"""
+import heapq, math, re, time
+from collections import Counter
+from itertools import chain
+
+import numpy as np
+
+from mapreduce import estimate_tokens
+
+_DIGITS = re.compile(r"\d+")
+_SPACE = re.compile(r"\s+")
+_PAGE_NUMBER = re.compile(r"^(page\s*)?[-–\s]*\d+(\s*(of|/)\s*\d+)?[-–\s]*$", re.I)
+_TOC_LINE = re.compile(r"(\.{4,}|(\s?\.){4,})\s*\d+\s*$")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+_WORD = re.compile(r"[a-z0-9]+")
+_STOP = frozenset(
+    "a an and are as at be been but by for from had has have he her his i if in into is it its "
+    "not of on or our she that the their them they this to was we were which will with you".split())
+
+_EDGE_LINES = 3  # headers and footers are looked for this many lines from a page's top and bottom
+
+def _line_key(line):
+    return _SPACE.sub(" ", _DIGITS.sub("#", line.strip().lower()))
+
+def _edge_keys(page):
+    lines = [s for s in (line.strip() for line in page.split("\n")) if s]
+    return {_line_key(s) for s in lines[:_EDGE_LINES] + lines[-_EDGE_LINES:]}
+
+def _repeated(seen, n_pages, min_pages, min_fraction):
+    threshold = max(min_pages, math.ceil(min_fraction * n_pages))
+    return {k for k, n in seen.items() if n >= threshold}
+
+def _strip(page, repeated):
+    """(page without boilerplate lines, number of lines dropped)"""
+    kept, dropped = [], 0
+    for line in page.split("\n"):
+        s = line.strip()
+        if s and (_line_key(s) in repeated or _PAGE_NUMBER.match(s) or _TOC_LINE.search(s)):
+            dropped += 1
+            continue
+        kept.append(line)
+    return "\n".join(kept), dropped
+
+def strip_boilerplate(pages, min_pages=3, min_fraction=0.3):
+    """Drop lines found near the top or bottom of at least max(min_pages, min_fraction of
+    all pages) pages, page numbers and TOC lines. Returns (pages, number of lines dropped)."""
+    seen = Counter()
+    for page in pages:
+        seen.update(_edge_keys(page))
+    repeated = _repeated(seen, len(pages), min_pages, min_fraction)
+    out, dropped = [], 0
+    for page in pages:
+        text, n = _strip(page, repeated)
+        out.append(text)
+        dropped += n
+    return out, dropped
+
+def _sentences(page):
+    return [s for s in _SENTENCE.split(_SPACE.sub(" ", page).strip()) if s]
+
+class _Centrality:
+    """TF-IDF centrality over sentences fed in batches: `count` every batch (document
+    frequencies), then `add` every batch (centroid), then `scores` per batch."""
+
+    def __init__(self):
+        self.vocab, self.df, self.n = {}, Counter(), 0
+        self.centroid = self.unit = None
+
+    def _ids(self, sentences):
+        return [np.fromiter((self.vocab.setdefault(w, len(self.vocab)) for w in _WORD.findall(s.lower())
+                             if w not in _STOP), dtype=np.int64) for s in sentences]
+
+    def count(self, sentences):
+        for ids in self._ids(sentences):
+            self.df.update(set(ids.tolist()))
+        self.n += len(sentences)
+
+    def _weights(self, sentences):
+        """Sparse L2-normalized TF-IDF rows as (row, term, weight) arrays."""
+        ids = self._ids(sentences)
+        v = len(self.vocab)
+        rows = np.repeat(np.arange(len(ids)), [len(x) for x in ids])
+        if not len(rows):
+            return rows, rows, np.zeros(0)
+        pairs, tf = np.unique(rows * v + np.concatenate(ids), return_counts=True)
+        r, c = pairs // v, pairs % v
+        w = (1.0 + np.log(tf)) * self.idf[c]
+        norms = np.sqrt(np.bincount(r, weights=w * w, minlength=len(ids)))
+        w /= np.where(norms > 0, norms, 1.0)[r]
+        return r, c, w
+
+    def add(self, sentences):
+        if self.centroid is None:
+            df = np.zeros(len(self.vocab))
+            df[list(self.df)] = list(self.df.values())
+            self.idf = np.log((1.0 + self.n) / (1.0 + df)) + 1.0
+            self.centroid = np.zeros(len(self.vocab))
+        _, c, w = self._weights(sentences)
+        self.centroid += np.bincount(c, weights=w, minlength=len(self.vocab))
+
+    def scores(self, sentences):
+        if not self.vocab:
+            return np.zeros(len(sentences))
+        if self.unit is None:
+            self.unit = self.centroid / (np.linalg.norm(self.centroid) or 1.0)
+        r, c, w = self._weights(sentences)
+        return np.bincount(r, weights=w * self.unit[c], minlength=len(sentences))
+
+def score_sentences(sentences):
+    """TF-IDF centrality per sentence (cosine similarity to the normalized centroid)."""
+    scorer = _Centrality()
+    scorer.count(sentences)
+    scorer.add(sentences)
+    return scorer.scores(sentences)
+
+def condense(pages, token_budget, min_pages=3, min_fraction=0.3, reread=None):
+    """Returns (pages, stats); stats has the token estimates before and after and the ratio.
+    `pages` may be an iterator; it is read once, and `reread()` gives the pages again for
+    each later pass (only called when the document is over the budget)."""
+    started = time.perf_counter()
+    pages, head, tokens_in = iter(pages), [], 0
+    for page in pages:
+        head.append(page)
+        tokens_in += estimate_tokens(page)
+        if tokens_in > token_budget:
+            break
+    else:
+        return head, {"pages": len(head), "tokens_in": tokens_in, "tokens_out": tokens_in, "ratio": 1.0,
+                      "boilerplate_lines": 0, "sentences": 0, "kept_sentences": 0,
+                      "seconds": round(time.perf_counter() - started, 3)}
+
+    if reread is None:
+        held = head  # nothing to read the pages again from: hold them
+        held.extend(pages)
+        reread, pages = (lambda: held), ()
+    # pass 1, the rest of the first read: page count, tokens and header/footer candidates
+    seen, n_pages, tokens_in = Counter(), 0, 0
+    for page in chain(head, pages):
+        seen.update(_edge_keys(page))
+        n_pages += 1
+        tokens_in += estimate_tokens(page)
+    head = None
+    repeated = _repeated(seen, n_pages, min_pages, min_fraction)
+
+    def stripped():
+        """(page number, sentences, lines dropped) per boilerplate-free page, read again"""
+        for i, page in enumerate(reread()):
+            text, dropped = _strip(page, repeated)
+            yield i, _sentences(text), dropped
+
+    # pass 2: document frequencies and the total cost
+    scorer, cost, dropped = _Centrality(), 0, 0
+    for _, sentences, n in stripped():
+        scorer.count(sentences)
+        cost += sum(estimate_tokens(s) + 1 for s in sentences)
+        dropped += n
+
+    # passes 3 and 4: centroid, then the best sentences within the budget (a min-heap of
+    # the kept set, dropping the lowest score, the later sentence on ties, when over)
+    kept, kept_cost, index = [], 0, 0
+    if cost > token_budget:
+        for _, sentences, _ in stripped():
+            scorer.add(sentences)
+    for page_no, sentences, _ in stripped():
+        scores = scorer.scores(sentences) if cost > token_budget else np.zeros(len(sentences))
+        for sentence, score in zip(sentences, scores):
+            heapq.heappush(kept, (float(score), -index, page_no, sentence))
+            kept_cost += estimate_tokens(sentence) + 1
+            index += 1
+            while kept_cost > token_budget:
+                _, _, _, dropped_sentence = heapq.heappop(kept)
+                kept_cost -= estimate_tokens(dropped_sentence) + 1
+
+    out = [[] for _ in range(n_pages)]
+    for _, _, page_no, sentence in sorted(kept, key=lambda x: -x[1]):
+        out[page_no].append(sentence)
+    out = [" ".join(p) for p in out]
+    tokens_out = sum(estimate_tokens(p) for p in out)
+    return out, {"pages": n_pages, "tokens_in": tokens_in, "tokens_out": tokens_out,
+                 "ratio": round(tokens_out / tokens_in, 4), "boilerplate_lines": dropped,
+                 "sentences": index, "kept_sentences": len(kept),
+                 "seconds": round(time.perf_counter() - started, 3)}
+
+def time_saved(stats, summarize_seconds):
+    """Estimated summarization time saved, assuming it scales with input tokens."""
+    if stats["tokens_out"] <= 0:
+        return 0.0
+    removed = stats["tokens_in"] - stats["tokens_out"]
+    return round(summarize_seconds * removed / stats["tokens_out"] - stats["seconds"], 3)
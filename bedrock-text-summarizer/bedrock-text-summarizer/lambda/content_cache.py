@@ -0,0 +1,53 @@
+"""
+Content-addressed results shared by the summarizer Lambdas. Finished outputs are
+indexed in the output bucket by the sha256 of their input (PDF bytes or request text):
+
+    by-hash/<sha256>/extracted.txt             Textract text (PDFs only)
+    by-hash/<sha256>/<model id>.summary.txt    summary produced by that model
+
+Entries are copies of finished outputs and never change, so a hit can be copied or
+returned as is. Delete the by-hash/ prefix to drop them.
+"""
+import hashlib, re
+from botocore.exceptions import ClientError
+
+PREFIX = "by-hash/"
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+def is_digest(value) -> bool:
+    return isinstance(value, str) and bool(_DIGEST.match(value))
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def sha256_object(s3, bucket, key, chunk_size=1024 * 1024) -> str:
+    """Hash an S3 object by streaming its body."""
+    h = hashlib.sha256()
+    for chunk in s3.get_object(Bucket=bucket, Key=key)["Body"].iter_chunks(chunk_size):
+        h.update(chunk)
+    return h.hexdigest()
+
+def sha256_file(path, chunk_size=1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def text_key(digest: str) -> str:
+    return f"{PREFIX}{digest}/extracted.txt"
+
+def summary_key(digest: str, model_id: str) -> str:
+    return f"{PREFIX}{digest}/{model_id.replace('/', '_')}.summary.txt"
+
+def exists(s3, bucket, key) -> bool:
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    return True
+
+def copy(s3, bucket, src, dst):
+    s3.copy_object(Bucket=bucket, Key=dst, CopySource={"Bucket": bucket, "Key": src})
@@ -0,0 +1,128 @@
+"""
+Map-reduce summarization shared by the summarizer Lambdas.
+
+Text is split into chunks of at most `chunk_tokens` (estimated), cutting on page
+breaks ("\\f") first, then paragraphs, lines and finally words. Chunks are summarized
+on a bounded thread pool; partial summaries are combined by a reduce call, in groups
+when they do not fit one call, until a single summary is left. A text that fits in
+one chunk is summarized with a single call.
+
+Input can also be an iterable of pages (e.g. straight from Textract): chunks are cut
+and submitted as pages arrive, and reading stops while the pool is saturated, so only
+the chunks in flight are held in memory.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import chain
+
+CHARS_PER_TOKEN = 4  # rough estimate for English prose; keeps chunks well under model limits
+_SEPARATORS = ["\f", "\n\n", "\n", " "]
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def split_chunks(text: str, chunk_tokens: int):
+    """Greedily pack pieces of `text` into chunks of at most `chunk_tokens`, preferring the
+    coarsest boundary that fits. Chunk order follows the text."""
+    return list(iter_chunks(text.split("\f"), chunk_tokens))
+
+def iter_chunks(pages, chunk_tokens: int):
+    """Chunks from an iterable of page texts; consecutive pages share a chunk (joined by
+    form feeds) while they fit, oversized pages are cut on paragraphs, lines, words."""
+    limit = max(1, chunk_tokens) * CHARS_PER_TOKEN
+    current = ""
+    for page in pages:
+        page = page.strip()
+        if not page:
+            continue
+        for piece in _pack(page, limit, 1):
+            if not current:
+                current = piece
+            elif len(current) + 1 + len(piece) <= limit:
+                current += "\f" + piece
+            else:
+                yield current
+                current = piece
+    if current:
+        yield current
+
+def _pack(text, limit, level):
+    if len(text) <= limit:
+        return [text]
+    if level == len(_SEPARATORS):
+        return [text[i:i + limit] for i in range(0, len(text), limit)]
+    sep = _SEPARATORS[level]
+    chunks, current = [], ""
+    for piece in text.split(sep):
+        if len(piece) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.extend(_pack(piece, limit, level + 1))
+        elif not current:
+            current = piece
+        elif len(current) + len(sep) + len(piece) <= limit:
+            current += sep + piece
+        else:
+            chunks.append(current)
+            current = piece
+    if current:
+        chunks.append(current)
+    return [c for c in (c.strip() for c in chunks) if c]
+
+def map_reduce(source, summarize, combine, chunk_tokens=4000, workers=4, executor=None):
+    """source: a string or an iterable of page texts.
+    summarize(chunk, part) -> partial summary, with part=None when the whole text is one
+    chunk; combine(list of summaries) -> summary. Both are called from worker threads,
+    `source` is consumed on the calling thread. Returns (summary, stats)."""
+    pages = source.split("\f") if isinstance(source, str) else source
+    chunks = iter_chunks(pages, chunk_tokens)
+    stats = {"chunks": 0, "reduce_levels": 0}
+    first = next(chunks, None)
+    if first is None:
+        return "", stats
+    second = next(chunks, None)
+    if second is None:
+        stats["chunks"] = 1
+        return summarize(first, None), stats
+
+    own = executor is None
+    pool = executor or ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        futures, pending = [], set()
+        for part, chunk in enumerate(chain([first, second], chunks), 1):
+            f = pool.submit(summarize, chunk, part)
+            futures.append(f)
+            pending.add(f)
+            # backpressure: don't pull more pages than the pool can work on
+            if len(pending) >= 2 * max(1, workers):
+                _, pending = wait(pending, return_when=FIRST_COMPLETED)
+        stats["chunks"] = len(futures)
+        parts = [f.result() for f in futures]
+        while len(parts) > 1:
+            stats["reduce_levels"] += 1
+            groups = _group(parts, chunk_tokens)
+            if len(groups) == 1:
+                parts = [combine(groups[0])]
+            else:
+                parts = list(pool.map(combine, groups))
+        return parts[0], stats
+    finally:
+        if own:
+            pool.shutdown(wait=False)
+
+def _group(parts, chunk_tokens):
+    """Consecutive groups whose joined size fits one reduce call (at least two per group
+    so every level shrinks the list)."""
+    groups, current, size = [], [], 0
+    for p in parts:
+        n = estimate_tokens(p)
+        if len(current) >= 2 and size + n > chunk_tokens:
+            groups.append(current)
+            current, size = [], 0
+        current.append(p)
+        size += n
+    if len(current) == 1 and groups:
+        groups[-1].append(current[0])
+    elif current:
+        groups.append(current)
+    return groups
@@ -0,0 +1,63 @@
+"""
+Page-partitioned store of extraction results, so a document can be re-summarized, or a
+page range read, without re-running Textract.
+
+    pages/<base>.pages        one gzip member per page: {"page": n, "lines": [...]} with
+                              each LINE's Text, Confidence and BoundingBox
+    pages/<base>.index.json   {"version", "pages": [[page, offset, length], ...], ...}
+
+Members are written in page order, so any page range is one contiguous S3 range GET.
+"""
+import gzip, json
+
+VERSION = 1
+
+def data_key(base: str) -> str:
+    return f"pages/{base}.pages"
+
+def index_key(base: str) -> str:
+    return f"pages/{base}.index.json"
+
+def compact_line(block) -> dict:
+    """The parts of a Textract LINE block worth keeping."""
+    line = {"Text": block.get("Text", "")}
+    if "Confidence" in block:
+        line["Confidence"] = round(block["Confidence"], 2)
+    box = block.get("Geometry", {}).get("BoundingBox")
+    if box:
+        line["BoundingBox"] = {k: round(v, 5) for k, v in box.items()}
+    return line
+
+def page_text(page) -> str:
+    return "\n".join(line.get("Text", "") for line in page["lines"])
+
+class PageStoreWriter:
+    """Appends compressed pages to `out` (anything with write(bytes)) and builds the index."""
+
+    def __init__(self, out, **meta):
+        self.out = out
+        self.meta = meta
+        self.offset = 0
+        self.pages = []
+
+    def add(self, page_number: int, lines):
+        blob = gzip.compress(json.dumps({"page": page_number, "lines": lines},
+                                        separators=(",", ":")).encode("utf-8"), mtime=0)
+        self.out.write(blob)
+        self.pages.append([page_number, self.offset, len(blob)])
+        self.offset += len(blob)
+
+    def index(self) -> dict:
+        return dict(self.meta, version=VERSION, pages=self.pages, size=self.offset)
+
+def read_pages(s3, bucket, key, index, first=None, last=None):
+    """Yield the stored pages numbered first..last (inclusive; None = open end), streamed
+    from a single ranged GET."""
+    entries = [p for p in index["pages"]
+               if (first is None or p[0] >= first) and (last is None or p[0] <= last)]
+    if not entries:
+        return
+    start, end = entries[0][1], entries[-1][1] + entries[-1][2] - 1
+    body = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")["Body"]
+    for _, _, length in entries:
+        yield json.loads(gzip.decompress(body.read(length)))
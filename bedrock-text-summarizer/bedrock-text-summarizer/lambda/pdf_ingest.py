@@ -1,26 +1,79 @@
-import json, os, logging, boto3, urllib.parse
+"""
+PDF ingest Lambda: runs on each PDF uploaded to INPUT_BUCKET and starts its extraction.
+
+With OUTPUT_BUCKET set the upload is hashed; when content_cache already holds its text
+and a summary from BEDROCK_MODEL_ID, those are copied to extracted/ and summaries/ and
+nothing else runs. Otherwise the sha256 travels on as the Textract JobTag.
+
+With pypdf available (the pdf_layers layer) and TEXT_LAYER=on, a PDF within
+LOCAL_PDF_MAX_MB is opened locally. If its text layer covers every page but at most
+TEXT_LAYER_MAX_OCR_PAGES (pages under TEXT_LAYER_MIN_CHARS characters, OCR'd with
+DetectDocumentText), the text goes to extracted/ and the document is queued on QUEUE_URL
+for textract_postprocess to summarize, with no async Textract job. Scanned documents,
+larger files and anything pypdf cannot parse go to Textract; output keys are the same
+on both paths.
+
+A PDF over SPLIT_PAGES pages is cut into parts under parts/ in the input bucket, with a
+manifest under manifests/ in the output bucket, and each part gets its own Textract
+job; textract_postprocess assembles them. Parts and manifests expire after 7 days. The
+manifest id is derived from the upload, so a retried ingest finds the manifest it wrote and
+starts no second job for a part (Textract returns the first one for the same request token).
+"""
+import hashlib, json, os, logging, boto3, tempfile, urllib.parse, uuid
+
+import content_cache, metrics
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 s3 = boto3.client("s3")
 textract = boto3.client("textract")
+sqs = boto3.client("sqs")
 
 SNS_TOPIC_ARN = os.environ["SNS_TOPIC_ARN"]
 TEXTRACT_ROLE_ARN = os.environ["TEXTRACT_ROLE_ARN"]
 INPUT_BUCKET = os.environ["INPUT_BUCKET"]
+OUTPUT_BUCKET = os.environ.get("OUTPUT_BUCKET", "")  # empty = no content-hash dedup
+BEDROCK_MODEL_ID = os.environ.get("BEDROCK_MODEL_ID", "anthropic.claude-3-sonnet-20240229-v1:0")
+# Text-layer fast path: born-digital PDFs are extracted here (pypdf) and handed straight to
+# the postprocess queue; needs OUTPUT_BUCKET and QUEUE_URL, falls back to Textract otherwise.
+TEXT_LAYER = os.environ.get("TEXT_LAYER", "on") == "on"
+QUEUE_URL = os.environ.get("QUEUE_URL", "")
+TEXT_LAYER_MIN_CHARS = int(os.environ.get("TEXT_LAYER_MIN_CHARS", "32"))  # fewer = scanned page
+TEXT_LAYER_MAX_OCR_PAGES = int(os.environ.get("TEXT_LAYER_MAX_OCR_PAGES", "5"))  # OCR'd synchronously; more = async Textract
+# Fan-out: PDFs with more than SPLIT_PAGES pages become parts of SPLIT_PAGES pages, one
+# Textract job each; postprocess assembles them in page order. 0 = one job per PDF.
+SPLIT_PAGES = int(os.environ.get("SPLIT_PAGES", "200"))
+# pypdf reads the whole file into memory and the function has 1024 MB and 120 s for the
+# download, hash, parse and part uploads; larger PDFs go to Textract unparsed
+LOCAL_PDF_MAX_MB = float(os.environ.get("LOCAL_PDF_MAX_MB", "100"))
 
-def lambda_handler(event, context):
-    # Triggered by S3:ObjectCreated event
-    logger.info("Event: %s", json.dumps(event))
-    for rec in event.get("Records", []):
-        bucket = rec["s3"]["bucket"]["name"]
-        key = urllib.parse.unquote_plus(rec["s3"]["object"]["key"])
-        if not key.lower().endswith(".pdf"):
-            logger.info("Skipping non-PDF key: %s", key)
-            continue
+def _reuse_results(digest: str, key: str) -> bool:
+    """Copy earlier results for identical content into this document's output keys."""
+    cached_summary = content_cache.summary_key(digest, BEDROCK_MODEL_ID)
+    cached_text = content_cache.text_key(digest)
+    if not (content_cache.exists(s3, OUTPUT_BUCKET, cached_summary)
+            and content_cache.exists(s3, OUTPUT_BUCKET, cached_text)):
+        return False
+    base = key.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    content_cache.copy(s3, OUTPUT_BUCKET, cached_text, f"extracted/{base}.txt")
+    content_cache.copy(s3, OUTPUT_BUCKET, cached_summary, f"summaries/{base}.summary.txt")
+    return True
+
+def _open_pdf(path: str, key: str):
+    try:
+        import pdf_text  # needs pypdf (Lambda layer)
+    except ImportError:
+        logger.warning("pypdf not available; text-layer fast path and fan-out disabled")
+        return None
+    try:
+        return pdf_text.open_pdf(path)
+    except Exception:
+        logger.exception("Could not parse %s locally; using Textract", key)
+        return None
 
-        # Start async text detection for PDFs
+def _start_textract(bucket: str, key: str, job_tag=None, token=None) -> str:
+    with metrics.timed("textract_start"):
         resp = textract.start_document_text_detection(
             DocumentLocation={
                 "S3Object": {"Bucket": bucket, "Name": key}
@@ -29,8 +82,125 @@ def lambda_handler(event, context):
                 "SNSTopicArn": SNS_TOPIC_ARN,
                 "RoleArn": TEXTRACT_ROLE_ARN,
             },
-            JobTag=key  # so downstream knows which object
+            **({"JobTag": job_tag} if job_tag else {}),
+            **({"ClientRequestToken": token} if token else {})
         )
-        logger.info("Started Textract JobId=%s for %s", resp["JobId"], key)
+    return resp["JobId"]
+
+def _text_layer(reader, bucket: str, key: str, digest) -> bool:
+    """Extract a PDF with a text layer locally and enqueue it for summarization.
+    False when the PDF should go through Textract instead."""
+    import pdf_text
+    try:
+        with metrics.timed("text_layer"):
+            texts, ocr_pages = pdf_text.extract_pages(reader, TEXT_LAYER_MIN_CHARS, TEXT_LAYER_MAX_OCR_PAGES)
+        if not texts or len(ocr_pages) > TEXT_LAYER_MAX_OCR_PAGES:
+            return False
+        # a few image-only pages (figures, a scanned signature page): synchronous OCR
+        for i in ocr_pages:
+            with metrics.timed("textract_sync_page"):
+                resp = textract.detect_document_text(Document={"Bytes": pdf_text.page_pdf(reader, i)})
+            texts[i] = "\n".join(b.get("Text", "") for b in resp.get("Blocks", []) if b.get("BlockType") == "LINE")
+
+        base = key.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+        raw_key = f"extracted/{base}.txt"
+        with metrics.timed("s3_write"):
+            s3.put_object(Bucket=OUTPUT_BUCKET, Key=raw_key, Body="\f".join(texts).encode("utf-8"))
+        # same shape as a Textract completion message, plus where the text already is
+        sqs.send_message(QueueUrl=QUEUE_URL, MessageBody=json.dumps({
+            "JobId": f"text-layer-{digest or uuid.uuid4().hex}",
+            "Status": "SUCCEEDED",
+            "API": "TextLayer",
+            "JobTag": digest,
+            "ExtractedKey": raw_key,
+            "DocumentLocation": {"S3ObjectName": key, "S3Bucket": bucket},
+        }))
+    except Exception:
+        logger.exception("Text-layer extraction failed for %s; using Textract", key)
+        return False
+    logger.info("Extracted %s from its text layer (%d pages, %d OCR'd)", key, len(texts), len(ocr_pages))
+    return True
+
+def _manifest_id(bucket: str, key: str, digest, etag) -> str:
+    """32 hex digits that stay the same when the same upload is ingested again."""
+    return hashlib.sha256(f"{bucket}/{key}:{digest or etag}".encode("utf-8")).hexdigest()[:32]
+
+def _fan_out(reader, bucket: str, key: str, digest, etag=""):
+    """Split a large PDF into page-range parts and start one Textract job per part.
+    The manifest is written after the parts and before any job starts, so every completion
+    can find it; a retry that finds it reuses its parts."""
+    import pdf_text
+    manifest_id = _manifest_id(bucket, key, digest, etag)
+    manifest_key = f"manifests/{manifest_id}.json"
+    total = len(reader.pages)
+    if content_cache.exists(s3, OUTPUT_BUCKET, manifest_key):
+        manifest = json.loads(s3.get_object(Bucket=OUTPUT_BUCKET, Key=manifest_key)["Body"].read())
+        logger.info("Manifest %s already written for %s; resuming", manifest_id, key)
+    else:
+        parts = []
+        for index, first in enumerate(range(0, total, SPLIT_PAGES)):
+            last = min(first + SPLIT_PAGES, total)
+            part_key = f"parts/{manifest_id}/part-{index:04d}.pdf"
+            body = pdf_text.page_range_pdf(reader, first, last)
+            with metrics.timed("s3_write"):
+                s3.put_object(Bucket=bucket, Key=part_key, Body=body)
+            parts.append({"key": part_key, "first_page": first + 1, "last_page": last})
+        manifest = {"id": manifest_id, "bucket": bucket, "key": key, "digest": digest,
+                    "pages": total, "parts": parts}
+        s3.put_object(Bucket=OUTPUT_BUCKET, Key=manifest_key, Body=json.dumps(manifest).encode("utf-8"))
+    started = 0
+    for index, part in enumerate(manifest["parts"]):
+        if content_cache.exists(s3, OUTPUT_BUCKET, f"manifests/{manifest_id}/part-{index:04d}.index.json"):
+            continue  # extracted by an earlier run
+        # JobTag allows 64 chars of [a-zA-Z0-9_.:-]; postprocess parses it back. The same
+        # ClientRequestToken gets the job already started for it instead of a new one.
+        tag = f"part-{manifest_id}-{index:04d}"
+        _start_textract(bucket, part["key"], tag, token=tag)
+        started += 1
+    logger.info("Split %s (%d pages) into %d parts, %d Textract jobs started, manifest %s",
+                key, total, len(manifest["parts"]), started, manifest_id)
+
+@metrics.invocation
+def lambda_handler(event, context):
+    # Triggered by S3:ObjectCreated event
+    logger.info("Event: %s", json.dumps(event))
+    for rec in event.get("Records", []):
+        bucket = rec["s3"]["bucket"]["name"]
+        key = urllib.parse.unquote_plus(rec["s3"]["object"]["key"])
+        if not key.lower().endswith(".pdf"):
+            logger.info("Skipping non-PDF key: %s", key)
+            continue
+
+        digest = path = None
+        try:
+            size_mb = rec["s3"]["object"].get("size", 0) / (1024 * 1024)
+            if OUTPUT_BUCKET and (TEXT_LAYER or SPLIT_PAGES) and size_mb <= LOCAL_PDF_MAX_MB:
+                fd, path = tempfile.mkstemp(suffix=".pdf")
+                os.close(fd)
+                with metrics.timed("s3_download"):
+                    s3.download_file(bucket, key, path)
+                with metrics.timed("hash"):
+                    digest = content_cache.sha256_file(path)
+            elif OUTPUT_BUCKET:
+                with metrics.timed("hash"):
+                    digest = content_cache.sha256_object(s3, bucket, key)
+            if digest and _reuse_results(digest, key):
+                logger.info("Reused results for %s (sha256 %s); Textract skipped", key, digest)
+                continue
+            reader = _open_pdf(path, key) if path else None
+            if reader is not None:
+                if TEXT_LAYER and QUEUE_URL and _text_layer(reader, bucket, key, digest):
+                    continue
+                if SPLIT_PAGES and len(reader.pages) > SPLIT_PAGES:
+                    _fan_out(reader, bucket, key, digest, rec["s3"]["object"].get("eTag", ""))
+                    continue
+        finally:
+            if path:
+                os.remove(path)
+
+        # Start async text detection for PDFs; the content hash tells postprocess where to
+        # index the results (the object key arrives in the notification's DocumentLocation)
+        job_id = _start_textract(bucket, key, digest)
+        logger.info("Started Textract JobId=%s for %s", job_id, key)
 
     return {"statusCode": 200, "body": json.dumps({"ok": True})}
@@ -0,0 +1,42 @@
+"""
+Local text extraction for born-digital PDFs (needs pypdf, e.g. from a Lambda layer).
+
+Pages whose text layer yields fewer than `min_chars` characters are treated as scanned
+or image-only; callers OCR those (or send the whole document to Textract).
+"""
+import io
+from pypdf import PdfReader, PdfWriter
+
+def open_pdf(path):
+    return PdfReader(path)
+
+def extract_pages(reader, min_chars=32, max_ocr_pages=None):
+    """Return (texts, ocr_pages): per-page text and the indexes of pages without a usable
+    text layer (their text entry is ""). Stops after max_ocr_pages + 1 such pages, when the
+    caller will not use the text layer anyway; texts is then incomplete."""
+    texts, ocr_pages = [], []
+    for i, page in enumerate(reader.pages):
+        try:
+            text = page.extract_text() or ""
+        except Exception:
+            text = ""  # broken content stream: let OCR have it
+        if len(text.strip()) < min_chars:
+            ocr_pages.append(i)
+            text = ""
+        texts.append(text)
+        if max_ocr_pages is not None and len(ocr_pages) > max_ocr_pages:
+            break
+    return texts, ocr_pages
+
+def page_pdf(reader, index) -> bytes:
+    """A single page as a standalone PDF (what synchronous Textract accepts)."""
+    return page_range_pdf(reader, index, index + 1)
+
+def page_range_pdf(reader, start, stop) -> bytes:
+    """Pages [start, stop) as a standalone PDF."""
+    writer = PdfWriter()
+    for i in range(start, stop):
+        writer.add_page(reader.pages[i])
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
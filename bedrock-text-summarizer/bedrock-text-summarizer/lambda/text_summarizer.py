@@ -1,37 +1,213 @@
-import json, os, logging, boto3
-from botocore.config import Config
+"""
+Text summarizer Lambda: POST /summarize summarizes pasted text with Bedrock.
+
+Text over SUMMARY_CHUNK_TOKENS is split by mapreduce into chunks, summarized on
+SUMMARY_WORKERS threads and combined, so wall-clock time grows with its length over the
+worker count.
+
+CONDENSE=on trims input over CONDENSE_TOKENS with condense before it is chunked.
+
+API Gateway cuts requests at about 30 s, so text over SYNC_MAX_CHARS, "async": true or
+a "callback_url" (https only) make a job instead: the input and status are stored under
+jobs/<id>/ in JOB_BUCKET, the id goes to the JOB_QUEUE_URL queue, and the request returns
+202. job_handler (the summarize-worker Lambda) does the work; GET /summarize/<job_id>
+returns queued, running, done (with summary) or failed (with error), and the final
+status is POSTed to the callback. SQS retries a job up to JOB_MAX_ATTEMPTS times before
+it is marked failed; a message that cannot even record that ends in the dead-letter
+queue. Text within SYNC_MAX_CHARS is summarized in one call. Job data expires after 7 days.
+
+With SUMMARY_CACHE_BUCKET set, summaries are kept in content_cache by the text's sha256
+and a hit is returned at once with "cached": true.
+"""
+import json, os, logging, boto3, re, time, urllib.request, uuid
+from botocore.exceptions import ClientError
+
+import bedrock_client, content_cache, mapreduce, metrics
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 region = os.environ.get("AWS_REGION", "us-east-1")
-bedrock_runtime = boto3.client("bedrock-runtime", region_name=region, config=Config(retries={"max_attempts": 3}))
 
 BEDROCK_MODEL_ID = os.environ.get("BEDROCK_MODEL_ID", "anthropic.claude-3-sonnet-20240229-v1:0")
 SUMMARIZE_MAX_TOKENS = int(os.environ.get("SUMMARIZE_MAX_TOKENS", "1024"))
+BEDROCK_API = os.environ.get("BEDROCK_API", "converse")  # converse | invoke (legacy invoke_model body)
+SUMMARY_CHUNK_TOKENS = int(os.environ.get("SUMMARY_CHUNK_TOKENS", "4000"))  # longer input is summarized in chunks, then combined
+SUMMARY_WORKERS = int(os.environ.get("SUMMARY_WORKERS", "4"))  # concurrent chunk summaries
+CONDENSE = os.environ.get("CONDENSE", "off") == "on"  # extractive pre-condensation; needs NumPy (Lambda layer)
+CONDENSE_TOKENS = int(os.environ.get("CONDENSE_TOKENS", "12000"))  # input token budget left for Bedrock
+SUMMARY_CACHE_BUCKET = os.environ.get("SUMMARY_CACHE_BUCKET", "")  # content-hash summary cache (the PDF output bucket); empty = off
+JOB_QUEUE_URL = os.environ.get("JOB_QUEUE_URL", "")  # async jobs (job_handler reads this queue); empty = always synchronous
+JOB_BUCKET = os.environ.get("JOB_BUCKET", "")  # jobs/<id>/ input and status
+SYNC_MAX_CHARS = int(os.environ.get("SYNC_MAX_CHARS", "20000"))  # longer text is queued as a job
+# deliveries before a job is marked failed; the queue's maxReceiveCount must be higher, so the
+# delivery after a worker that timed out or was killed still gets to mark it
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+
+s3 = boto3.client("s3")
+sqs = boto3.client("sqs")
+bedrock_client.shared(pool_size=SUMMARY_WORKERS)  # keep-alive pool sized for the chunk workers
+
+SUMMARY_INSTRUCTIONS = "Summarize the following text into bullet points and one concluding paragraph. Be faithful to the source."
+CHUNK_INSTRUCTIONS = "Summarize the following part of a longer document into concise bullet points. Keep names, figures and decisions accurate."
+REDUCE_INSTRUCTIONS = "The following are summaries of consecutive parts of one document. Combine them into bullet points and one concluding paragraph, without mentioning the parts. Be faithful to the source."
+
+_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+def _summarize_once(text: str, instructions: str, label: str) -> str:
+    return bedrock_client.ask(BEDROCK_MODEL_ID, instructions, f"{label}:\n{text}", SUMMARIZE_MAX_TOKENS,
+                              api=BEDROCK_API)
 
 def _summarize(text: str) -> str:
-    prompt = f"Summarize the following text into bullet points and one concluding paragraph. Be faithful to the source.\n\nText:\n{text[:20000]}"
-    body = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "messages": [{"role": "user", "content": [{"type": "text", "text": prompt}]}],
-        "max_tokens": SUMMARIZE_MAX_TOKENS,
-        "temperature": 0.2
-    }
-    resp = bedrock_runtime.invoke_model(
-        modelId=BEDROCK_MODEL_ID,
-        body=json.dumps(body).encode("utf-8"),
-        contentType="application/json",
-        accept="application/json",
-    )
-    payload = json.loads(resp["body"].read())
-    parts = payload.get("content", [])
-    if parts and isinstance(parts, list) and parts[0].get("type") == "text":
-        return parts[0].get("text", "").strip()
-    return payload.get("outputText") or payload.get("generated_text") or json.dumps(payload)
+    def summarize(chunk, part):
+        if part is None:
+            return _summarize_once(chunk, SUMMARY_INSTRUCTIONS, "Text")
+        return _summarize_once(chunk, CHUNK_INSTRUCTIONS, f"Part {part}")
+
+    def combine(parts):
+        return _summarize_once("\n\n".join(parts), REDUCE_INSTRUCTIONS, "Partial summaries")
+
+    chunk_tokens = SUMMARY_CHUNK_TOKENS
+    if len(text) <= SYNC_MAX_CHARS:  # short enough for the synchronous path: one call, not map-reduce
+        chunk_tokens = max(chunk_tokens, mapreduce.estimate_tokens(text))
+
+    condensed = None
+    if CONDENSE:
+        import condense  # needs NumPy (Lambda layer); only loaded when enabled
+        with metrics.timed("condense"):
+            text, condensed = condense.condense(text.split("\f") if isinstance(text, str) else text, CONDENSE_TOKENS)
+
+    started = time.monotonic()
+    with metrics.timed("summarize"):
+        summary, stats = mapreduce.map_reduce(text, summarize, combine,
+                                              chunk_tokens=chunk_tokens, workers=SUMMARY_WORKERS)
+    metrics.count("chunks", stats["chunks"])
+    if stats["chunks"] > 1:
+        logger.info("Summarized %d chunks in %d reduce level(s)", stats["chunks"], stats["reduce_levels"])
+    if condensed and condensed["ratio"] < 1:
+        condensed["est_seconds_saved"] = condense.time_saved(condensed, time.monotonic() - started)
+        logger.info("Condensed input: %s", json.dumps(condensed))
+    return summary
+
+def _cached_summary(digest: str):
+    try:
+        obj = s3.get_object(Bucket=SUMMARY_CACHE_BUCKET, Key=content_cache.summary_key(digest, BEDROCK_MODEL_ID))
+        return obj["Body"].read().decode("utf-8")
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound"):
+            logger.warning("Summary cache read failed: %s", e)  # a cache problem must not fail the request
+        return None
+
+def _store_summary(digest: str, summary: str):
+    try:
+        with metrics.timed("s3_write"):
+            s3.put_object(Bucket=SUMMARY_CACHE_BUCKET, Key=content_cache.summary_key(digest, BEDROCK_MODEL_ID),
+                          Body=summary.encode("utf-8"))
+    except ClientError as e:
+        logger.warning("Summary cache write failed: %s", e)
 
+def _summary_for(text: str):
+    """(summary, cached) for `text`, going through the content-hash cache when enabled."""
+    digest = content_cache.sha256_text(text) if SUMMARY_CACHE_BUCKET else None
+    summary = _cached_summary(digest) if digest else None
+    if summary is not None:
+        metrics.count("summary_cache_hit")
+        return summary, True
+    summary = _summarize(text)
+    if digest:
+        _store_summary(digest, summary)
+    return summary, False
+
+def _response(status_code: int, payload: dict):
+    return {"statusCode": status_code, "headers": {"content-type": "application/json"}, "body": json.dumps(payload)}
+
+def _status_key(job_id: str) -> str:
+    return f"jobs/{job_id}/status.json"
+
+def _input_key(job_id: str) -> str:
+    return f"jobs/{job_id}/input.txt"
+
+def _put_status(job_id: str, status: str, **fields):
+    doc = dict(fields, job_id=job_id, status=status, updated=int(time.time()))
+    with metrics.timed("s3_write"):
+        s3.put_object(Bucket=JOB_BUCKET, Key=_status_key(job_id), Body=json.dumps(doc).encode("utf-8"),
+                      ContentType="application/json")
+    return doc
+
+def _get_status(job_id: str):
+    try:
+        return json.loads(s3.get_object(Bucket=JOB_BUCKET, Key=_status_key(job_id))["Body"].read())
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+def _submit_job(text: str, callback_url: str):
+    job_id = uuid.uuid4().hex
+    with metrics.timed("s3_write"):
+        s3.put_object(Bucket=JOB_BUCKET, Key=_input_key(job_id), Body=text.encode("utf-8"))
+    doc = _put_status(job_id, "queued")
+    sqs.send_message(QueueUrl=JOB_QUEUE_URL, MessageBody=json.dumps({"job_id": job_id, "callback_url": callback_url}))
+    return doc
+
+def _notify(url: str, doc: dict):
+    """POST the final job status to the client's callback; the result stays pollable if this fails."""
+    req = urllib.request.Request(url, data=json.dumps(doc).encode("utf-8"), method="POST",
+                                 headers={"content-type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            resp.read()
+    except Exception as e:
+        logger.warning("Callback for job %s failed: %s", doc["job_id"], e)
+
+def _run_job(job: dict, attempt: int):
+    job_id = job["job_id"]
+    doc = _get_status(job_id) or {}
+    if doc.get("status") in ("done", "failed"):
+        pass  # a redelivered finished job only retries the callback
+    elif attempt > JOB_MAX_ATTEMPTS:
+        # the earlier attempts ended without reaching the handler's except (timeout, crash)
+        logger.error("Job %s abandoned after %d attempts", job_id, attempt - 1)
+        doc = _put_status(job_id, "failed", error=f"Gave up after {attempt - 1} attempts (worker timed out or stopped)")
+    else:
+        _put_status(job_id, "running", attempt=attempt)
+        try:
+            text = s3.get_object(Bucket=JOB_BUCKET, Key=_input_key(job_id))["Body"].read().decode("utf-8")
+            summary, cached = _summary_for(text)
+        except Exception as e:
+            if attempt < JOB_MAX_ATTEMPTS:
+                raise  # redelivered by SQS
+            logger.exception("Job %s failed after %d attempts", job_id, attempt)
+            doc = _put_status(job_id, "failed", error=str(e))
+        else:
+            doc = _put_status(job_id, "done", summary=summary, cached=cached)
+    if job.get("callback_url"):
+        _notify(job["callback_url"], doc)
+
+@metrics.invocation
+def job_handler(event, context):
+    """SQS worker for queued summarization jobs."""
+    failures = []
+    for record in event.get("Records", []):
+        try:
+            _run_job(json.loads(record["body"]), int(record.get("attributes", {}).get("ApproximateReceiveCount", "1")))
+        except Exception:
+            logger.exception("Job message %s failed", record.get("messageId"))
+            failures.append({"itemIdentifier": record["messageId"]})
+    return {"batchItemFailures": failures}
+
+def _job_status(event):
+    job_id = (event.get("pathParameters") or {}).get("job_id", "")
+    doc = _JOB_ID.match(job_id) and JOB_BUCKET and _get_status(job_id)
+    if not doc:
+        return _response(404, {"error": "Unknown job"})
+    return _response(200, doc)
+
+@metrics.invocation
 def lambda_handler(event, context):
     # HTTP API (payload v2.0)
+    if event.get("requestContext", {}).get("http", {}).get("method") == "GET":
+        return _job_status(event)
     body = {}
     if "body" in event and event["body"]:
         body = json.loads(event["body"])
@@ -39,11 +215,20 @@ def lambda_handler(event, context):
         body = event
     text = body.get("text", "")
     if not text:
-        return {"statusCode": 400, "headers": {"content-type": "application/json"}, "body": json.dumps({"error":"Missing 'text' in body"})}
+        return _response(400, {"error": "Missing 'text' in body"})
+    callback_url = body.get("callback_url") or ""
+    if callback_url and not callback_url.startswith("https://"):
+        return _response(400, {"error": "'callback_url' must be an https URL"})
 
-    summary = _summarize(text)
-    return {
-        "statusCode": 200,
-        "headers": {"content-type": "application/json"},
-        "body": json.dumps({"summary": summary})
-    }
+    if JOB_QUEUE_URL and (body.get("async") or callback_url or len(text) > SYNC_MAX_CHARS):
+        digest = content_cache.sha256_text(text) if SUMMARY_CACHE_BUCKET else None
+        summary = _cached_summary(digest) if digest else None
+        if summary is None:
+            return _response(202, _submit_job(text, callback_url))
+        return _response(200, {"summary": summary, "cached": True})
+
+    try:
+        summary, cached = _summary_for(text)
+    except bedrock_client.Unavailable as e:
+        return _response(503, {"error": str(e)})
+    return _response(200, {"summary": summary, "cached": cached})
@@ -1,91 +1,428 @@
-import json, os, logging, boto3, time
+"""
+Textract postprocess Lambda: summarizes each document once its text is extracted.
+
+Records come from the SQS queue behind the Textract SNS topic, up to RECORD_WORKERS at a
+time. Failures are reported per message (ReportBatchItemFailures), so only those are
+redelivered. A summary is stored with its Textract JobId as metadata, and a redelivered
+job whose summary exists is skipped.
+
+Pages are streamed: each one goes to extracted/<name>.txt (S3 multipart, 8 MiB parts)
+and to the mapreduce chunker as it arrives, so memory depends on the chunks in flight,
+not the document length. The summary is written last.
+
+When the JobTag is a sha256, finished results are copied into content_cache.
+
+Parts of a split PDF are kept as page stores under manifests/<id>/ as their jobs finish;
+the run that finishes the last one takes an S3 conditional-write lock (taken over after
+ASSEMBLY_LEASE_SECONDS), joins the parts in page order and summarizes the document.
+
+Every document's pages also go to a page store under pages/. reprocess_handler
+re-summarizes from it without Textract, e.g. after a model or prompt change;
+"first_page"/"last_page" summarize a range on its own.
+"""
+import codecs, json, os, logging, boto3, re, time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from botocore.config import Config
+from botocore.exceptions import ClientError
+
+import bedrock_client, content_cache, mapreduce, metrics, page_store
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-s3 = boto3.client("s3")
-textract = boto3.client("textract")
-
 region = os.environ.get("AWS_REGION", "us-east-1")
-bedrock_runtime = boto3.client("bedrock-runtime", region_name=region, config=Config(retries={"max_attempts": 3}))
 
 OUTPUT_BUCKET = os.environ["OUTPUT_BUCKET"]
 INPUT_BUCKET = os.environ["INPUT_BUCKET"]
 BEDROCK_MODEL_ID = os.environ.get("BEDROCK_MODEL_ID", "anthropic.claude-3-sonnet-20240229-v1:0")
 SUMMARIZE_MAX_TOKENS = int(os.environ.get("SUMMARIZE_MAX_TOKENS", "1024"))
+BEDROCK_API = os.environ.get("BEDROCK_API", "converse")  # converse | invoke (legacy invoke_model body)
+SUMMARY_CHUNK_TOKENS = int(os.environ.get("SUMMARY_CHUNK_TOKENS", "4000"))  # longer input is summarized in chunks, then combined
+SUMMARY_WORKERS = int(os.environ.get("SUMMARY_WORKERS", "4"))  # concurrent chunk summaries
+CONDENSE = os.environ.get("CONDENSE", "off") == "on"  # extractive pre-condensation; needs NumPy (Lambda layer)
+CONDENSE_TOKENS = int(os.environ.get("CONDENSE_TOKENS", "12000"))  # input token budget left for Bedrock
+RECORD_WORKERS = int(os.environ.get("RECORD_WORKERS", "5"))  # SQS records processed concurrently
+# A split PDF's assembly lock older than this is taken over. Records that find it held and no
+# summary yet are retried by SQS, so a run killed mid-assembly is picked up on a redelivery.
+ASSEMBLY_LEASE_SECONDS = int(os.environ.get("ASSEMBLY_LEASE_SECONDS", "900"))
 
-def _get_textract_text(job_id: str) -> str:
-    """Paginate over GetDocumentTextDetection and assemble lines into text."""
+s3 = boto3.client("s3", config=Config(max_pool_connections=max(10, RECORD_WORKERS)))
+textract = boto3.client("textract", config=Config(max_pool_connections=max(10, RECORD_WORKERS)))
+bedrock_client.shared(pool_size=SUMMARY_WORKERS * RECORD_WORKERS)  # keep-alive pool sized for all chunk workers
+
+SUMMARY_INSTRUCTIONS = "Summarize the following document into concise bullet points followed by a short paragraph. Keep legal/meeting names accurate."
+CHUNK_INSTRUCTIONS = "Summarize the following part of a longer document into concise bullet points. Keep names, figures and decisions accurate."
+REDUCE_INSTRUCTIONS = "The following are summaries of consecutive parts of one document. Combine them into bullet points and one concluding paragraph, without mentioning the parts. Keep legal/meeting names accurate."
+
+def _iter_textract_pages(job_id: str):
+    """Paginate over GetDocumentTextDetection, yielding (page number, LINE blocks in
+    page_store form) as soon as the response moves past each page."""
     next_token = None
-    all_lines = []
+    page, lines = None, []
     while True:
-        if next_token:
-            resp = textract.get_document_text_detection(JobId=job_id, NextToken=next_token)
-        else:
-            resp = textract.get_document_text_detection(JobId=job_id)
+        with metrics.timed("textract_page"):
+            if next_token:
+                resp = textract.get_document_text_detection(JobId=job_id, NextToken=next_token)
+            else:
+                resp = textract.get_document_text_detection(JobId=job_id)
         for block in resp.get("Blocks", []):
-            if block.get("BlockType") == "LINE":
-                all_lines.append(block.get("Text", ""))
+            if block.get("BlockType") != "LINE":
+                continue
+            if block.get("Page", 1) != page and lines:
+                yield page, lines
+                lines = []
+            page = block.get("Page", 1)
+            lines.append(page_store.compact_line(block))
         next_token = resp.get("NextToken")
         if not next_token:
             break
-    return "\n".join(all_lines)
-
-def _summarize_with_bedrock(text: str) -> str:
-    """Use Anthropic Claude Messages API via Bedrock to summarize text."""
-    prompt = f"Summarize the following document into concise bullet points followed by a short paragraph. Keep legal/meeting names accurate.\n\nDocument:\n{text[:20000]}"
-    body = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "messages": [
-            {"role": "user", "content": [{"type": "text", "text": prompt}]}
-        ],
-        "max_tokens": SUMMARIZE_MAX_TOKENS,
-        "temperature": 0.2
-    }
-    resp = bedrock_runtime.invoke_model(
-        modelId=BEDROCK_MODEL_ID,
-        body=json.dumps(body).encode("utf-8"),
-        contentType="application/json",
-        accept="application/json",
-    )
-    payload = json.loads(resp["body"].read())
-    # Anthropic message response shape
-    parts = payload.get("content", [])
-    if parts and isinstance(parts, list) and parts[0].get("type") == "text":
-        return parts[0].get("text", "").strip()
-    # Fallback for other models (e.g., Titan Text)
-    return payload.get("outputText") or payload.get("generated_text") or json.dumps(payload)
+    if lines:
+        yield page, lines
+
+_PART_TAG = re.compile(r"^part-([0-9a-f]{32})-(\d{4})$")
+
+def _iter_s3_pages(key: str, chunk_size=1024 * 1024):
+    """Pages of an already extracted text object (form feed separated), streamed."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    rest = ""
+    for chunk in s3.get_object(Bucket=OUTPUT_BUCKET, Key=key)["Body"].iter_chunks(chunk_size):
+        *pages, rest = (rest + decoder.decode(chunk)).split("\f")
+        yield from pages
+    yield rest + decoder.decode(b"", final=True)
+
+class _S3Writer:
+    """Streams text or bytes to S3: one put_object if it stays under PART_SIZE, else a
+    multipart upload with a part per PART_SIZE bytes, so at most one part is buffered."""
+    PART_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, bucket, key):
+        self.bucket, self.key = bucket, key
+        self.buf = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    def write(self, data):
+        self.buf += data.encode("utf-8") if isinstance(data, str) else data
+        if len(self.buf) >= self.PART_SIZE:
+            self._upload_part()
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            self.upload_id = s3.create_multipart_upload(Bucket=self.bucket, Key=self.key)["UploadId"]
+        number = len(self.parts) + 1
+        with metrics.timed("s3_write"):
+            resp = s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                  PartNumber=number, Body=bytes(self.buf))
+        self.parts.append({"ETag": resp["ETag"], "PartNumber": number})
+        self.buf = bytearray()
+
+    def close(self):
+        if self.upload_id is None:
+            with metrics.timed("s3_write"):
+                s3.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buf))
+            return
+        if self.buf:
+            self._upload_part()
+        with metrics.timed("s3_write"):
+            s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                         MultipartUpload={"Parts": self.parts})
+
+    def abort(self):
+        if self.upload_id is not None:
+            s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+def _summarize_once(text: str, instructions: str, label: str) -> str:
+    return bedrock_client.ask(BEDROCK_MODEL_ID, instructions, f"{label}:\n{text}", SUMMARIZE_MAX_TOKENS,
+                              api=BEDROCK_API)
+
+def _summarize_with_bedrock(text, reread=None) -> str:
+    """Summarize a string or an iterable of page texts via Bedrock: Converse by default,
+    the Anthropic Messages body with BEDROCK_API=invoke. `reread()` gives streamed pages
+    again, for condense's passes over a long document."""
+    def summarize(chunk, part):
+        if part is None:
+            return _summarize_once(chunk, SUMMARY_INSTRUCTIONS, "Document")
+        return _summarize_once(chunk, CHUNK_INSTRUCTIONS, f"Part {part}")
+
+    def combine(parts):
+        return _summarize_once("\n\n".join(parts), REDUCE_INSTRUCTIONS, "Partial summaries")
+
+    condensed = None
+    if CONDENSE:
+        import condense  # needs NumPy (Lambda layer); only loaded when enabled
+        with metrics.timed("condense"):
+            text, condensed = condense.condense(text.split("\f") if isinstance(text, str) else text, CONDENSE_TOKENS,
+                                                reread=reread)
+
+    started = time.monotonic()
+    # with streamed pages this includes reading them (Textract pagination, S3 writes)
+    with metrics.timed("summarize"):
+        summary, stats = mapreduce.map_reduce(text, summarize, combine,
+                                              chunk_tokens=SUMMARY_CHUNK_TOKENS, workers=SUMMARY_WORKERS)
+    metrics.count("chunks", stats["chunks"])
+    if stats["chunks"] > 1:
+        logger.info("Summarized %d chunks in %d reduce level(s)", stats["chunks"], stats["reduce_levels"])
+    if condensed and condensed["ratio"] < 1:
+        condensed["est_seconds_saved"] = condense.time_saved(condensed, time.monotonic() - started)
+        logger.info("Condensed input: %s", json.dumps(condensed))
+    return summary
+
+class _PageStoreSink:
+    """page_store data streamed to S3; the index is written on close, after the data."""
+
+    def __init__(self, data_key, index_key, **meta):
+        self.data = _S3Writer(OUTPUT_BUCKET, data_key)
+        self.writer = page_store.PageStoreWriter(self.data, **meta)
+        self.index_key = index_key
+        self.closed = False
+
+    def add(self, page_number, lines):
+        self.writer.add(page_number, lines)
+
+    def close(self):
+        if self.closed:
+            return
+        self.data.close()
+        with metrics.timed("s3_write"):
+            s3.put_object(Bucket=OUTPUT_BUCKET, Key=self.index_key,
+                          Body=json.dumps(self.writer.index()).encode("utf-8"))
+        self.closed = True
+
+    def abort(self):
+        if not self.closed:
+            self.data.abort()
 
+    def texts(self):
+        """Page texts read back from S3 once every page is added; closes the store first."""
+        self.close()
+        return (page_store.page_text(p)
+                for p in page_store.read_pages(s3, OUTPUT_BUCKET, self.data.key, self.writer.index()))
+
+def _record_pages(pages, raw, store):
+    """Pass (page number, lines) through to the flat text and the page store, yielding
+    each page's text for the summarizer."""
+    for n, (page_number, lines) in enumerate(pages):
+        text = page_store.page_text({"lines": lines})
+        if raw:
+            raw.write(text if n == 0 else "\f" + text)
+        store.add(page_number, lines)
+        yield text
+
+def _text_pages(key):
+    """(page number, lines) from an extracted text object, for text without Textract blocks."""
+    for n, text in enumerate(_iter_s3_pages(key), 1):
+        yield n, [{"Text": line} for line in text.split("\n")] if text else []
+
+def _stored_pages(data_key, index_key, first_page=1):
+    """(page number, lines) read back from a page store, renumbered from first_page."""
+    index = json.loads(s3.get_object(Bucket=OUTPUT_BUCKET, Key=index_key)["Body"].read())
+    for page in page_store.read_pages(s3, OUTPUT_BUCKET, data_key, index):
+        yield first_page - 1 + page["page"], page["lines"]
+
+def _already_summarized(summary_key: str, job_id: str) -> bool:
+    """True when the summary for this Textract job was written by an earlier delivery."""
+    try:
+        head = s3.head_object(Bucket=OUTPUT_BUCKET, Key=summary_key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    return head.get("Metadata", {}).get("textract-job-id") == job_id
+
+def _process_record(record):
+    # We enabled raw_message_delivery in SNS->SQS, so Body is the Textract JSON string
+    message = json.loads(record["body"])
+    status = message.get("Status")
+    job_id = message.get("JobId")
+    job_tag = message.get("JobTag")  # sha256 of the PDF when pdf_ingest has dedup enabled
+    doc_loc = message.get("DocumentLocation", {}).get("S3ObjectName", job_tag)
+
+    if status != "SUCCEEDED":
+        logger.warning("Textract job %s not successful (Status=%s)", job_id, status)
+        return None
+
+    part = _PART_TAG.match(job_tag or "")
+    if part:
+        return _process_part(job_id, part.group(1), int(part.group(2)))
+
+    base = (doc_loc or job_tag or f"job-{job_id}").rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    summary_key = f"summaries/{base}.summary.txt"
+    raw_key = f"extracted/{base}.txt"
+
+    if _already_summarized(summary_key, job_id):
+        logger.info("Textract job %s already summarized to %s; skipping", job_id, summary_key)
+        return {"job_id": job_id, "summary_key": summary_key, "raw_key": raw_key, "skipped": True}
+
+    digest = job_tag if content_cache.is_digest(job_tag) else None
+    if digest:
+        cached_summary = content_cache.summary_key(digest, BEDROCK_MODEL_ID)
+        cached_text = content_cache.text_key(digest)
+        # an identical upload finished while this job ran: copy instead of summarizing again
+        if content_cache.exists(s3, OUTPUT_BUCKET, cached_summary) and content_cache.exists(s3, OUTPUT_BUCKET, cached_text):
+            content_cache.copy(s3, OUTPUT_BUCKET, cached_text, raw_key)
+            content_cache.copy(s3, OUTPUT_BUCKET, cached_summary, summary_key)
+            return {"job_id": job_id, "summary_key": summary_key, "raw_key": raw_key, "reused": digest}
+
+    store = _PageStoreSink(page_store.data_key(base), page_store.index_key(base),
+                           source=doc_loc, job_id=job_id, digest=digest)
+    if message.get("ExtractedKey"):
+        # text-layer fast path: pdf_ingest already wrote extracted/ and only summarization is left
+        raw = None
+        pages = _record_pages(_text_pages(message["ExtractedKey"]), None, store)
+    else:
+        # 1) Stream pages from Textract: each page goes to the raw-text upload, the page store
+        #    and the summarization chunker as it arrives; the full text is never held in memory
+        raw = _S3Writer(OUTPUT_BUCKET, raw_key)
+        pages = _record_pages(_iter_textract_pages(job_id), raw, store)
+
+    return _finish(job_id, summary_key, raw_key, pages, raw, store, digest)
+
+def _finish(job_id, summary_key, raw_key, pages, raw, store, digest):
+    sinks = [sink for sink in (raw, store) if sink]
+    try:
+        # 2) Summarize via Bedrock; condense reads a long document back from the page store
+        summary = _summarize_with_bedrock(pages, reread=store.texts)
+        for sink in sinks:
+            sink.close()
+    except Exception:
+        for sink in sinks:
+            sink.abort()
+        raise
+
+    # 3) Write the summary last, tagged with the job id; its presence marks the job done
+    with metrics.timed("s3_write"):
+        s3.put_object(Bucket=OUTPUT_BUCKET, Key=summary_key, Body=summary.encode("utf-8"),
+                      Metadata={"textract-job-id": job_id})
+    if digest:
+        content_cache.copy(s3, OUTPUT_BUCKET, raw_key, content_cache.text_key(digest))
+        content_cache.copy(s3, OUTPUT_BUCKET, summary_key, content_cache.summary_key(digest, BEDROCK_MODEL_ID))
+
+    return {"job_id": job_id, "summary_key": summary_key, "raw_key": raw_key}
+
+def _claim(lock_key: str) -> bool:
+    """Create lock_key only if absent (S3 conditional write); True when this call owns it.
+    A lock older than ASSEMBLY_LEASE_SECONDS belongs to a run that died and is taken over."""
+    try:
+        s3.put_object(Bucket=OUTPUT_BUCKET, Key=lock_key, Body=b"", IfNoneMatch="*")
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("PreconditionFailed", "ConditionalRequestConflict"):
+            raise
+    head = s3.head_object(Bucket=OUTPUT_BUCKET, Key=lock_key)
+    if time.time() - head["LastModified"].timestamp() < ASSEMBLY_LEASE_SECONDS:
+        return False
+    try:
+        s3.put_object(Bucket=OUTPUT_BUCKET, Key=lock_key, Body=b"", IfMatch=head["ETag"])
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("PreconditionFailed", "ConditionalRequestConflict"):
+            return False
+        raise
+
+class AssemblyPending(Exception):
+    """Every part is extracted, but another run holds the assembly lock and no summary exists yet."""
+
+def _process_part(job_id: str, manifest_id: str, index: int):
+    """One page-range part of a split PDF finished: store its text, and if it was the last
+    part outstanding, assemble all parts in page order and summarize the document."""
+    prefix = f"manifests/{manifest_id}/"
+    manifest = json.loads(s3.get_object(Bucket=OUTPUT_BUCKET, Key=f"manifests/{manifest_id}.json")["Body"].read())
+    part_key = f"{prefix}part-{index:04d}"
+    # each part is kept as a page store; its index, written last, marks the part done
+    if not content_cache.exists(s3, OUTPUT_BUCKET, f"{part_key}.index.json"):
+        store = _PageStoreSink(f"{part_key}.pages", f"{part_key}.index.json", job_id=job_id)
+        try:
+            for page_number, lines in _iter_textract_pages(job_id):
+                store.add(page_number, lines)
+            store.close()
+        except Exception:
+            store.abort()
+            raise
+
+    done = 0
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=OUTPUT_BUCKET, Prefix=f"{prefix}part-"):
+        done += sum(1 for obj in page.get("Contents", []) if obj["Key"].endswith(".index.json"))
+    total = len(manifest["parts"])
+    result = {"job_id": job_id, "manifest": manifest_id, "part": index, "parts_done": done, "parts": total}
+    if done < total:
+        return result
+
+    doc_job_id = f"parts-{manifest_id}"
+    base = manifest["key"].rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    summary_key = f"summaries/{base}.summary.txt"
+    raw_key = f"extracted/{base}.txt"
+    if _already_summarized(summary_key, doc_job_id):
+        return dict(result, summary_key=summary_key, raw_key=raw_key, skipped=True)
+    if not _claim(f"{prefix}assembling"):
+        # The holder may still be running, or may have been killed (timeout) with the lock in
+        # place. Fail this record so SQS redelivers it; once the lease runs out it takes over.
+        raise AssemblyPending(f"{manifest['key']}: assembly locked by another run")
+    logger.info("All %d parts of %s extracted; assembling", total, manifest["key"])
+    raw = _S3Writer(OUTPUT_BUCKET, raw_key)
+    store = _PageStoreSink(page_store.data_key(base), page_store.index_key(base),
+                           source=manifest["key"], job_id=doc_job_id, digest=manifest.get("digest"))
+    part_pages = chain.from_iterable(
+        _stored_pages(f"{prefix}part-{i:04d}.pages", f"{prefix}part-{i:04d}.index.json", part["first_page"])
+        for i, part in enumerate(manifest["parts"]))
+    pages = _record_pages(part_pages, raw, store)
+    try:
+        return dict(result, **_finish(doc_job_id, summary_key, raw_key, pages, raw, store, manifest.get("digest")))
+    except Exception:
+        # let the redelivered message (or another part's) retry the assembly
+        s3.delete_object(Bucket=OUTPUT_BUCKET, Key=f"{prefix}assembling")
+        raise
+
+@metrics.invocation
 def lambda_handler(event, context):
     logger.info("SQS Event: %s", json.dumps(event))
-    results = []
-    for record in event.get("Records", []):
-        # We enabled raw_message_delivery in SNS->SQS, so Body is the Textract JSON string
-        message = json.loads(record["body"])
-        status = message.get("Status")
-        job_id = message.get("JobId")
-        job_tag = message.get("JobTag")  # original S3 key
-        doc_loc = message.get("DocumentLocation", {}).get("S3ObjectName", job_tag)
-
-        if status != "SUCCEEDED":
-            logger.warning("Textract job %s not successful (Status=%s)", job_id, status)
+    records = event.get("Records", [])
+    metrics.count("records", len(records))
+    results, failures = [], []
+    with ThreadPoolExecutor(max_workers=max(1, min(RECORD_WORKERS, len(records)))) as pool:
+        futures = [(record, pool.submit(_process_record, record)) for record in records]
+    for record, future in futures:
+        try:
+            result = future.result()
+        except AssemblyPending as e:
+            logger.info("Retrying message %s later: %s", record.get("messageId"), e)
+            failures.append({"itemIdentifier": record.get("messageId")})
             continue
+        except Exception:
+            # only this message goes back to the queue (ReportBatchItemFailures)
+            logger.exception("Failed to process message %s", record.get("messageId"))
+            failures.append({"itemIdentifier": record.get("messageId")})
+            metrics.count("record_failures")
+            continue
+        if result:
+            results.append(result)
 
-        # 1) Fetch text from Textract
-        text = _get_textract_text(job_id)
-
-        # 2) Summarize via Bedrock
-        summary = _summarize_with_bedrock(text)
-
-        # 3) Write outputs to S3
-        base = (doc_loc or job_tag or f"job-{job_id}").rsplit("/", 1)[-1].rsplit(".", 1)[0]
-        summary_key = f"summaries/{base}.summary.txt"
-        raw_key = f"extracted/{base}.txt"
+    return {"statusCode": 200, "body": json.dumps({"results": results}), "batchItemFailures": failures}
 
-        s3.put_object(Bucket=OUTPUT_BUCKET, Key=summary_key, Body=summary.encode("utf-8"))
-        s3.put_object(Bucket=OUTPUT_BUCKET, Key=raw_key, Body=text.encode("utf-8"))
+@metrics.invocation
+def reprocess_handler(event, context):
+    """Re-summarize a document from its page store, without Textract.
+    Event: {"document": "<S3 key or base name>", "first_page": 40, "last_page": 50}
+    (both pages optional). The whole document replaces summaries/<base>.summary.txt;
+    a page range goes to summaries/<base>.p<first>-<last>.summary.txt."""
+    base = event["document"].rsplit("/", 1)[-1]
+    base = base.rsplit(".", 1)[0] if base.lower().endswith(".pdf") else base
+    index = json.loads(s3.get_object(Bucket=OUTPUT_BUCKET, Key=page_store.index_key(base))["Body"].read())
+    first, last = event.get("first_page"), event.get("last_page")
 
-        results.append({"job_id": job_id, "summary_key": summary_key, "raw_key": raw_key})
+    def pages():
+        return (page_store.page_text(p)
+                for p in page_store.read_pages(s3, OUTPUT_BUCKET, page_store.data_key(base), index, first, last))
+    summary = _summarize_with_bedrock(pages(), reread=pages)
 
-    return {"statusCode": 200, "body": json.dumps({"results": results})}
+    whole = first is None and last is None
+    if whole:
+        summary_key = f"summaries/{base}.summary.txt"
+    else:
+        summary_key = f"summaries/{base}.p{first or 1}-{last or index['pages'][-1][0]}.summary.txt"
+    with metrics.timed("s3_write"):
+        s3.put_object(Bucket=OUTPUT_BUCKET, Key=summary_key, Body=summary.encode("utf-8"),
+                      Metadata={"textract-job-id": index.get("job_id") or ""})
+    if whole and content_cache.is_digest(index.get("digest")):
+        content_cache.copy(s3, OUTPUT_BUCKET, summary_key, content_cache.summary_key(index["digest"], BEDROCK_MODEL_ID))
+    return {"summary_key": summary_key, "summary": summary}
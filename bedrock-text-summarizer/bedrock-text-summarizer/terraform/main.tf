@@ -29,6 +29,7 @@ locals {
   summaries_prefix     = "summaries/"
   extracted_prefix     = "extracted/"
   lambda_src_dir       = "${path.module}/../lambda"
+  shared_src_dir       = "${path.module}/../../../shared"
   bedrock_model_id     = var.bedrock_model_id
   tags = merge(var.tags, {
     Project = local.project
@@ -58,6 +59,21 @@ resource "aws_s3_bucket_server_side_encryption_configuration" "input" {
   }
 }
 
+# page-range parts written by pdf_ingest for Textract fan-out
+resource "aws_s3_bucket_lifecycle_configuration" "input" {
+  bucket = aws_s3_bucket.input.id
+  rule {
+    id     = "expire-parts"
+    status = "Enabled"
+    filter {
+      prefix = "parts/"
+    }
+    expiration {
+      days = 7
+    }
+  }
+}
+
 resource "aws_s3_bucket_public_access_block" "input" {
   bucket = aws_s3_bucket.input.id
   block_public_acls       = true
@@ -80,6 +96,41 @@ resource "aws_s3_bucket_server_side_encryption_configuration" "output" {
   }
 }
 
+# extracted text is streamed with multipart uploads; clean up any a failed run leaves behind
+resource "aws_s3_bucket_lifecycle_configuration" "output" {
+  bucket = aws_s3_bucket.output.id
+  rule {
+    id     = "abort-incomplete-uploads"
+    status = "Enabled"
+    filter {}
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1
+    }
+  }
+  # manifests and per-part text of split PDFs are only needed until assembly
+  rule {
+    id     = "expire-manifests"
+    status = "Enabled"
+    filter {
+      prefix = "manifests/"
+    }
+    expiration {
+      days = 7
+    }
+  }
+  # input and status of async text_summarizer jobs
+  rule {
+    id     = "expire-jobs"
+    status = "Enabled"
+    filter {
+      prefix = "jobs/"
+    }
+    expiration {
+      days = 7
+    }
+  }
+}
+
 resource "aws_s3_bucket_public_access_block" "output" {
   bucket = aws_s3_bucket.output.id
   block_public_acls       = true
@@ -98,7 +149,7 @@ resource "aws_sns_topic" "textract_complete" {
 
 resource "aws_sqs_queue" "textract_complete" {
   name                      = "${local.project}-textract-complete-${random_id.suffix.hex}"
-  visibility_timeout_seconds = 300
+  visibility_timeout_seconds = 900 # must cover the postprocess Lambda timeout
   message_retention_seconds  = 86400
   tags                      = local.tags
 }
@@ -132,6 +183,25 @@ resource "aws_sqs_queue_policy" "sns_to_sqs" {
   policy    = data.aws_iam_policy_document.sqs_policy.json
 }
 
+# async text_summarizer jobs, read by the summarize_worker Lambda
+resource "aws_sqs_queue" "summarize_jobs" {
+  name                      = "${local.project}-summarize-jobs-${random_id.suffix.hex}"
+  visibility_timeout_seconds = 900 # must cover the summarize_worker Lambda timeout
+  message_retention_seconds  = 86400
+  # one delivery past JOB_MAX_ATTEMPTS, which marks a job whose workers all timed out as failed
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.summarize_jobs_dlq.arn
+    maxReceiveCount     = local.job_max_attempts + 1
+  })
+  tags = local.tags
+}
+
+resource "aws_sqs_queue" "summarize_jobs_dlq" {
+  name                      = "${local.project}-summarize-jobs-dlq-${random_id.suffix.hex}"
+  message_retention_seconds = 1209600
+  tags                      = local.tags
+}
+
 resource "aws_sns_topic_subscription" "sns_to_sqs" {
   topic_arn = aws_sns_topic.textract_complete.arn
   protocol  = "sqs"
@@ -205,13 +275,44 @@ data "aws_iam_policy_document" "pdf_ingest_policy" {
     ]
     resources = ["${aws_s3_bucket.input.arn}/*"]
   }
+  # page-range parts of large PDFs (fan-out)
+  statement {
+    effect = "Allow"
+    actions = [
+      "s3:PutObject"
+    ]
+    resources = ["${aws_s3_bucket.input.arn}/parts/*"]
+  }
+  # content-hash dedup: look up and copy earlier results in the output bucket
   statement {
     effect = "Allow"
     actions = [
-      "textract:StartDocumentTextDetection"
+      "s3:GetObject",
+      "s3:PutObject"
+    ]
+    resources = ["${aws_s3_bucket.output.arn}/*"]
+  }
+  statement {
+    effect = "Allow"
+    actions = [
+      "s3:ListBucket"
+    ]
+    resources = [aws_s3_bucket.output.arn]
+  }
+  statement {
+    effect = "Allow"
+    actions = [
+      "textract:StartDocumentTextDetection",
+      "textract:DetectDocumentText"
     ]
     resources = ["*"]
   }
+  # text-layer fast path hands extracted documents straight to the postprocess queue
+  statement {
+    effect = "Allow"
+    actions = ["sqs:SendMessage"]
+    resources = [aws_sqs_queue.textract_complete.arn]
+  }
   # Allow passing the Textract publish role for NotificationChannel
   statement {
     effect = "Allow"
@@ -271,10 +372,28 @@ data "aws_iam_policy_document" "postprocess_policy" {
   statement {
     effect = "Allow"
     actions = [
-      "s3:PutObject"
+      "s3:GetObject",
+      "s3:PutObject",
+      "s3:AbortMultipartUpload"
     ]
     resources = ["${aws_s3_bucket.output.arn}/*"]
   }
+  # assembly lock of a split PDF is released when summarizing fails
+  statement {
+    effect = "Allow"
+    actions = [
+      "s3:DeleteObject"
+    ]
+    resources = ["${aws_s3_bucket.output.arn}/manifests/*"]
+  }
+  # HeadObject on a missing summary returns 404 (not 403) only with ListBucket
+  statement {
+    effect = "Allow"
+    actions = [
+      "s3:ListBucket"
+    ]
+    resources = [aws_s3_bucket.output.arn]
+  }
   statement {
     effect = "Allow"
     actions = [
@@ -313,6 +432,41 @@ data "aws_iam_policy_document" "text_summarizer_policy" {
     ]
     resources = ["*"]
   }
+  # content-hash summary cache shared with the PDF path
+  statement {
+    effect = "Allow"
+    actions = [
+      "s3:GetObject",
+      "s3:PutObject"
+    ]
+    resources = ["${aws_s3_bucket.output.arn}/by-hash/*"]
+  }
+  statement {
+    effect = "Allow"
+    actions = [
+      "s3:ListBucket"
+    ]
+    resources = [aws_s3_bucket.output.arn]
+  }
+  # async jobs: the API submits and polls, the worker consumes
+  statement {
+    effect = "Allow"
+    actions = [
+      "s3:GetObject",
+      "s3:PutObject"
+    ]
+    resources = ["${aws_s3_bucket.output.arn}/jobs/*"]
+  }
+  statement {
+    effect = "Allow"
+    actions = [
+      "sqs:SendMessage",
+      "sqs:ReceiveMessage",
+      "sqs:DeleteMessage",
+      "sqs:GetQueueAttributes"
+    ]
+    resources = [aws_sqs_queue.summarize_jobs.arn]
+  }
   # Logs
   statement {
     effect = "Allow"
@@ -330,21 +484,46 @@ resource "aws_iam_role_policy" "text_summarizer_policy" {
 ########################
 # Lambda Packages
 ########################
+# bedrock_client.py and metrics.py live once, in shared/ at the repository root
+data "archive_file" "shared_layer_zip" {
+  type        = "zip"
+  output_path = "${path.module}/build/shared_layer.zip"
+  source {
+    filename = "python/bedrock_client.py"
+    content  = file("${local.shared_src_dir}/bedrock_client.py")
+  }
+  source {
+    filename = "python/metrics.py"
+    content  = file("${local.shared_src_dir}/metrics.py")
+  }
+}
+
+resource "aws_lambda_layer_version" "shared" {
+  layer_name          = "${local.project}-shared"
+  filename            = data.archive_file.shared_layer_zip.output_path
+  source_code_hash    = data.archive_file.shared_layer_zip.output_base64sha256
+  compatible_runtimes = ["python3.11"]
+}
+
+# each function ships the whole lambda/ dir for the modules the functions share
 data "archive_file" "pdf_ingest_zip" {
   type        = "zip"
-  source_file = "${local.lambda_src_dir}/pdf_ingest.py"
+  source_dir  = local.lambda_src_dir
+  excludes    = ["__pycache__"]
   output_path = "${path.module}/build/pdf_ingest.zip"
 }
 
 data "archive_file" "postprocess_zip" {
   type        = "zip"
-  source_file = "${local.lambda_src_dir}/textract_postprocess.py"
+  source_dir  = local.lambda_src_dir
+  excludes    = ["__pycache__"]
   output_path = "${path.module}/build/textract_postprocess.zip"
 }
 
 data "archive_file" "text_summarizer_zip" {
   type        = "zip"
-  source_file = "${local.lambda_src_dir}/text_summarizer.py"
+  source_dir  = local.lambda_src_dir
+  excludes    = ["__pycache__"]
   output_path = "${path.module}/build/text_summarizer.zip"
 }
 
@@ -354,17 +533,42 @@ resource "aws_lambda_function" "pdf_ingest" {
   runtime       = "python3.11"
   handler       = "pdf_ingest.lambda_handler"
   filename      = data.archive_file.pdf_ingest_zip.output_path
-  timeout       = 60
+  timeout       = 120
+  memory_size   = 1024 # local PDF parsing (text-layer fast path, fan-out)
+  ephemeral_storage {
+    size = 512 # PDFs up to LOCAL_PDF_MAX_MB (100) are downloaded to /tmp
+  }
+  layers        = concat([aws_lambda_layer_version.shared.arn], var.pdf_layers)
   environment {
     variables = {
       SNS_TOPIC_ARN      = aws_sns_topic.textract_complete.arn
       TEXTRACT_ROLE_ARN  = aws_iam_role.textract_publish_role.arn
       INPUT_BUCKET       = aws_s3_bucket.input.bucket
+      OUTPUT_BUCKET      = aws_s3_bucket.output.bucket
+      BEDROCK_MODEL_ID   = local.bedrock_model_id
+      QUEUE_URL          = aws_sqs_queue.textract_complete.id
+      TEXT_LAYER         = length(var.pdf_layers) > 0 ? "on" : "off"
+      SPLIT_PAGES        = length(var.pdf_layers) > 0 ? "200" : "0"
     }
   }
   tags = local.tags
 }
 
+locals {
+  postprocess_env = {
+    OUTPUT_BUCKET        = aws_s3_bucket.output.bucket
+    INPUT_BUCKET         = aws_s3_bucket.input.bucket
+    BEDROCK_MODEL_ID     = local.bedrock_model_id
+    SUMMARIZE_MAX_TOKENS = "1024"
+    BEDROCK_API          = "converse"
+    SUMMARY_CHUNK_TOKENS = "4000"
+    SUMMARY_WORKERS      = "4"
+    RECORD_WORKERS       = "5"
+    CONDENSE             = length(var.summarizer_layers) > 0 ? "on" : "off"
+    CONDENSE_TOKENS      = "12000"
+  }
+}
+
 resource "aws_lambda_function" "postprocess" {
   function_name = "${local.project}-postprocess"
   role          = aws_iam_role.postprocess.arn
@@ -372,17 +576,48 @@ resource "aws_lambda_function" "postprocess" {
   handler       = "textract_postprocess.lambda_handler"
   filename      = data.archive_file.postprocess_zip.output_path
   timeout       = 900
+  layers        = concat([aws_lambda_layer_version.shared.arn], var.summarizer_layers)
   environment {
-    variables = {
-      OUTPUT_BUCKET    = aws_s3_bucket.output.bucket
-      INPUT_BUCKET     = aws_s3_bucket.input.bucket
-      BEDROCK_MODEL_ID = local.bedrock_model_id
-      SUMMARIZE_MAX_TOKENS = "1024"
-    }
+    variables = local.postprocess_env
+  }
+  tags = local.tags
+}
+
+# Re-summarizes from the page store (pages/) without Textract; invoke directly:
+#   aws lambda invoke --function-name <project>-reprocess \
+#     --payload '{"document":"incoming/report.pdf","first_page":40,"last_page":50}' out.json
+resource "aws_lambda_function" "reprocess" {
+  function_name = "${local.project}-reprocess"
+  role          = aws_iam_role.postprocess.arn
+  runtime       = "python3.11"
+  handler       = "textract_postprocess.reprocess_handler"
+  filename      = data.archive_file.postprocess_zip.output_path
+  timeout       = 900
+  layers        = concat([aws_lambda_layer_version.shared.arn], var.summarizer_layers)
+  environment {
+    variables = local.postprocess_env
   }
   tags = local.tags
 }
 
+locals {
+  job_max_attempts = 3
+  text_summarizer_env = {
+    BEDROCK_MODEL_ID     = local.bedrock_model_id
+    SUMMARIZE_MAX_TOKENS = "1024"
+    BEDROCK_API          = "converse"
+    SUMMARY_CHUNK_TOKENS = "4000"
+    SUMMARY_WORKERS      = "4"
+    SUMMARY_CACHE_BUCKET = aws_s3_bucket.output.bucket
+    CONDENSE             = length(var.summarizer_layers) > 0 ? "on" : "off"
+    CONDENSE_TOKENS      = "12000"
+    JOB_QUEUE_URL        = aws_sqs_queue.summarize_jobs.id
+    JOB_BUCKET           = aws_s3_bucket.output.bucket
+    SYNC_MAX_CHARS       = "20000"
+    JOB_MAX_ATTEMPTS     = tostring(local.job_max_attempts)
+  }
+}
+
 resource "aws_lambda_function" "text_summarizer" {
   function_name = "${local.project}-text-summarizer"
   role          = aws_iam_role.text_summarizer.arn
@@ -390,11 +625,24 @@ resource "aws_lambda_function" "text_summarizer" {
   handler       = "text_summarizer.lambda_handler"
   filename      = data.archive_file.text_summarizer_zip.output_path
   timeout       = 60
+  layers        = concat([aws_lambda_layer_version.shared.arn], var.summarizer_layers)
   environment {
-    variables = {
-      BEDROCK_MODEL_ID = local.bedrock_model_id
-      SUMMARIZE_MAX_TOKENS = "1024"
-    }
+    variables = local.text_summarizer_env
+  }
+  tags = local.tags
+}
+
+# Runs queued text_summarizer jobs (POST /summarize with long text, "async" or "callback_url")
+resource "aws_lambda_function" "summarize_worker" {
+  function_name = "${local.project}-summarize-worker"
+  role          = aws_iam_role.text_summarizer.arn
+  runtime       = "python3.11"
+  handler       = "text_summarizer.job_handler"
+  filename      = data.archive_file.text_summarizer_zip.output_path
+  timeout       = 900
+  layers        = concat([aws_lambda_layer_version.shared.arn], var.summarizer_layers)
+  environment {
+    variables = local.text_summarizer_env
   }
   tags = local.tags
 }
@@ -429,8 +677,21 @@ resource "aws_s3_bucket_notification" "input_notifications" {
 resource "aws_lambda_event_source_mapping" "sqs_to_postprocess" {
   event_source_arn = aws_sqs_queue.textract_complete.arn
   function_name    = aws_lambda_function.postprocess.arn
-  batch_size       = 5
+  batch_size       = 10
   enabled          = true
+
+  # failed records are returned in batchItemFailures; only those are redelivered
+  function_response_types = ["ReportBatchItemFailures"]
+}
+
+# SQS -> Lambda (summarize_worker); one job per invocation
+resource "aws_lambda_event_source_mapping" "jobs_to_worker" {
+  event_source_arn = aws_sqs_queue.summarize_jobs.arn
+  function_name    = aws_lambda_function.summarize_worker.arn
+  batch_size       = 1
+  enabled          = true
+
+  function_response_types = ["ReportBatchItemFailures"]
 }
 
 ########################
@@ -457,6 +718,12 @@ resource "aws_apigatewayv2_route" "summarize_route" {
   target    = "integrations/${aws_apigatewayv2_integration.summarize_integration.id}"
 }
 
+resource "aws_apigatewayv2_route" "job_status_route" {
+  api_id    = aws_apigatewayv2_api.http.id
+  route_key = "GET /summarize/{job_id}"
+  target    = "integrations/${aws_apigatewayv2_integration.summarize_integration.id}"
+}
+
 resource "aws_lambda_permission" "allow_apigw" {
   statement_id  = "AllowAPIGwInvoke"
   action        = "lambda:InvokeFunction"
@@ -486,7 +753,17 @@ output "output_bucket_name" {
   description = "Summaries written to s3://<bucket>/summaries/"
 }
 
+output "reprocess_function_name" {
+  value       = aws_lambda_function.reprocess.function_name
+  description = "Invoke with {\"document\": \"<key>\", \"first_page\": n, \"last_page\": m} to re-summarize without Textract"
+}
+
 output "api_invoke_url" {
   value       = "${aws_apigatewayv2_api.http.api_endpoint}/${aws_apigatewayv2_stage.prod.name}"
   description = "HTTP API base URL"
 }
+
+output "summarize_jobs_dlq_url" {
+  value       = aws_sqs_queue.summarize_jobs_dlq.id
+  description = "Async summarize job messages that could not even be marked failed"
+}
@@ -21,6 +21,18 @@ variable "bedrock_model_id" {
   default     = "anthropic.claude-3-sonnet-20240229-v1:0"
 }
 
+variable "pdf_layers" {
+  description = "Lambda layer ARNs for pdf_ingest providing pypdf (enables the text-layer fast path)"
+  type        = list(string)
+  default     = []
+}
+
+variable "summarizer_layers" {
+  description = "Lambda layer ARNs for the summarizing functions providing NumPy (enables extractive pre-condensation)"
+  type        = list(string)
+  default     = []
+}
+
 variable "tags" {
   description = "Common tags"
   type        = map(string)
@@ -0,0 +1,45 @@
+import os, sys, threading
+
+import pytest
+
+# text_summarizer creates its AWS clients at import; the tests never call AWS
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("METRICS", "off")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "shared"))
+# fakes.py: the in-process S3, SQS and Textract the load test runs against
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "loadtest"))
+# pdf_ingest and textract_postprocess read these at import
+for name, value in {"INPUT_BUCKET": "input", "OUTPUT_BUCKET": "output",
+                    "SNS_TOPIC_ARN": "arn:aws:sns:us-east-1:000000000000:textract-done",
+                    "TEXTRACT_ROLE_ARN": "arn:aws:iam::000000000000:role/textract-sns"}.items():
+    os.environ.setdefault(name, value)
+
+class FakeInvoker:
+    """Stands in for bedrock_client.ask: records each call's instructions and input."""
+
+    def __init__(self):
+        self.calls = []
+        self.error = None
+        self._lock = threading.Lock()
+
+    def __call__(self, model_id, instructions, text, max_tokens, **kwargs):
+        with self._lock:
+            self.calls.append((instructions, text))
+        if self.error is not None:
+            raise self.error
+        return f"summary of {len(text)} chars"
+
+@pytest.fixture
+def invoker(monkeypatch):
+    import bedrock_client
+    fake = FakeInvoker()
+    monkeypatch.setattr(bedrock_client, "ask", fake)
+    return fake
+
+@pytest.fixture
+def backend():
+    """loadtest fakes with no simulated latency; `backend.client(service)` makes a client.
+    Modules that made their clients at import get them with monkeypatch.setattr."""
+    import fakes
+    return fakes.Backend(time_scale=0)
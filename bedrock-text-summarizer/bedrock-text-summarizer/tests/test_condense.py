@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+import condense, mapreduce, text_summarizer
+
+TOPIC = "The reactor cooling pump failed after the valve inspection, so the cooling loop was shut down."
+
+def _report(pages, seed=5):
+    """Pages with a running header and footer, a TOC page, and sentences that either keep
+    returning to the report's topic or are one-off filler."""
+    rng = random.Random(seed)
+    topic = "reactor cooling pump valve loop pressure inspection shutdown coolant flow".split()
+    noise = ["".join(rng.choice("bcdfgklmnprstvz") + rng.choice("aeiou") for _ in range(3)) for _ in range(400)]
+    out = ["Contents\nIntroduction ........ 2\nFindings . . . . . . 3"]
+    for i in range(1, pages):
+        body = [TOPIC if rng.random() < 0.1 else
+                "The " + " ".join(rng.sample(topic, 5)) + f" was logged at station {i}." if rng.random() < 0.4 else
+                "Noted " + " ".join(rng.sample(noise, 8)) + "."
+                for _ in range(12)]
+        out.append(f"ACME Plant Safety Review\n{' '.join(body)}\nPage {i} of {pages}")
+    return out
+
+def test_within_budget_is_unchanged():
+    pages = ["One short page.", "Another one."]
+    out, stats = condense.condense(pages, 1000)
+    assert out == pages and stats["ratio"] == 1.0 and stats["tokens_in"] == stats["tokens_out"]
+
+def test_boilerplate_lines_are_dropped():
+    pages, dropped = condense.strip_boilerplate(_report(8))
+    text = "\n".join(pages)
+    assert "ACME Plant Safety Review" not in text and "Page 3 of 8" not in text and "........" not in text
+    assert dropped == 7 * 2 + 2
+    assert TOPIC in text
+
+def test_condensed_pages_fit_the_budget_and_keep_central_sentences():
+    pages = _report(30)
+    out, stats = condense.condense(pages, 600)
+    assert len(out) == len(pages)
+    assert stats["tokens_out"] <= 600 < stats["tokens_in"]
+    assert stats["ratio"] == pytest.approx(stats["tokens_out"] / stats["tokens_in"], abs=1e-4)
+    kept = " ".join(out)
+    assert kept.count("Noted") * 4 < kept.count("cooling")
+    # kept sentences stay on their own page, in document order
+    for original, condensed in zip(condense.strip_boilerplate(pages)[0], out):
+        position = 0
+        for sentence in condense._SENTENCE.split(condensed) if condensed else []:
+            position = original.replace("\n", " ").index(sentence, position)
+
+def test_streamed_pages_are_condensed_in_passes_over_reread():
+    pages = _report(40)
+    expected = condense.condense(pages, 600)
+    first_read, rereads = [], []
+
+    def stream():
+        for page in pages:
+            first_read.append(page)
+            yield page
+
+    def reread():
+        rereads.append(1)
+        return iter(pages)
+
+    assert condense.condense(stream(), 600, reread=reread)[0] == expected[0]
+    assert first_read == pages and len(rereads) == 3
+
+def test_within_budget_reads_the_pages_once():
+    pages = ["One short page.", "Another one."]
+    reread = lambda: pytest.fail("a document within the budget is not read again")
+    assert condense.condense(iter(pages), 1000, reread=reread)[0] == pages
+
+def test_scores_favor_sentences_like_the_rest():
+    scores = condense.score_sentences([TOPIC, TOPIC, "Cooling pump valve loop.", "Blue banner newsletter."])
+    assert scores[0] == pytest.approx(scores[1]) and scores[0] > scores[2] > scores[3]
+    assert list(condense.score_sentences(["the a of", "and"])) == [0.0, 0.0]
+
+def test_time_saved():
+    stats = {"tokens_in": 3000, "tokens_out": 1000, "seconds": 0.5}
+    assert condense.time_saved(stats, 10.0) == 19.5
+    assert condense.time_saved({"tokens_in": 5, "tokens_out": 0, "seconds": 0.1}, 10.0) == 0.0
+
+def test_summarize_condenses_before_chunking(monkeypatch, invoker):
+    monkeypatch.setattr(text_summarizer, "CONDENSE", True)
+    monkeypatch.setattr(text_summarizer, "CONDENSE_TOKENS", 1500)
+    monkeypatch.setattr(text_summarizer, "SUMMARY_CHUNK_TOKENS", 1000)
+    text = "\f".join(_report(60))
+    assert mapreduce.estimate_tokens(text) > 10000
+
+    summary = text_summarizer._summarize(text)
+    chunk_calls = [t for i, t in invoker.calls if i == text_summarizer.CHUNK_INSTRUCTIONS]
+    reduce_calls = [t for i, t in invoker.calls if i == text_summarizer.REDUCE_INSTRUCTIONS]
+    assert summary.startswith("summary of")
+    assert 2 <= len(chunk_calls) <= 3 and len(reduce_calls) == 1
+    assert sum(mapreduce.estimate_tokens(t) for t in chunk_calls) <= 1500 + 50  # plus the "Part n:" labels
+    assert not any("ACME Plant Safety Review" in t for t in chunk_calls)
+
+def test_summarize_without_condense_sends_everything(monkeypatch, invoker):
+    monkeypatch.setattr(text_summarizer, "CONDENSE", False)
+    monkeypatch.setattr(text_summarizer, "SUMMARY_CHUNK_TOKENS", 1000)
+    text = "\f".join(_report(60))  # over SYNC_MAX_CHARS, so it is map-reduced
+    text_summarizer._summarize(text)
+    chunk_calls = [t for i, t in invoker.calls if i == text_summarizer.CHUNK_INSTRUCTIONS]
+    assert len(chunk_calls) == len(mapreduce.split_chunks(text, 1000))
+    assert all("ACME Plant Safety Review" in t for t in chunk_calls)
@@ -0,0 +1,73 @@
+import hashlib, json
+
+import pytest
+
+import fakes, pdf_ingest, text_summarizer, textract_postprocess as post
+
+QUEUE_URL = "https://sqs.example/textract-results"
+PDF = fakes.make_pdf([["Minutes of the board meeting held on 3 March."] * 5] * 2)
+
+@pytest.fixture
+def aws(monkeypatch, backend, invoker):
+    s3, textract = backend.client("s3"), backend.client("textract")
+    for module in (pdf_ingest, post):
+        monkeypatch.setattr(module, "s3", s3)
+        monkeypatch.setattr(module, "textract", textract)
+    monkeypatch.setattr(text_summarizer, "s3", s3)
+    monkeypatch.setattr(text_summarizer, "SUMMARY_CACHE_BUCKET", "output")
+    monkeypatch.setattr(pdf_ingest, "TEXT_LAYER", False)  # every new document goes to Textract
+    monkeypatch.setattr(pdf_ingest, "SPLIT_PAGES", 0)
+    backend.subscribe(pdf_ingest.SNS_TOPIC_ARN, QUEUE_URL)  # Textract completions, as in the stack
+    return backend
+
+def _upload(backend, key, body=PDF):
+    backend.store("input", key, body)
+    pdf_ingest.lambda_handler({"Records": [{"s3": {"bucket": {"name": "input"},
+                                                   "object": {"key": key, "size": len(body)}}}]}, None)
+
+def _complete(backend, key):
+    """Deliver the completion of the Textract job started for `key`, as SQS would."""
+    queue = backend.queue(QUEUE_URL)
+    while True:
+        received = queue.receive(max_messages=1, wait=5)
+        assert received, f"no Textract completion for {key}"
+        message = received[0]
+        queue.done(message)
+        if json.loads(message["body"])["DocumentLocation"]["S3ObjectName"] == key:
+            return post.lambda_handler({"Records": [{"messageId": message["messageId"], "body": message["body"]}]}, None)
+        queue.send(message["body"])  # another document's: leave it for later
+
+def test_an_identical_upload_reuses_the_results_without_textract_or_bedrock(aws, invoker):
+    _upload(aws, "incoming/minutes.pdf")
+    assert aws.stats["textract.StartDocumentTextDetection"] == 1
+    _complete(aws, "incoming/minutes.pdf")
+    calls = len(invoker.calls)
+
+    _upload(aws, "incoming/minutes-copy.pdf")
+    assert aws.stats["textract.StartDocumentTextDetection"] == 1 and len(invoker.calls) == calls
+    for out in ("summaries/{}.summary.txt", "extracted/{}.txt"):
+        assert aws.get("output", out.format("minutes-copy"))[0] == aws.get("output", out.format("minutes"))[0]
+
+def test_changed_content_is_extracted_again(aws):
+    _upload(aws, "incoming/minutes.pdf")
+    _complete(aws, "incoming/minutes.pdf")
+    _upload(aws, "incoming/minutes.pdf", fakes.make_pdf([["Minutes, amended."] * 5]))
+    assert aws.stats["textract.StartDocumentTextDetection"] == 2
+
+def test_a_job_finishing_after_an_identical_one_copies_its_results(aws, invoker):
+    _upload(aws, "incoming/a.pdf")
+    _upload(aws, "incoming/b.pdf")  # before a.pdf is summarized: both go to Textract
+    assert aws.stats["textract.StartDocumentTextDetection"] == 2
+    _complete(aws, "incoming/a.pdf")
+    calls = len(invoker.calls)
+    result = json.loads(_complete(aws, "incoming/b.pdf")["body"])["results"][0]
+    assert result["reused"] == hashlib.sha256(PDF).hexdigest()
+    assert len(invoker.calls) == calls
+    assert aws.get("output", "summaries/b.summary.txt")[0] == aws.get("output", "summaries/a.summary.txt")[0]
+
+def test_pasted_text_is_summarized_once(aws, invoker):
+    event = {"body": json.dumps({"text": "The committee met and approved the budget."})}
+    first = json.loads(text_summarizer.lambda_handler(event, None)["body"])
+    second = json.loads(text_summarizer.lambda_handler(event, None)["body"])
+    assert first["cached"] is False and second == {"summary": first["summary"], "cached": True}
+    assert len(invoker.calls) == 1
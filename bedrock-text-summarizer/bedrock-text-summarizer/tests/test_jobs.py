@@ -0,0 +1,123 @@
+import json
+
+import pytest
+
+import bedrock_client, content_cache, mapreduce, text_summarizer
+
+JOB_QUEUE_URL = "https://sqs.example/jobs"
+
+@pytest.fixture
+def aws(monkeypatch, backend, invoker):
+    notified = []
+    monkeypatch.setattr(text_summarizer, "s3", backend.client("s3"))
+    monkeypatch.setattr(text_summarizer, "sqs", backend.client("sqs"))
+    monkeypatch.setattr(text_summarizer, "JOB_QUEUE_URL", JOB_QUEUE_URL)
+    monkeypatch.setattr(text_summarizer, "JOB_BUCKET", "jobs")
+    monkeypatch.setattr(text_summarizer, "SUMMARY_CACHE_BUCKET", "")
+    monkeypatch.setattr(text_summarizer, "_notify", lambda url, doc: notified.append((url, doc)))
+    return backend, notified
+
+def _messages(backend):
+    """Job messages sent so far; they stay on the queue, so each _deliver redelivers them."""
+    return [json.loads(m["body"]) for m in backend.queue(JOB_QUEUE_URL).ready]
+
+def _post(body):
+    resp = text_summarizer.lambda_handler({"body": json.dumps(body)}, None)
+    return resp["statusCode"], json.loads(resp["body"])
+
+def _get(job_id):
+    resp = text_summarizer.lambda_handler({"requestContext": {"http": {"method": "GET"}},
+                                           "pathParameters": {"job_id": job_id}}, None)
+    return resp["statusCode"], json.loads(resp["body"])
+
+def _deliver(backend, attempt=1):
+    records = [{"messageId": f"m{i}", "body": json.dumps(m), "attributes": {"ApproximateReceiveCount": str(attempt)}}
+               for i, m in enumerate(_messages(backend))]
+    return text_summarizer.job_handler({"Records": records}, None)["batchItemFailures"]
+
+def test_short_text_is_summarized_synchronously(aws, invoker):
+    backend, _ = aws
+    status, body = _post({"text": "word " * 100})
+    assert status == 200 and body["summary"].startswith("summary of") and body["cached"] is False
+    assert _messages(backend) == [] and len(invoker.calls) == 1
+
+def test_text_over_the_sync_limit_is_queued(aws, invoker):
+    backend, _ = aws
+    text = "x" * (text_summarizer.SYNC_MAX_CHARS + 1)
+    status, doc = _post({"text": text})
+    assert status == 202 and doc["status"] == "queued"
+    assert _messages(backend) == [{"job_id": doc["job_id"], "callback_url": ""}]
+    assert backend.get("jobs", f"jobs/{doc['job_id']}/input.txt")[0] == text.encode("utf-8")
+    assert invoker.calls == []
+    assert _get(doc["job_id"]) == (200, doc)
+
+@pytest.mark.parametrize("extra", [{"async": True}, {"callback_url": "https://example.com/hook"}])
+def test_async_or_callback_requests_are_queued_whatever_their_size(aws, extra):
+    backend, _ = aws
+    status, doc = _post(dict(extra, text="short"))
+    assert status == 202 and len(_messages(backend)) == 1
+    assert _messages(backend)[0]["callback_url"] == extra.get("callback_url", "")
+
+def test_without_a_job_queue_long_text_stays_synchronous(aws, monkeypatch, invoker):
+    monkeypatch.setattr(text_summarizer, "JOB_QUEUE_URL", "")
+    status, _ = _post({"text": "word " * (text_summarizer.SYNC_MAX_CHARS // 4)})
+    assert status == 200 and invoker.calls
+
+def test_bad_requests(aws):
+    assert _post({"text": ""})[0] == 400
+    assert _post({"text": "hi", "callback_url": "http://example.com"})[0] == 400
+    assert _get("not-a-job-id")[0] == 404
+    assert _get("0" * 32)[0] == 404
+
+def test_cached_summary_is_returned_instead_of_queueing(aws, monkeypatch, invoker):
+    backend, _ = aws
+    monkeypatch.setattr(text_summarizer, "SUMMARY_CACHE_BUCKET", "out")
+    text = "y" * (text_summarizer.SYNC_MAX_CHARS + 1)
+    key = content_cache.summary_key(content_cache.sha256_text(text), text_summarizer.BEDROCK_MODEL_ID)
+    backend.store("out", key, b"earlier summary")
+    assert _post({"text": text}) == (200, {"summary": "earlier summary", "cached": True})
+    assert _messages(backend) == [] and invoker.calls == []
+
+def test_worker_runs_the_job_and_calls_back(aws, invoker):
+    backend, notified = aws
+    _, doc = _post({"text": "z " * 50, "callback_url": "https://example.com/hook"})
+    assert _deliver(backend) == []
+    status, done = _get(doc["job_id"])
+    assert status == 200 and done["status"] == "done" and done["summary"].startswith("summary of")
+    assert notified == [("https://example.com/hook", done)]
+    assert _deliver(backend) == [] and len(invoker.calls) == 1  # a redelivery only repeats the callback
+
+def test_failed_job_is_retried_then_marked_failed(aws, invoker):
+    backend, _ = aws
+    _, doc = _post({"text": "z " * 50, "async": True})
+    invoker.error = bedrock_client.Unavailable("throttled")
+    assert _deliver(backend, attempt=1) == [{"itemIdentifier": "m0"}]
+    assert _get(doc["job_id"])[1]["status"] == "running"
+    assert _deliver(backend, attempt=text_summarizer.JOB_MAX_ATTEMPTS) == []
+    failed = _get(doc["job_id"])[1]
+    assert failed["status"] == "failed" and failed["error"] == "throttled"
+
+def test_job_whose_workers_timed_out_is_marked_failed(aws, invoker):
+    backend, _ = aws
+    _, doc = _post({"text": "z " * 50, "async": True})
+    assert _deliver(backend, attempt=text_summarizer.JOB_MAX_ATTEMPTS + 1) == []
+    failed = _get(doc["job_id"])[1]
+    assert failed["status"] == "failed" and "Gave up" in failed["error"]
+    assert invoker.calls == []
+
+def test_bedrock_unavailable_is_503(aws, invoker):
+    invoker.error = bedrock_client.Unavailable("circuit open")
+    assert _post({"text": "hello"}) == (503, {"error": "circuit open"})
+
+def test_text_within_the_sync_limit_is_one_call(invoker):
+    text = "\n\n".join(["word " * 19] * (text_summarizer.SYNC_MAX_CHARS // 100))  # ~SYNC_MAX_CHARS, over one chunk
+    assert len(text) <= text_summarizer.SYNC_MAX_CHARS
+    assert mapreduce.estimate_tokens(text) > text_summarizer.SUMMARY_CHUNK_TOKENS
+    text_summarizer._summarize(text)
+    assert [i for i, _ in invoker.calls] == [text_summarizer.SUMMARY_INSTRUCTIONS]
+
+def test_longer_text_is_map_reduced(invoker):
+    text = "\n\n".join(["word " * 19] * (text_summarizer.SYNC_MAX_CHARS // 50))
+    text_summarizer._summarize(text)
+    chunks = mapreduce.split_chunks(text, text_summarizer.SUMMARY_CHUNK_TOKENS)
+    assert len(invoker.calls) == len(chunks) + 1 and len(chunks) > 1
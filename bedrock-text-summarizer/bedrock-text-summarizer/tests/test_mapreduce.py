@@ -0,0 +1,113 @@
+import random, threading, time
+
+import pytest
+
+import mapreduce
+
+def _text(pages, words_per_page, seed=3):
+    rng = random.Random(seed)
+    vocab = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu".split()
+    out = []
+    for _ in range(pages):
+        paragraphs = [" ".join(rng.choices(vocab, k=rng.randint(5, 40))) + "." for _ in range(words_per_page // 20)]
+        out.append("\n\n".join(paragraphs))
+    return "\f".join(out)
+
+@pytest.mark.parametrize("chunk_tokens", [1, 7, 50, 400, 4000])
+def test_chunks_fit_and_keep_every_word_in_order(chunk_tokens):
+    prose = _text(12, 300)
+    text = prose + "\f" + "x" * 5000  # plus one page with no boundary to cut on
+    chunks = mapreduce.split_chunks(text, chunk_tokens)
+    assert all(len(c) <= chunk_tokens * mapreduce.CHARS_PER_TOKEN for c in chunks)
+    assert "".join("".join(c.split()) for c in chunks) == "".join(text.split())
+    if chunk_tokens > 2:  # longer than any word, so words are never cut
+        assert " ".join(mapreduce.split_chunks(prose, chunk_tokens)).split() == prose.split()
+
+def test_chunks_prefer_page_boundaries():
+    pages = ["page %d " % i + "word " * 50 for i in range(6)]  # ~300 chars each
+    chunks = mapreduce.split_chunks("\f".join(pages), 160)  # two pages fit a chunk, three do not
+    assert len(chunks) == 3
+    assert [c.split("\f") for c in chunks] == [[pages[0].strip(), pages[1].strip()],
+                                                [pages[2].strip(), pages[3].strip()],
+                                                [pages[4].strip(), pages[5].strip()]]
+
+def test_empty_and_blank_text():
+    assert mapreduce.split_chunks("", 10) == []
+    assert mapreduce.map_reduce("\f \f\n", lambda c, p: 1 / 0, lambda s: 1 / 0) == ("", {"chunks": 0, "reduce_levels": 0})
+
+def test_single_chunk_is_one_call():
+    calls = []
+    summary, stats = mapreduce.map_reduce("short text", lambda c, p: calls.append((c, p)) or "S",
+                                          lambda s: pytest.fail("combine called"), chunk_tokens=100)
+    assert (summary, stats, calls) == ("S", {"chunks": 1, "reduce_levels": 0}, [("short text", None)])
+
+def test_parts_are_combined_in_text_order():
+    text = _text(20, 200)
+    chunks = mapreduce.split_chunks(text, 300)
+    combined = []
+
+    def summarize(chunk, part):
+        time.sleep(random.random() / 200)  # finish out of order
+        return f"[{part}]"
+
+    def combine(parts):
+        combined.append(parts)
+        return "".join(parts)
+
+    summary, stats = mapreduce.map_reduce(text, summarize, combine, chunk_tokens=300, workers=4)
+    assert stats == {"chunks": len(chunks), "reduce_levels": 1}
+    assert summary == "".join(f"[{i}]" for i in range(1, len(chunks) + 1))
+    assert len(combined) == 1
+
+def test_reduce_runs_in_levels_when_summaries_do_not_fit_one_call():
+    pages = ["page %d " % i + "word " * 35 for i in range(32)]  # one 50-token chunk each
+    combines = []
+
+    def combine(parts):
+        combines.append(len(parts))
+        return "c" * 40  # 10 tokens, so at most 5 fit one 50-token reduce call
+
+    summary, stats = mapreduce.map_reduce(pages, lambda c, p: "s" * 40, combine, chunk_tokens=50, workers=3)
+    assert summary == "c" * 40
+    assert stats["chunks"] == 32 and stats["reduce_levels"] >= 2
+    assert all(n >= 2 for n in combines)
+
+def test_backpressure_stops_reading_pages_while_the_pool_is_busy():
+    workers, gate, started = 2, threading.Event(), []
+    pulled = []
+
+    def pages():
+        for i in range(50):
+            pulled.append(i)
+            yield f"page {i} " + "word " * 30  # one chunk per page at 40 tokens
+
+    def summarize(chunk, part):
+        started.append(part)
+        gate.wait(5)
+        return str(part)
+
+    result = {}
+    runner = threading.Thread(target=lambda: result.update(out=mapreduce.map_reduce(
+        pages(), summarize, lambda s: ",".join(s), chunk_tokens=40, workers=workers)))
+    runner.start()
+    deadline = time.monotonic() + 5
+    while len(started) < workers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.2)  # time for the reader to run ahead if nothing held it back
+    in_flight = len(pulled)
+    gate.set()
+    runner.join(10)
+
+    # at most 2 * workers submitted chunks, plus the page that completes the next chunk
+    assert in_flight <= 2 * workers + 1
+    summary, stats = result["out"]
+    assert stats["chunks"] == 50 and summary == ",".join(str(i) for i in range(1, 51))
+
+def test_chunk_failure_propagates():
+    def summarize(chunk, part):
+        if part == 3:
+            raise RuntimeError("throttled")
+        return "ok"
+
+    with pytest.raises(RuntimeError, match="throttled"):
+        mapreduce.map_reduce(["a " * 100] * 6, summarize, "".join, chunk_tokens=50, workers=2)
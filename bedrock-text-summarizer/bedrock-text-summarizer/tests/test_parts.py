@@ -0,0 +1,79 @@
+import io, json
+
+import pytest
+
+import fakes, pdf_ingest, textract_postprocess as post
+from pypdf import PdfReader
+
+def _reader(pages):
+    return PdfReader(io.BytesIO(fakes.make_pdf([[f"page {i + 1} line"] * 3 for i in range(pages)])))
+
+@pytest.fixture
+def aws(monkeypatch, backend, invoker):
+    s3, textract = backend.client("s3"), backend.client("textract")
+    for module in (pdf_ingest, post):
+        monkeypatch.setattr(module, "s3", s3)
+        monkeypatch.setattr(module, "textract", textract)
+    monkeypatch.setattr(pdf_ingest, "SPLIT_PAGES", 2)
+    return backend
+
+def _manifests(backend):
+    return [key for (bucket, key) in backend.objects if bucket == "output" and key.endswith(".json")
+            and key.count("/") == 1 and key.startswith("manifests/")]
+
+def _job(backend, manifest_id, index):
+    return backend.job_tokens[f"part-{manifest_id}-{index:04d}"]
+
+def test_a_retried_fan_out_reuses_its_manifest_and_jobs(aws):
+    for _ in range(2):
+        pdf_ingest._fan_out(_reader(5), "input", "docs/big.pdf", "ab" * 32, '"etag"')
+    manifests = _manifests(aws)
+    assert len(manifests) == 1 and len(aws.jobs) == 3
+    manifest_id = manifests[0][len("manifests/"):-len(".json")]
+    assert post._PART_TAG.match(f"part-{manifest_id}-0000")
+    assert manifest_id == pdf_ingest._manifest_id("input", "docs/big.pdf", "ab" * 32, '"etag"')
+    assert manifest_id != pdf_ingest._manifest_id("input", "docs/other.pdf", "ab" * 32, '"etag"')
+
+def test_parts_already_extracted_get_no_new_job(aws):
+    pdf_ingest._fan_out(_reader(5), "input", "docs/big.pdf", None, '"etag"')
+    manifest_id = pdf_ingest._manifest_id("input", "docs/big.pdf", None, '"etag"')
+    post._process_part(_job(aws, manifest_id, 1), manifest_id, 1)
+    aws.job_tokens.clear()  # Textract has forgotten the request tokens
+    pdf_ingest._fan_out(_reader(5), "input", "docs/big.pdf", None, '"etag"')
+    assert len(aws.jobs) == 5 and set(aws.job_tokens) == {f"part-{manifest_id}-0000", f"part-{manifest_id}-0002"}
+
+def _pages(job_id):
+    return [post.page_store.page_text({"lines": lines}) for _, lines in post._iter_textract_pages(job_id)]
+
+def test_parts_finishing_out_of_order_are_assembled_in_page_order(aws, invoker):
+    pdf_ingest._fan_out(_reader(5), "input", "docs/big.pdf", None, '"etag"')
+    manifest_id = pdf_ingest._manifest_id("input", "docs/big.pdf", None, '"etag"')
+    jobs = [_job(aws, manifest_id, i) for i in range(3)]
+    assert post._process_part(jobs[2], manifest_id, 2)["parts_done"] == 1
+    assert post._process_part(jobs[2], manifest_id, 2)["parts_done"] == 1  # redelivered
+    assert post._process_part(jobs[0], manifest_id, 0)["parts_done"] == 2
+    assert not invoker.calls
+    result = post._process_part(jobs[1], manifest_id, 1)
+    assert result["summary_key"] == "summaries/big.summary.txt" and len(invoker.calls) >= 1
+    raw = aws.get("output", "extracted/big.txt")[0].decode("utf-8")
+    assert raw == "\f".join(_pages(jobs[0]) + _pages(jobs[1]) + _pages(jobs[2]))
+    index = json.loads(aws.get("output", post.page_store.index_key("big"))[0])
+    assert [page[0] for page in index["pages"]] == [1, 2, 3, 4, 5]  # renumbered from each part's first page
+    assert aws.get("output", "summaries/big.summary.txt")[1]["textract-job-id"] == f"parts-{manifest_id}"
+    # a late duplicate of any part finds the summary and stops
+    assert post._process_part(jobs[1], manifest_id, 1)["skipped"]
+
+def test_a_held_assembly_lock_sends_the_last_part_back_to_the_queue(aws, invoker):
+    pdf_ingest._fan_out(_reader(3), "input", "docs/big.pdf", None, '"etag"')
+    manifest_id = pdf_ingest._manifest_id("input", "docs/big.pdf", None, '"etag"')
+    post._process_part(_job(aws, manifest_id, 0), manifest_id, 0)
+    assert post._claim(f"manifests/{manifest_id}/assembling")
+    with pytest.raises(post.AssemblyPending):
+        post._process_part(_job(aws, manifest_id, 1), manifest_id, 1)
+    assert not invoker.calls and aws.get("output", "summaries/big.summary.txt") is None
+
+def test_claim_is_exclusive_until_the_lease_runs_out(monkeypatch, aws):
+    assert post._claim("manifests/m/assembling")
+    assert not post._claim("manifests/m/assembling")
+    monkeypatch.setattr(post, "ASSEMBLY_LEASE_SECONDS", -1)  # the holder died long ago
+    assert post._claim("manifests/m/assembling")
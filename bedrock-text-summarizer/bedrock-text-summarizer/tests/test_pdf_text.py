@@ -0,0 +1,63 @@
+import io, json
+
+import pytest
+from pypdf import PdfReader
+
+import fakes, pdf_ingest, pdf_text
+
+TEXT = ["The committee approved the annual budget after a short review."] * 3
+
+def _reader(pages):
+    """pages: True for a page with a text layer, False for an image-only one."""
+    return PdfReader(io.BytesIO(fakes.make_pdf([TEXT if text else [] for text in pages])))
+
+class CountingPages:
+    def __init__(self, reader):
+        self.reader, self.read = reader, 0
+
+    @property
+    def pages(self):
+        for page in self.reader.pages:
+            self.read += 1
+            yield page
+
+def test_pages_without_a_text_layer_are_left_for_ocr():
+    texts, ocr_pages = pdf_text.extract_pages(_reader([True, False, True, False]))
+    assert ocr_pages == [1, 3]
+    assert texts[1] == texts[3] == "" and "annual budget" in texts[0] and "annual budget" in texts[2]
+
+def test_extraction_stops_once_too_many_pages_need_ocr():
+    reader = CountingPages(_reader([True] + [False] * 20))
+    texts, ocr_pages = pdf_text.extract_pages(reader, max_ocr_pages=2)
+    assert ocr_pages == [1, 2, 3] and reader.read == 4
+    assert len(pdf_text.extract_pages(_reader([True] * 3 + [False] * 2), max_ocr_pages=2)[0]) == 5
+
+@pytest.fixture
+def aws(monkeypatch, backend):
+    s3, textract, sqs = backend.client("s3"), backend.client("textract"), backend.client("sqs")
+    monkeypatch.setattr(pdf_ingest, "s3", s3)
+    monkeypatch.setattr(pdf_ingest, "textract", textract)
+    monkeypatch.setattr(pdf_ingest, "sqs", sqs)
+    monkeypatch.setattr(pdf_ingest, "QUEUE_URL", "https://sqs.example/textract-results")
+    monkeypatch.setattr(pdf_ingest, "TEXT_LAYER_MAX_OCR_PAGES", 2)
+    return backend
+
+def test_a_few_image_only_pages_are_ocrd_in_place(aws):
+    assert pdf_ingest._text_layer(_reader([True, False, True]), "input", "docs/memo.pdf", "ab" * 32)
+    pages = aws.get("output", "extracted/memo.txt")[0].decode("utf-8").split("\f")
+    assert len(pages) == 3 and "annual budget" in pages[0] and pages[1] and "annual budget" not in pages[1]
+    assert aws.stats["textract.DetectDocumentText"] == 1
+    message = json.loads(aws.queue(pdf_ingest.QUEUE_URL).ready[0]["body"])
+    assert message["ExtractedKey"] == "extracted/memo.txt" and message["JobTag"] == "ab" * 32
+
+def test_a_scanned_pdf_goes_to_textract_without_ocr_or_output(aws):
+    assert not pdf_ingest._text_layer(_reader([False] * 10), "input", "docs/scan.pdf", "ab" * 32)
+    assert aws.stats["textract.DetectDocumentText"] == 0 and aws.get("output", "extracted/scan.txt") is None
+
+def test_pdfs_over_the_local_limit_are_not_downloaded(monkeypatch, aws):
+    aws.store("input", "docs/huge.pdf", fakes.make_pdf([TEXT]))
+    monkeypatch.setattr(pdf_ingest, "_open_pdf", lambda path, key: pytest.fail("parsed locally"))
+    size = int((pdf_ingest.LOCAL_PDF_MAX_MB + 1) * 1024 * 1024)
+    pdf_ingest.lambda_handler({"Records": [{"s3": {"bucket": {"name": "input"},
+                                                   "object": {"key": "docs/huge.pdf", "size": size}}}]}, None)
+    assert aws.stats["textract.StartDocumentTextDetection"] == 1
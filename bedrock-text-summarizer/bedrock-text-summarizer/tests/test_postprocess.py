@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+import textract_postprocess as post
+
+@pytest.fixture
+def aws(monkeypatch, backend, invoker):
+    monkeypatch.setattr(post, "s3", backend.client("s3"))
+    monkeypatch.setattr(post, "textract", backend.client("textract"))
+    return backend
+
+def _record(message_id, job_id, document, status="SUCCEEDED", **extra):
+    message = dict({"JobId": job_id, "Status": status, "API": "StartDocumentTextDetection",
+                    "DocumentLocation": {"S3ObjectName": document, "S3Bucket": "input"}}, **extra)
+    return {"messageId": message_id, "body": json.dumps(message)}
+
+def _handle(*records):
+    return post.lambda_handler({"Records": list(records)}, None)
+
+def test_only_the_failed_records_go_back_to_the_queue(aws, invoker):
+    aws.jobs["job-a"] = aws.jobs["job-b"] = 3
+    resp = _handle(_record("m1", "job-a", "docs/a.pdf"),
+                   _record("m2", "job-x", "docs/x.pdf", ExtractedKey="extracted/missing.txt"),
+                   _record("m3", "job-c", "docs/c.pdf", status="FAILED"),
+                   _record("m4", "job-b", "docs/b.pdf"))
+    assert resp["batchItemFailures"] == [{"itemIdentifier": "m2"}]
+    assert [r["summary_key"] for r in json.loads(resp["body"])["results"]] == \
+        ["summaries/a.summary.txt", "summaries/b.summary.txt"]
+    assert aws.get("output", "summaries/c.summary.txt") is None
+
+def test_a_redelivered_job_is_skipped_but_a_new_job_for_the_document_is_not(aws, invoker):
+    aws.jobs["job-a"] = aws.jobs["job-a2"] = 2
+    assert "skipped" not in _handle(_record("m1", "job-a", "docs/a.pdf"))["body"]
+    calls = len(invoker.calls)
+    result = json.loads(_handle(_record("m1", "job-a", "docs/a.pdf"))["body"])["results"][0]
+    assert result["skipped"] and len(invoker.calls) == calls
+    assert aws.get("output", "summaries/a.summary.txt")[1] == {"textract-job-id": "job-a"}
+    # the same document uploaded again gets a new Textract job, which is summarized again
+    result = json.loads(_handle(_record("m2", "job-a2", "docs/a.pdf"))["body"])["results"][0]
+    assert "skipped" not in result and len(invoker.calls) > calls
+    assert aws.get("output", "summaries/a.summary.txt")[1] == {"textract-job-id": "job-a2"}
+
+def test_large_text_is_uploaded_in_parts(monkeypatch, aws):
+    monkeypatch.setattr(post._S3Writer, "PART_SIZE", 100)
+    writer = post._S3Writer("output", "extracted/big.txt")
+    for i in range(30):
+        writer.write(f"line {i:03d}\n")
+    writer.close()
+    assert aws.stats["s3.UploadPart"] == 3 and aws.stats["s3.PutObject"] == 0
+    assert aws.get("output", "extracted/big.txt")[0] == "".join(f"line {i:03d}\n" for i in range(30)).encode()
+
+def test_an_aborted_writer_leaves_no_object_or_pending_upload(monkeypatch, aws):
+    monkeypatch.setattr(post._S3Writer, "PART_SIZE", 100)
+    writer = post._S3Writer("output", "extracted/big.txt")
+    writer.write("x" * 250)
+    assert aws.uploads
+    writer.abort()
+    assert not aws.uploads and aws.get("output", "extracted/big.txt") is None
+
+def test_a_failed_summary_aborts_the_raw_text_and_page_store_uploads(monkeypatch, aws, invoker):
+    monkeypatch.setattr(post._S3Writer, "PART_SIZE", 100)
+    aws.jobs["job-a"] = 3
+    invoker.error = RuntimeError("model unavailable")
+    assert _handle(_record("m1", "job-a", "docs/a.pdf"))["batchItemFailures"] == [{"itemIdentifier": "m1"}]
+    assert aws.stats["s3.AbortMultipartUpload"] == 2 and not aws.uploads
+    assert not [key for (bucket, key) in aws.objects if bucket == "output"]
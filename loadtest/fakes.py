@@ -0,0 +1,612 @@
+"""
+In-process stand-ins for the AWS services the Lambdas call (S3, SQS, Textract and the
+Bedrock runtime), so the handlers can be load tested without an AWS account.
+
+`Backend.install()` replaces `boto3.client`, so it has to run before the Lambda modules
+are imported (they create their clients at import time). Every fake call:
+
+- sleeps for a latency drawn from the service's profile (lognormal from a median and a
+  p99, multiplied by `time_scale` so long runs can be compressed);
+- fails with the service's throttling error with probability `throttle`, or with a 5xx
+  with probability `error`;
+- is retried the way the client's botocore Config asks (legacy, standard or adaptive
+  mode, `max_attempts` / `total_max_attempts`, jittered exponential backoff capped at
+  20 s). Adaptive mode's client-side send-rate limiting is not modelled.
+
+Bedrock answers are synthetic text of min(maxTokens, output_tokens) tokens, with a
+time-to-first-token from the latency profile plus `token_ms` per output token (streamed
+responses pace their deltas the same way). Textract jobs finish after their latency
+plus `page_seconds` per page and publish the usual completion message to the SQS queues
+subscribed to the job's SNS topic.
+"""
+import datetime, hashlib, io, json, math, random, re, threading, time, uuid
+from collections import Counter, deque
+
+import boto3
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+THROTTLE = {"s3": ("SlowDown", 503), "sqs": ("RequestThrottled", 403),
+            "textract": ("ProvisionedThroughputExceededException", 400),
+            "bedrock-runtime": ("ThrottlingException", 429)}
+FAILURE = {"s3": ("InternalError", 500), "sqs": ("InternalError", 500),
+           "textract": ("InternalServerError", 500),
+           "bedrock-runtime": ("ServiceUnavailableException", 503)}
+_RETRYABLE = {code for code, _ in THROTTLE.values()} | {"RequestTimeout", "RequestTimeoutException",
+                                                        "ModelNotReadyException"}
+_Z99 = 2.3263  # standard normal 99th percentile
+
+_WORDS = ("account agreement annual approval audit balance board budget clause committee contract "
+          "customer deadline delivery department estimate finance forecast invoice meeting members "
+          "milestone notice payment policy project proposal quarter receipt report revenue review "
+          "risk schedule section shipment supplier team terms vendor warranty").split()
+
+def client_error(service, code, status, operation):
+    return ClientError({"Error": {"Code": code, "Message": f"Injected by the load test ({service})"},
+                        "ResponseMetadata": {"HTTPStatusCode": status}}, operation)
+
+def sentence(rng, words=12):
+    text = " ".join(rng.choice(_WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+class Latency:
+    """Lognormal latency in ms from its median and p99 (p99 <= median means fixed)."""
+
+    def __init__(self, median_ms, p99_ms=None):
+        self.median = float(median_ms)
+        p99 = float(p99_ms if p99_ms is not None else median_ms)
+        self.sigma = math.log(p99 / self.median) / _Z99 if p99 > self.median > 0 else 0.0
+
+    @classmethod
+    def parse(cls, spec):
+        """"800" or "800:3000" (median:p99 in ms)."""
+        median, _, p99 = str(spec).partition(":")
+        return cls(median, p99 or None)
+
+    def sample(self, rng) -> float:
+        if self.sigma:
+            return self.median * math.exp(self.sigma * rng.gauss(0.0, 1.0))
+        return self.median
+
+    def __repr__(self):
+        return f"{self.median:g}:{self.median * math.exp(self.sigma * _Z99):g}"
+
+class Profile:
+    def __init__(self, latency, throttle=0.0, error=0.0):
+        self.latency = latency if isinstance(latency, Latency) else Latency.parse(latency)
+        self.throttle = float(throttle)
+        self.error = float(error)
+
+    def to_dict(self):
+        return {"latency_ms": repr(self.latency), "throttle": self.throttle, "error": self.error}
+
+def default_profiles():
+    return {
+        "s3": Profile("15:80"),
+        "sqs": Profile("8:40"),
+        "textract": Profile("250:1200"),   # API calls; jobs take job_latency + page_seconds per page
+        "bedrock-runtime": Profile("600:2500"),  # time to first token
+    }
+
+class Backend:
+    """Shared state behind every fake client: objects, queues, Textract jobs and counters."""
+
+    def __init__(self, profiles=None, time_scale=1.0, seed=7, token_ms=12.0, output_tokens=250,
+                 job_latency="4000:15000", page_seconds=0.3, job_failure=0.0):
+        self.profiles = dict(default_profiles(), **(profiles or {}))
+        self.time_scale = time_scale
+        self.token_ms = token_ms
+        self.output_tokens = output_tokens
+        self.job_latency = job_latency if isinstance(job_latency, Latency) else Latency.parse(job_latency)
+        self.page_seconds = page_seconds
+        self.job_failure = job_failure
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self.object_calls = Counter()  # (S3 operation, key) -> reads of that object
+        self.objects = {}  # (bucket, key) -> (body, metadata, last modified, etag)
+        self.uploads = {}
+        self.queues = {}
+        self.topics = {}  # SNS topic ARN -> [queue URL]
+        self.jobs = {}
+        self.job_tokens = {}  # Textract ClientRequestToken -> JobId
+        self.put_listeners = []
+        self.prefixes = set()  # Bedrock prompt-cache prefixes seen
+        self._real_client = None
+
+    # --- plumbing ---
+
+    def random(self):
+        with self.lock:
+            return self.rng.random()
+
+    def sample(self, latency) -> float:
+        with self.lock:
+            return latency.sample(self.rng)
+
+    def sleep(self, ms):
+        if ms > 0 and self.time_scale > 0:
+            time.sleep(ms * self.time_scale / 1000.0)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.stats[name] += value
+
+    def install(self):
+        """Route boto3.client() to the fakes; returns a function that undoes it."""
+        self._real_client = boto3.client
+        boto3.client = self.client
+        return self.uninstall
+
+    def uninstall(self):
+        if self._real_client:
+            boto3.client, self._real_client = self._real_client, None
+
+    def client(self, service_name, region_name=None, config=None, **kwargs):
+        classes = {"s3": S3, "sqs": SQS, "textract": Textract, "bedrock-runtime": BedrockRuntime}
+        if service_name not in classes:
+            raise ValueError(f"No fake for the {service_name} service")
+        return classes[service_name](self, config)
+
+    def queue(self, url) -> "Queue":
+        with self.lock:
+            if url not in self.queues:
+                self.queues[url] = Queue(url)
+            return self.queues[url]
+
+    def subscribe(self, topic_arn, queue_url):
+        """SNS topic -> SQS queue with raw message delivery."""
+        self.topics.setdefault(topic_arn, []).append(queue_url)
+
+    def publish(self, topic_arn, message: str):
+        self.count("sns.Publish")
+        for url in self.topics.get(topic_arn, []):
+            self.queue(url).send(message)
+
+    def on_put(self, listener):
+        """listener(bucket, key) after every stored object (put, copy or completed upload)."""
+        self.put_listeners.append(listener)
+
+    # --- S3 storage ---
+
+    def store(self, bucket, key, body, metadata=None, check=None):
+        """Store an object; check(current entry or None) may raise to reject the write."""
+        if hasattr(body, "read"):
+            body = body.read()
+        body = body.encode("utf-8") if isinstance(body, str) else bytes(body)
+        entry = (body, dict(metadata or {}), datetime.datetime.now(datetime.timezone.utc),
+                 '"%s"' % hashlib.md5(body).hexdigest())
+        with self.lock:
+            if check:
+                check(self.objects.get((bucket, key)))
+            self.objects[(bucket, key)] = entry
+        for listener in self.put_listeners:
+            listener(bucket, key)
+        return entry
+
+    def get(self, bucket, key):
+        with self.lock:
+            return self.objects.get((bucket, key))
+
+class Queue:
+    """An SQS queue: at-least-once delivery, visibility timeout, receive counts."""
+
+    def __init__(self, url):
+        self.url = url
+        self.cond = threading.Condition()
+        self.ready = deque()
+        self.delayed = []  # (visible at, message)
+        self.in_flight = 0
+        self.sent = 0
+
+    def send(self, body):
+        message = {"messageId": str(uuid.uuid4()), "body": body, "receive_count": 0,
+                   "sent": time.time()}
+        with self.cond:
+            self.ready.append(message)
+            self.sent += 1
+            self.cond.notify()
+        return message["messageId"]
+
+    def _promote(self):
+        now = time.monotonic()
+        due = [m for at, m in self.delayed if at <= now]
+        if due:
+            self.delayed = [(at, m) for at, m in self.delayed if at > now]
+            self.ready.extend(due)
+
+    def receive(self, max_messages=10, wait=0.5):
+        """Up to max_messages visible messages, waiting up to `wait` seconds for the first."""
+        deadline = time.monotonic() + wait
+        with self.cond:
+            while True:
+                self._promote()
+                if self.ready:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                if self.delayed:
+                    remaining = min(remaining, max(0.001, min(at for at, _ in self.delayed) - time.monotonic()))
+                self.cond.wait(remaining)
+            batch = []
+            while self.ready and len(batch) < max_messages:
+                message = self.ready.popleft()
+                message["receive_count"] += 1
+                batch.append(message)
+            self.in_flight += len(batch)
+            return batch
+
+    def done(self, message):
+        with self.cond:
+            self.in_flight -= 1
+
+    def retry(self, message, visibility_seconds):
+        """The message was not deleted: it comes back after the visibility timeout."""
+        with self.cond:
+            self.in_flight -= 1
+            self.delayed.append((time.monotonic() + visibility_seconds, message))
+            self.cond.notify()
+
+    def pending(self) -> int:
+        with self.cond:
+            return len(self.ready) + len(self.delayed) + self.in_flight
+
+class _Client:
+    service = ""
+
+    def __init__(self, backend, config=None):
+        self.backend = backend
+        self.profile = backend.profiles[self.service]
+        retries = (getattr(config, "retries", None) or {}) if config is not None else {}
+        self.mode = retries.get("mode", "legacy")
+        if "total_max_attempts" in retries:
+            self.attempts = retries["total_max_attempts"]
+        elif "max_attempts" in retries:
+            self.attempts = retries["max_attempts"] + 1
+        else:
+            self.attempts = 5 if self.mode == "legacy" else 3
+
+    def _inject(self, operation):
+        """One attempt's latency and injected failure (throttles fail fast, errors after the latency)."""
+        backend = self.backend
+        backend.count(f"{self.service}.{operation}")
+        roll = backend.random()
+        if roll < self.profile.throttle:
+            backend.count(f"{self.service}.throttled")
+            code, status = THROTTLE[self.service]
+            raise client_error(self.service, code, status, operation)
+        backend.sleep(backend.sample(self.profile.latency))
+        if roll < self.profile.throttle + self.profile.error:
+            backend.count(f"{self.service}.failed")
+            code, status = FAILURE[self.service]
+            raise client_error(self.service, code, status, operation)
+
+    def _call(self, operation, fn=None):
+        for attempt in range(1, self.attempts + 1):
+            try:
+                self._inject(operation)
+                return fn() if fn else None
+            except ClientError as e:
+                error = e.response.get("Error", {})
+                status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+                if attempt == self.attempts or not (error.get("Code") in _RETRYABLE or status >= 500):
+                    raise
+                self.backend.count(f"{self.service}.retries")
+                self.backend.sleep(min(20.0, self.backend.random() * 2 ** attempt) * 1000.0)
+
+def _missing(code, operation):
+    return ClientError({"Error": {"Code": code, "Message": "Not Found"},
+                        "ResponseMetadata": {"HTTPStatusCode": 404}}, operation)
+
+class S3(_Client):
+    service = "s3"
+
+    def put_object(self, Bucket, Key, Body=b"", Metadata=None, IfNoneMatch=None, IfMatch=None, **kwargs):
+        def check(current):
+            if (IfNoneMatch == "*" and current) or (IfMatch and (not current or current[3] != IfMatch)):
+                raise ClientError({"Error": {"Code": "PreconditionFailed"},
+                                   "ResponseMetadata": {"HTTPStatusCode": 412}}, "PutObject")
+
+        def put():
+            return {"ETag": self.backend.store(Bucket, Key, Body, Metadata, check)[3]}
+        return self._call("PutObject", put)
+
+    def _entry(self, Bucket, Key, operation, code):
+        with self.backend.lock:
+            self.backend.object_calls[operation, Key] += 1
+        entry = self.backend.get(Bucket, Key)
+        if entry is None:
+            raise _missing(code, operation)
+        return entry
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        def get():
+            body, metadata, modified, etag = self._entry(Bucket, Key, "GetObject", "NoSuchKey")
+            if Range:
+                first, _, last = Range[len("bytes="):].partition("-")
+                body = body[int(first):int(last) + 1 if last else None]
+            return {"Body": StreamingBody(io.BytesIO(body), len(body)), "ContentLength": len(body),
+                    "Metadata": metadata, "LastModified": modified, "ETag": etag}
+        return self._call("GetObject", get)
+
+    def head_object(self, Bucket, Key, **kwargs):
+        def head():
+            body, metadata, modified, etag = self._entry(Bucket, Key, "HeadObject", "404")
+            return {"ContentLength": len(body), "Metadata": metadata, "LastModified": modified, "ETag": etag}
+        return self._call("HeadObject", head)
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        body = self._call("GetObject", lambda: self._entry(Bucket, Key, "GetObject", "404")[0])
+        with open(Filename, "wb") as f:
+            f.write(body)
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        def copy():
+            body, metadata, _, _ = self._entry(CopySource["Bucket"], CopySource["Key"], "CopyObject", "NoSuchKey")
+            return {"CopyObjectResult": {"ETag": self.backend.store(Bucket, Key, body, metadata)[3]}}
+        return self._call("CopyObject", copy)
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        def delete():
+            with self.backend.lock:
+                self.backend.objects.pop((Bucket, Key), None)
+            return {}
+        return self._call("DeleteObject", delete)
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        def create():
+            upload_id = uuid.uuid4().hex
+            with self.backend.lock:
+                self.backend.uploads[upload_id] = {}
+            return {"UploadId": upload_id, "Bucket": Bucket, "Key": Key}
+        return self._call("CreateMultipartUpload", create)
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        def upload():
+            data = Body.read() if hasattr(Body, "read") else bytes(Body)
+            with self.backend.lock:
+                self.backend.uploads[UploadId][PartNumber] = data
+            return {"ETag": '"%s"' % hashlib.md5(data).hexdigest()}
+        return self._call("UploadPart", upload)
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        def complete():
+            with self.backend.lock:
+                parts = self.backend.uploads.pop(UploadId)
+            body = b"".join(parts[p["PartNumber"]] for p in MultipartUpload["Parts"])
+            return {"ETag": self.backend.store(Bucket, Key, body)[3]}
+        return self._call("CompleteMultipartUpload", complete)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        with self.backend.lock:
+            self.backend.uploads.pop(UploadId, None)
+        return self._call("AbortMultipartUpload")
+
+    def list_objects_v2(self, Bucket, Prefix="", **kwargs):
+        def list_():
+            with self.backend.lock:
+                keys = sorted((k, len(v[0])) for (b, k), v in self.backend.objects.items()
+                              if b == Bucket and k.startswith(Prefix))
+            return {"Contents": [{"Key": k, "Size": size} for k, size in keys], "KeyCount": len(keys),
+                    "IsTruncated": False}
+        return self._call("ListObjectsV2", list_)
+
+    def get_paginator(self, operation_name):
+        if operation_name != "list_objects_v2":
+            raise ValueError(f"No fake paginator for {operation_name}")
+        client = self
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                yield client.list_objects_v2(**kwargs)
+        return Paginator()
+
+class SQS(_Client):
+    service = "sqs"
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        return self._call("SendMessage", lambda: {"MessageId": self.backend.queue(QueueUrl).send(MessageBody)})
+
+    def send_message_batch(self, QueueUrl, Entries, **kwargs):
+        def send():
+            queue = self.backend.queue(QueueUrl)
+            return {"Successful": [{"Id": e["Id"], "MessageId": queue.send(e["MessageBody"])} for e in Entries],
+                    "Failed": []}
+        return self._call("SendMessageBatch", send)
+
+def make_pdf(pages):
+    """A minimal uncompressed PDF; pages are lists of text lines, an empty page has no text layer."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>",
+               "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages))), len(pages))]
+    font = 3 + 2 * len(pages)
+    for i, lines in enumerate(pages):
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+                       f"/Resources << /Font << /F1 {font} 0 R >> >> >>")
+        text = " ".join("(%s) Tj T*" % line.replace("\\", "").replace("(", "").replace(")", "") for line in lines)
+        stream = f"BT /F1 10 Tf 50 750 Td 12 TL {text} ET" if lines else ""
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for n, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{n} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{o:010d} 00000 n \n".encode() for o in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+def page_count(pdf: bytes) -> int:
+    """Pages in an uncompressed PDF (what the load test uploads); 1 when it can't tell."""
+    return max(1, len(re.findall(rb"/Type\s*/Page(?![s\w])", pdf)))
+
+class Textract(_Client):
+    service = "textract"
+    LINES_PER_PAGE = 30
+    MAX_RESULTS = 1000
+
+    def start_document_text_detection(self, DocumentLocation, NotificationChannel=None, JobTag=None,
+                                      ClientRequestToken=None, **kwargs):
+        def start():
+            with self.backend.lock:
+                job_id = self.backend.job_tokens.get(ClientRequestToken)
+            if job_id:  # idempotent start: the job this token already started
+                return {"JobId": job_id}
+            location = DocumentLocation["S3Object"]
+            entry = self.backend.get(location["Bucket"], location["Name"])
+            if entry is None:
+                raise ClientError({"Error": {"Code": "InvalidS3ObjectException"},
+                                   "ResponseMetadata": {"HTTPStatusCode": 400}}, "StartDocumentTextDetection")
+            job_id = uuid.uuid4().hex
+            pages = page_count(entry[0])
+            with self.backend.lock:
+                self.backend.jobs[job_id] = pages
+                if ClientRequestToken:
+                    self.backend.job_tokens[ClientRequestToken] = job_id
+            seconds = self.backend.sample(self.backend.job_latency) / 1000.0 + pages * self.backend.page_seconds
+            message = {"JobId": job_id, "API": "StartDocumentTextDetection", "JobTag": JobTag,
+                       "DocumentLocation": {"S3ObjectName": location["Name"], "S3Bucket": location["Bucket"]}}
+            topic = (NotificationChannel or {}).get("SNSTopicArn")
+            timer = threading.Timer(seconds * self.backend.time_scale, self._finish, (topic, message))
+            timer.daemon = True
+            timer.start()
+            return {"JobId": job_id}
+        return self._call("StartDocumentTextDetection", start)
+
+    def _finish(self, topic, message):
+        failed = self.backend.random() < self.backend.job_failure
+        self.backend.count("textract.jobs_failed" if failed else "textract.jobs")
+        message = dict(message, Status="FAILED" if failed else "SUCCEEDED", Timestamp=int(time.time() * 1000))
+        if topic:
+            self.backend.publish(topic, json.dumps(message))
+
+    def _lines(self, seed, page):
+        rng = random.Random(f"{seed}:{page}")
+        return [{"BlockType": "LINE", "Page": page, "Text": sentence(rng, rng.randint(4, 14)),
+                 "Confidence": 90 + 10 * rng.random(),
+                 "Geometry": {"BoundingBox": {"Left": 0.1, "Top": 0.03 * i, "Width": 0.8, "Height": 0.02}}}
+                for i in range(self.LINES_PER_PAGE)]
+
+    def get_document_text_detection(self, JobId, NextToken=None, MaxResults=None, **kwargs):
+        def get():
+            with self.backend.lock:
+                pages = self.backend.jobs.get(JobId)
+            if pages is None:  # a recorded completion replayed without its job: make one up
+                pages = 1 + int(hashlib.sha256(JobId.encode()).hexdigest(), 16) % 20
+            per_response = max(1, (MaxResults or self.MAX_RESULTS) // (self.LINES_PER_PAGE + 1))
+            first = int(NextToken or 1)
+            last = min(pages, first + per_response - 1)
+            blocks = []
+            for page in range(first, last + 1):
+                blocks.append({"BlockType": "PAGE", "Page": page})
+                blocks.extend(self._lines(JobId, page))
+            resp = {"JobStatus": "SUCCEEDED", "DocumentMetadata": {"Pages": pages}, "Blocks": blocks}
+            if last < pages:
+                resp["NextToken"] = str(last + 1)
+            return resp
+        return self._call("GetDocumentTextDetection", get)
+
+    def detect_document_text(self, Document, **kwargs):
+        def detect():
+            seed = hashlib.sha256(Document.get("Bytes", b"")).hexdigest()
+            return {"DocumentMetadata": {"Pages": 1}, "Blocks": [{"BlockType": "PAGE", "Page": 1}] + self._lines(seed, 1)}
+        return self._call("DetectDocumentText", detect)
+
+class BedrockRuntime(_Client):
+    service = "bedrock-runtime"
+    CHARS_PER_TOKEN = 4
+
+    def _generate(self, prompt_chars, max_tokens, seed):
+        """(text, input tokens, output tokens) for a synthetic answer."""
+        rng = random.Random(seed)
+        output_tokens = max(1, min(int(max_tokens or self.backend.output_tokens), self.backend.output_tokens))
+        words = []
+        while sum(len(w) + 1 for w in words) < output_tokens * self.CHARS_PER_TOKEN:
+            words.append(rng.choice(_WORDS))
+        return " ".join(words), max(1, prompt_chars // self.CHARS_PER_TOKEN), output_tokens
+
+    def _prompt_cache(self, kwargs):
+        """Tokens before the last cache point: written the first time, read afterwards."""
+        blocks = kwargs.get("system", []) + [b for m in kwargs.get("messages", []) for b in m.get("content", [])]
+        cut = max((i for i, b in enumerate(blocks) if "cachePoint" in b), default=None)
+        if cut is None:
+            return 0, 0
+        prefix = json.dumps([kwargs.get("modelId"), blocks[:cut]])
+        tokens = len(prefix) // self.CHARS_PER_TOKEN
+        with self.backend.lock:
+            seen = prefix in self.backend.prefixes
+            self.backend.prefixes.add(prefix)
+        return (tokens, 0) if seen else (0, tokens)
+
+    def _converse(self, kwargs):
+        prompt = json.dumps([kwargs.get("system", []), kwargs.get("messages", [])])
+        text, input_tokens, output_tokens = self._generate(
+            len(prompt), kwargs.get("inferenceConfig", {}).get("maxTokens"), prompt)
+        read, write = self._prompt_cache(kwargs)
+        usage = {"inputTokens": input_tokens, "outputTokens": output_tokens,
+                 "totalTokens": input_tokens + output_tokens}
+        if read or write:
+            usage.update(cacheReadInputTokens=read, cacheWriteInputTokens=write)
+        self.backend.count("bedrock-runtime.input_tokens", input_tokens)
+        self.backend.count("bedrock-runtime.output_tokens", output_tokens)
+        return text, usage
+
+    def _chunks(self, text, tokens_per_chunk=8):
+        step = tokens_per_chunk * self.CHARS_PER_TOKEN
+        for i in range(0, len(text), step):
+            self.backend.sleep(self.backend.token_ms * tokens_per_chunk)
+            yield text[i:i + step]
+
+    def converse(self, **kwargs):
+        def converse():
+            text, usage = self._converse(kwargs)
+            self.backend.sleep(self.backend.token_ms * usage["outputTokens"])
+            return {"output": {"message": {"role": "assistant", "content": [{"text": text}]}},
+                    "stopReason": "end_turn", "usage": usage, "metrics": {"latencyMs": 0}}
+        return self._call("Converse", converse)
+
+    def converse_stream(self, **kwargs):
+        def converse_stream():
+            text, usage = self._converse(kwargs)
+
+            def events():
+                yield {"messageStart": {"role": "assistant"}}
+                for chunk in self._chunks(text):
+                    yield {"contentBlockDelta": {"contentBlockIndex": 0, "delta": {"text": chunk}}}
+                yield {"contentBlockStop": {"contentBlockIndex": 0}}
+                yield {"messageStop": {"stopReason": "end_turn"}}
+                yield {"metadata": {"usage": usage, "metrics": {"latencyMs": 0}}}
+            return {"stream": events()}
+        return self._call("ConverseStream", converse_stream)
+
+    def _anthropic(self, kwargs):
+        body = json.loads(kwargs["body"])
+        text, input_tokens, output_tokens = self._generate(len(kwargs["body"]), body.get("max_tokens"), kwargs["body"])
+        self.backend.count("bedrock-runtime.input_tokens", input_tokens)
+        self.backend.count("bedrock-runtime.output_tokens", output_tokens)
+        return text, {"input_tokens": input_tokens, "output_tokens": output_tokens}
+
+    def invoke_model(self, **kwargs):
+        def invoke():
+            text, usage = self._anthropic(kwargs)
+            self.backend.sleep(self.backend.token_ms * usage["output_tokens"])
+            payload = json.dumps({"type": "message", "role": "assistant", "content": [{"type": "text", "text": text}],
+                                  "stop_reason": "end_turn", "usage": usage}).encode("utf-8")
+            return {"body": StreamingBody(io.BytesIO(payload), len(payload)), "contentType": "application/json"}
+        return self._call("InvokeModel", invoke)
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        def invoke():
+            text, usage = self._anthropic(kwargs)
+
+            def events():
+                def chunk(payload):
+                    return {"chunk": {"bytes": json.dumps(payload).encode("utf-8")}}
+                yield chunk({"type": "message_start", "message": {"usage": {"input_tokens": usage["input_tokens"]}}})
+                for part in self._chunks(text):
+                    yield chunk({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": part}})
+                yield chunk({"type": "message_delta", "usage": {"output_tokens": usage["output_tokens"]}})
+                yield chunk({"type": "message_stop"})
+            return {"body": events(), "contentType": "application/json"}
+        return self._call("InvokeModelWithResponseStream", invoke)
@@ -0,0 +1,570 @@
+"""
+Load replay for the Lambdas against the in-process AWS fakes in fakes.py; no AWS account
+or credentials are needed.
+
+Usage:
+  python loadtest/replay.py faq --requests 2000 --concurrency 32
+  python loadtest/replay.py summarize --requests 300 --rate 5 --time-scale 0.1
+  python loadtest/replay.py pdf --requests 50 --throttle bedrock=0.05 --errors s3=0.01 --out pdf.json
+  python loadtest/replay.py faq --events recorded.jsonl --speed 4
+
+Targets:
+  faq        POST /ask (optionally streamed, or /ask/batch) into qna.lambda_handler.
+  summarize  POST /summarize into text_summarizer.lambda_handler. Queued jobs are worked
+             by text_summarizer.job_handler from the job queue, then polled with
+             GET /summarize/{job_id}.
+  pdf        S3 ObjectCreated events into pdf_ingest.lambda_handler. Textract completions
+             and text-layer messages reach textract_postprocess.lambda_handler over SQS.
+
+Events are synthetic (seeded) unless --events names a JSON-lines file of recorded API
+Gateway, S3 or SQS events, one per line, either bare or as {"offset": <seconds since the
+first event>, "event": {...}}. SQS events go straight to the queue's handler. For S3
+events whose object is missing, a synthetic PDF is uploaded first.
+
+Load is closed-loop on --concurrency threads by default. With --rate (Poisson arrivals)
+or recorded offsets it is open-loop, and latency counts from the scheduled arrival, so
+time spent queued behind busy workers is not hidden. SQS queues are drained by --workers
+concurrent invocations of up to --batch-size records. Records reported in
+batchItemFailures, or a whole batch whose handler raised, come back after
+--visibility-timeout and are dead-lettered after --max-receive deliveries.
+
+Every handler runs in this process, so module state (FAQ index, answer cache, Bedrock
+limiter and circuit breaker) is shared as if one warm container served all concurrent
+requests. All simulated waits, including backoff, Textract jobs and visibility timeouts,
+are multiplied by --time-scale. Reported latencies are measured wall time, so only
+compare runs made with the same scale.
+
+The report gives, per stage: count, throughput, p50/p95/p99/max latency in ms and error
+rate. Errors are exceptions, 5xx responses and failed SQS records. The report also gives
+the fake services' call, throttle, failure and retry counters. --out writes it as JSON.
+"""
+import argparse, json, logging, math, os, pathlib, random, subprocess, sys, threading, time, uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import fakes
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+FAQ_BOT = ROOT / "bedrock-faq-bot" / "bedrock-faq-bot"
+SUMMARIZER = ROOT / "bedrock-text-summarizer" / "bedrock-text-summarizer"
+SHARED = ROOT / "shared"  # bedrock_client and metrics, a Lambda layer in deployments
+
+ACCOUNT = "000000000000"
+REGION = "us-east-1"
+_QUEUE_URL = f"https://sqs.{REGION}.amazonaws.com/{ACCOUNT}/"
+ENV = {
+    "faq": {"FAQ_BUCKET": "loadtest-faq"},
+    "summarize": {"JOB_QUEUE_URL": _QUEUE_URL + "summarize-jobs", "JOB_BUCKET": "loadtest-output",
+                  "SUMMARY_CACHE_BUCKET": "loadtest-output"},
+    "pdf": {"INPUT_BUCKET": "loadtest-input", "OUTPUT_BUCKET": "loadtest-output",
+            "QUEUE_URL": _QUEUE_URL + "textract-results",
+            "SNS_TOPIC_ARN": f"arn:aws:sns:{REGION}:{ACCOUNT}:textract-done",
+            "TEXTRACT_ROLE_ARN": f"arn:aws:iam::{ACCOUNT}:role/textract-sns"},
+}
+SERVICES = {"s3": "s3", "sqs": "sqs", "textract": "textract", "bedrock": "bedrock-runtime",
+            "bedrock-runtime": "bedrock-runtime"}
+
+log = logging.getLogger("loadtest")
+
+# --- measurement ---
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+class Recorder:
+    """Latency samples and outcomes per stage."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)  # stage -> [(start, end, ok)]
+        self.statuses = defaultdict(Counter)
+
+    def add(self, stage, start, end, ok, status=None):
+        with self.lock:
+            self.samples[stage].append((start, end, ok))
+            if status is not None:
+                self.statuses[stage][str(status)] += 1
+
+    def report(self):
+        out = {}
+        for stage, samples in sorted(self.samples.items()):
+            ms = sorted((end - start) * 1000.0 for start, end, _ in samples)
+            errors = sum(1 for *_, ok in samples if not ok)
+            span = max(end for _, end, _ in samples) - min(start for start, _, _ in samples)
+            out[stage] = {"count": len(samples), "per_s": round(len(samples) / span, 2) if span > 0 else None,
+                          "p50_ms": round(_percentile(ms, 0.50), 1), "p95_ms": round(_percentile(ms, 0.95), 1),
+                          "p99_ms": round(_percentile(ms, 0.99), 1), "max_ms": round(ms[-1], 1),
+                          "mean_ms": round(sum(ms) / len(ms), 1), "errors": errors,
+                          "error_rate": round(errors / len(samples), 4)}
+            if self.statuses[stage]:
+                out[stage]["status"] = dict(sorted(self.statuses[stage].items()))
+        return out
+
+class _Context:
+    """The parts of the Lambda context object the handlers read."""
+
+    def __init__(self, function_name):
+        self.function_name = function_name
+        self.aws_request_id = str(uuid.uuid4())
+        self.memory_limit_in_mb = 1024
+
+    def get_remaining_time_in_millis(self):
+        return 900000
+
+def invoke(recorder, stage, handler, event, start=None):
+    """Call a handler and record the outcome; returns its result, or None if it raised."""
+    start = time.perf_counter() if start is None else start
+    try:
+        result = handler(event, _Context(stage))
+    except Exception:
+        log.exception("%s raised", stage)
+        recorder.add(stage, start, time.perf_counter(), False, "exception")
+        return None
+    status = result.get("statusCode") if isinstance(result, dict) else None
+    failed = isinstance(result, dict) and bool(result.get("batchItemFailures"))
+    recorder.add(stage, start, time.perf_counter(), not failed and (status or 200) < 500, status)
+    return result
+
+def _sqs_event(messages, queue_url):
+    arn = f"arn:aws:sqs:{REGION}:{ACCOUNT}:{queue_url.rsplit('/', 1)[-1]}"
+    return {"Records": [{"messageId": m["messageId"], "receiptHandle": m["messageId"], "body": m["body"],
+                         "attributes": {"ApproximateReceiveCount": str(m["receive_count"]),
+                                        "SentTimestamp": str(int(m["sent"] * 1000))},
+                         "eventSource": "aws:sqs", "eventSourceARN": arn, "awsRegion": REGION}
+                        for m in messages]}
+
+class Poller:
+    """The SQS event source mapping: `workers` concurrent invocations of up to `batch_size`
+    records, partial batch failures retried after the visibility timeout."""
+
+    def __init__(self, queue, handler, stage, recorder, args, batch_size, on_batch=None):
+        self.queue, self.handler, self.stage, self.recorder = queue, handler, stage, recorder
+        self.batch_size = batch_size
+        self.workers = args.workers or args.concurrency
+        self.visibility = args.visibility_timeout * args.time_scale
+        self.max_receive = args.max_receive
+        self.on_batch = on_batch
+        self.stopped = threading.Event()
+        self.threads = []
+        self.records = Counter()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.stage}-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+
+    def _run(self):
+        while not self.stopped.is_set():
+            batch = self.queue.receive(self.batch_size, wait=0.2)
+            if not batch:
+                continue
+            result = invoke(self.recorder, self.stage, self.handler, _sqs_event(batch, self.queue.url))
+            if result is None:
+                failed = {m["messageId"] for m in batch}
+            else:
+                failed = {f["itemIdentifier"] for f in result.get("batchItemFailures", [])}
+            dead = []
+            for m in batch:
+                if m["messageId"] not in failed:
+                    self.queue.done(m)
+                elif m["receive_count"] >= self.max_receive:
+                    self.queue.done(m)
+                    dead.append(m)
+                else:
+                    self.queue.retry(m, self.visibility)
+            with self.recorder.lock:
+                self.records.update(records=len(batch), record_failures=len(failed), dead_lettered=len(dead))
+            if self.on_batch:
+                self.on_batch(batch, failed, dead)
+
+def drive(events, run, args):
+    """run(event, scheduled start) for every (offset, event): open loop when there are
+    offsets, closed loop on args.concurrency threads otherwise."""
+    if args.rate:
+        rng = random.Random(args.seed + 1)
+        at, timed = 0.0, []
+        for _, event in events:
+            timed.append((at, event))
+            at += rng.expovariate(args.rate)
+        events = timed
+    elif any(offset is not None for offset, _ in events):
+        events = [((offset or 0.0) / args.speed, event) for offset, event in events]
+    else:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(lambda e: run(e[1], None), events))
+        return
+    first = min(offset for offset, _ in events)
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        started = time.perf_counter()
+        for offset, event in sorted(events, key=lambda e: e[0]):
+            scheduled = started + offset - first
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(run, event, scheduled)
+
+def _load_events(path):
+    events = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                doc = json.loads(line)
+                events.append((doc.get("offset"), doc["event"]) if "event" in doc else (None, doc))
+    return events
+
+def _is_sqs(event):
+    records = event.get("Records") or [{}]
+    return records[0].get("eventSource") == "aws:sqs"
+
+def _sqs_messages(event):
+    return [{"messageId": r.get("messageId", str(uuid.uuid4())), "body": r["body"], "sent": time.time(),
+             "receive_count": int(r.get("attributes", {}).get("ApproximateReceiveCount", "1"))}
+            for r in event["Records"]]
+
+# --- targets ---
+
+class Target:
+    env = {}
+    lambda_dir = None
+
+    def __init__(self, backend, recorder, args):
+        self.backend, self.recorder, self.args = backend, recorder, args
+        self.rng = random.Random(args.seed)
+        self.pollers = []
+
+    def setup(self):
+        """Import the handlers (after the fakes are installed) and seed fixtures."""
+
+    def synthetic(self, count):
+        return []
+
+    def run(self, event, start):
+        raise NotImplementedError
+
+    def pending(self) -> int:
+        return sum(p.queue.pending() for p in self.pollers)
+
+    def finish(self):
+        """Called after draining; record anything that never completed."""
+
+class FaqTarget(Target):
+    lambda_dir = FAQ_BOT / "lambda"
+
+    def setup(self):
+        global qna, bench_retrieval
+        sys.path.insert(0, str(FAQ_BOT / "tools"))
+        import qna, bench_retrieval
+        if self.args.faq_size:
+            self.faqs = bench_retrieval.make_corpus(self.args.faq_size, self.args.seed)
+        else:
+            self.faqs = json.loads((FAQ_BOT / "data" / "faq.json").read_text())
+        self.tenants = [f"t{i:03d}" for i in range(self.args.tenants)]
+        if self.tenants and not qna.FAQ_TENANT_KEY:
+            raise SystemExit("--tenants needs --env FAQ_TENANT_KEY=tenants/{tenant}/faq.json")
+        for key in [qna.FAQ_TENANT_KEY.format(tenant=t) for t in self.tenants] or [qna.FAQ_KEY]:
+            self.backend.store(qna.FAQ_BUCKET, key, json.dumps(self.faqs))
+
+    def synthetic(self, count):
+        args, rng = self.args, self.rng
+        queries = [q for q, _ in bench_retrieval.make_queries(self.faqs, count * max(1, args.batch_questions),
+                                                               seed=args.seed)]
+        # tenant popularity is skewed (1/rank), so the LRU sees a hot set and a long tail
+        weights = [1 / (i + 1) for i in range(len(self.tenants))]
+        asked, events = [], []
+        for _ in range(count):
+            tenant = {"tenant": rng.choices(self.tenants, weights)[0]} if self.tenants else {}
+            if asked and rng.random() < args.repeat_fraction:
+                question = rng.choice(asked)  # answer cache
+            else:
+                question = queries.pop()
+                asked.append(question)
+            roll = rng.random()
+            if roll < args.batch_fraction:
+                batch = [question] + [queries.pop() for _ in range(args.batch_questions - 1)]
+                events.append({"httpMethod": "POST", "path": "/ask/batch", "body": json.dumps({"questions": batch, **tenant})})
+            elif roll < args.batch_fraction + args.stream_fraction:
+                events.append({"httpMethod": "POST", "path": "/ask", "body": json.dumps({"question": question, "stream": True, **tenant})})
+            else:
+                events.append({"httpMethod": "POST", "path": "/ask", "body": json.dumps({"question": question, **tenant})})
+        return events
+
+    def run(self, event, start):
+        body = json.loads(event.get("body") or "{}") if event.get("httpMethod") == "POST" else {}
+        if event.get("httpMethod") != "POST":
+            stage = event.get("path", "/").rsplit("/", 1)[-1] or "root"
+        else:
+            stage = "ask_batch" if event.get("path", "").endswith("/batch") else "ask_stream" if body.get("stream") else "ask"
+        invoke(self.recorder, stage, qna.lambda_handler, event, start)
+
+class SummarizeTarget(Target):
+    lambda_dir = SUMMARIZER / "lambda"
+
+    def setup(self):
+        global text_summarizer
+        import text_summarizer
+        self.submitted = {}  # job id -> submit time
+        self.lock = threading.Lock()
+        self.pollers.append(Poller(self.backend.queue(text_summarizer.JOB_QUEUE_URL), text_summarizer.job_handler,
+                                   "job_handler", self.recorder, self.args, self.args.batch_size or 1, self._jobs_done))
+
+    def synthetic(self, count):
+        args, rng = self.args, self.rng
+        length = fakes.Latency.parse(args.text_chars)
+        texts, events = [], []
+        for _ in range(count):
+            if texts and rng.random() < args.repeat_fraction:
+                text = rng.choice(texts)  # content-hash summary cache
+            else:
+                chars, parts = max(200, int(length.sample(rng))), []
+                while sum(len(p) + 1 for p in parts) < chars:
+                    parts.append(fakes.sentence(rng, rng.randint(6, 20)))
+                text = " ".join(parts)
+                texts.append(text)
+            body = {"text": text}
+            if rng.random() < args.async_fraction:
+                body["async"] = True
+            events.append({"requestContext": {"http": {"method": "POST", "path": "/summarize"}},
+                           "rawPath": "/summarize", "body": json.dumps(body)})
+        return events
+
+    def run(self, event, start):
+        if _is_sqs(event):
+            for m in _sqs_messages(event):
+                job = json.loads(m["body"])
+                with self.lock:
+                    self.submitted.setdefault(job["job_id"], time.perf_counter())
+                self.backend.queue(text_summarizer.JOB_QUEUE_URL).send(m["body"])
+            return
+        result = invoke(self.recorder, "summarize", text_summarizer.lambda_handler, event, start)
+        if result and result.get("statusCode") == 202:
+            with self.lock:
+                self.submitted[json.loads(result["body"])["job_id"]] = start or time.perf_counter()
+
+    def _jobs_done(self, batch, failed, dead):
+        for m in batch:
+            if m["messageId"] in failed and m not in dead:
+                continue  # redelivered later
+            job_id = json.loads(m["body"])["job_id"]
+            event = {"requestContext": {"http": {"method": "GET", "path": f"/summarize/{job_id}"}},
+                     "pathParameters": {"job_id": job_id}}
+            result = invoke(self.recorder, "job_status", text_summarizer.lambda_handler, event)
+            doc = json.loads(result["body"]) if result else {}
+            with self.lock:
+                submitted = self.submitted.pop(job_id, None)
+            if submitted is not None:
+                self.recorder.add("job_end_to_end", submitted, time.perf_counter(), doc.get("status") == "done",
+                                  doc.get("status", "dead_lettered" if m in dead else "unknown"))
+
+    def finish(self):
+        for job_id, submitted in self.submitted.items():
+            self.recorder.add("job_end_to_end", submitted, time.perf_counter(), False, "incomplete")
+
+class PdfTarget(Target):
+    lambda_dir = SUMMARIZER / "lambda"
+
+    def setup(self):
+        global pdf_ingest, textract_postprocess
+        import pdf_ingest, textract_postprocess
+        self.uploaded = {}  # base name -> upload time
+        self.lock = threading.Lock()
+        self.backend.subscribe(pdf_ingest.SNS_TOPIC_ARN, pdf_ingest.QUEUE_URL)
+        self.backend.on_put(self._summary_written)
+        self.pollers.append(Poller(self.backend.queue(pdf_ingest.QUEUE_URL), textract_postprocess.lambda_handler,
+                                   "postprocess", self.recorder, self.args, self.args.batch_size or 10, self._records_done))
+
+    def _pdf(self, rng, scanned):
+        pages = max(1, int(fakes.Latency.parse(self.args.pages).sample(rng)))
+        return fakes.make_pdf([[] if scanned else [fakes.sentence(rng, rng.randint(6, 14)) for _ in range(25)]
+                         for _ in range(pages)])
+
+    def synthetic(self, count):
+        args, rng = self.args, self.rng
+        bodies, events = [], []
+        for n in range(count):
+            if bodies and rng.random() < args.duplicate_fraction:
+                body = rng.choice(bodies)  # same bytes, new key: content-hash dedup
+            else:
+                body = self._pdf(rng, rng.random() < args.scanned_fraction)
+                bodies.append(body)
+            key = f"uploads/doc-{n:05d}.pdf"
+            self.backend.store(pdf_ingest.INPUT_BUCKET, key, body)
+            events.append({"Records": [{"eventSource": "aws:s3", "eventName": "ObjectCreated:Put", "s3": {
+                "bucket": {"name": pdf_ingest.INPUT_BUCKET}, "object": {"key": key, "size": len(body)}}}]})
+        return events
+
+    def run(self, event, start):
+        if _is_sqs(event):
+            for m in _sqs_messages(event):
+                self.backend.queue(pdf_ingest.QUEUE_URL).send(m["body"])
+            return
+        for record in event.get("Records", []):
+            bucket, key = record["s3"]["bucket"]["name"], record["s3"]["object"]["key"]
+            if self.backend.get(bucket, key) is None:
+                self.backend.store(bucket, key, self._pdf(self.rng, False))
+            with self.lock:
+                self.uploaded[key.rsplit("/", 1)[-1].rsplit(".", 1)[0]] = start or time.perf_counter()
+        invoke(self.recorder, "pdf_ingest", pdf_ingest.lambda_handler, event, start)
+
+    def _done(self, base, ok, status):
+        with self.lock:
+            uploaded = self.uploaded.pop(base, None)
+        if uploaded is not None:
+            self.recorder.add("pdf_end_to_end", uploaded, time.perf_counter(), ok, status)
+
+    def _summary_written(self, bucket, key):
+        if bucket == pdf_ingest.OUTPUT_BUCKET and key.startswith("summaries/") and key.endswith(".summary.txt"):
+            self._done(key[len("summaries/"):-len(".summary.txt")], True, "done")
+
+    def _records_done(self, batch, failed, dead):
+        for m in batch:
+            message = json.loads(m["body"])
+            base = message.get("DocumentLocation", {}).get("S3ObjectName", "").rsplit("/", 1)[-1].rsplit(".", 1)[0]
+            if message.get("Status") != "SUCCEEDED":
+                self._done(base, False, "textract_failed")
+            elif m in dead:
+                self._done(base, False, "dead_lettered")
+
+    def pending(self) -> int:
+        with self.lock:
+            return len(self.uploaded)
+
+    def finish(self):
+        for base in list(self.uploaded):
+            self._done(base, False, "incomplete")
+
+TARGETS = {"faq": FaqTarget, "summarize": SummarizeTarget, "pdf": PdfTarget}
+
+# --- command line ---
+
+def _pairs(values, what):
+    out = {}
+    for value in values or []:
+        name, sep, setting = value.partition("=")
+        if not sep:
+            raise SystemExit(f"{what} takes NAME=VALUE, got {value!r}")
+        out[name] = setting
+    return out
+
+def _profiles(args):
+    profiles = fakes.default_profiles()
+    for option, field in (("latency", "latency"), ("throttle", "throttle"), ("errors", "error")):
+        for name, value in _pairs(getattr(args, option), f"--{option}").items():
+            if name not in SERVICES:
+                raise SystemExit(f"Unknown service {name!r}; one of {', '.join(sorted(SERVICES))}")
+            profile = profiles[SERVICES[name]]
+            setattr(profile, field, fakes.Latency.parse(value) if field == "latency" else float(value))
+    return profiles
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def _print_report(report):
+    print(f"{'stage':<18}{'count':>7}{'per s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>9}")
+    for stage, s in report["stages"].items():
+        per_s = f"{s['per_s']:.1f}" if s["per_s"] else "-"
+        print(f"{stage:<18}{s['count']:>7}{per_s:>9}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}"
+              f"{s['max_ms']:>10.1f}{s['error_rate']:>9.2%}")
+    for name, records in report["sqs"].items():
+        print(f"{name}: " + ", ".join(f"{k} {v}" for k, v in records.items()))
+    print("backend: " + ", ".join(f"{k} {v}" for k, v in report["backend"].items()))
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay load against the Lambdas with local AWS fakes.")
+    ap.add_argument("target", choices=sorted(TARGETS))
+    ap.add_argument("--requests", type=int, default=200, help="Synthetic events to send")
+    ap.add_argument("--events", default=None, help="JSON-lines file of recorded events (replaces synthetic ones)")
+    ap.add_argument("--concurrency", type=int, default=16, help="Concurrent handler invocations")
+    ap.add_argument("--rate", type=float, default=0.0, help="Open loop: Poisson arrivals per second")
+    ap.add_argument("--speed", type=float, default=1.0, help="Replay recorded offsets this many times faster")
+    ap.add_argument("--time-scale", type=float, default=1.0, help="Multiplier for every simulated wait")
+    ap.add_argument("--latency", action="append", metavar="SERVICE=MEDIAN[:P99]", help="Call latency in ms")
+    ap.add_argument("--throttle", action="append", metavar="SERVICE=P", help="Throttling probability per call")
+    ap.add_argument("--errors", action="append", metavar="SERVICE=P", help="5xx probability per call")
+    ap.add_argument("--token-ms", type=float, default=12.0, help="Bedrock time per output token")
+    ap.add_argument("--output-tokens", type=int, default=250, help="Bedrock output tokens (capped by maxTokens)")
+    ap.add_argument("--job-latency", default="4000:15000", help="Textract job time before pages, MEDIAN[:P99] ms")
+    ap.add_argument("--page-seconds", type=float, default=0.3, help="Textract job time per page")
+    ap.add_argument("--job-failures", type=float, default=0.0, help="Share of Textract jobs that finish FAILED")
+    ap.add_argument("--workers", type=int, default=0, help="Concurrent SQS handler invocations (default --concurrency)")
+    ap.add_argument("--batch-size", type=int, default=0, help="SQS batch size (default as deployed: pdf 10, summarize 1)")
+    ap.add_argument("--visibility-timeout", type=float, default=30.0, help="Seconds before a failed record is redelivered")
+    ap.add_argument("--max-receive", type=int, default=3, help="Deliveries before a record is dead-lettered")
+    ap.add_argument("--drain-timeout", type=float, default=300.0, help="Wall seconds to wait for queued work")
+    ap.add_argument("--env", action="append", metavar="NAME=VALUE", help="Lambda environment override")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--log", default=None, help="Write handler logs here (default: discarded)")
+    ap.add_argument("--out", default=None, help="Write the report as JSON")
+    synthetic = ap.add_argument_group("synthetic events")
+    synthetic.add_argument("--repeat-fraction", type=float, default=0.2, help="faq/summarize: repeated inputs (cache hits)")
+    synthetic.add_argument("--faq-size", type=int, default=0, help="faq: generated FAQ entries (0 = data/faq.json)")
+    synthetic.add_argument("--tenants", type=int, default=0,
+                           help="faq: spread requests over N tenants (with --env FAQ_TENANT_KEY=...)")
+    synthetic.add_argument("--stream-fraction", type=float, default=0.0, help="faq: streamed questions")
+    synthetic.add_argument("--batch-fraction", type=float, default=0.0, help="faq: /ask/batch requests")
+    synthetic.add_argument("--batch-questions", type=int, default=20, help="faq: questions per batch request")
+    synthetic.add_argument("--text-chars", default="6000:60000", help="summarize: text length, MEDIAN[:P99] chars")
+    synthetic.add_argument("--async-fraction", type=float, default=0.2, help="summarize: requests sent with async")
+    synthetic.add_argument("--pages", default="6:60", help="pdf: pages per document, MEDIAN[:P99]")
+    synthetic.add_argument("--scanned-fraction", type=float, default=0.3, help="pdf: documents without a text layer")
+    synthetic.add_argument("--duplicate-fraction", type=float, default=0.1, help="pdf: re-uploads of earlier documents")
+    args = ap.parse_args()
+
+    if args.log:
+        logging.basicConfig(filename=args.log, level=logging.INFO, format="%(asctime)s %(threadName)s %(levelname)s %(name)s %(message)s")
+    else:
+        logging.disable(logging.CRITICAL)
+    target_cls = TARGETS[args.target]
+    env = dict(ENV[args.target], AWS_REGION=REGION, AWS_DEFAULT_REGION=REGION, METRICS="off",
+               **_pairs(args.env, "--env"))
+    os.environ.update(env)
+
+    backend = fakes.Backend(_profiles(args), args.time_scale, args.seed, args.token_ms, args.output_tokens,
+                            args.job_latency, args.page_seconds, args.job_failures)
+    backend.install()
+    sys.path[:0] = [str(target_cls.lambda_dir), str(SHARED)]
+    recorder = Recorder()
+    target = target_cls(backend, recorder, args)
+    target.setup()
+    events = _load_events(args.events) if args.events else [(None, e) for e in target.synthetic(args.requests)]
+
+    for poller in target.pollers:
+        poller.start()
+    started = time.perf_counter()
+    drive(events, target.run, args)
+    sent = time.perf_counter()
+    deadline = sent + args.drain_timeout
+    while target.pending() and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    for poller in target.pollers:
+        poller.stop()
+    target.finish()
+    backend.uninstall()
+
+    report = {
+        "meta": {"target": args.target, "commit": _git_commit(), "events": len(events),
+                 "recorded": bool(args.events), "concurrency": args.concurrency, "rate": args.rate,
+                 "time_scale": args.time_scale, "seed": args.seed, "env": env,
+                 "profiles": {name: p.to_dict() for name, p in backend.profiles.items()},
+                 "send_seconds": round(sent - started, 3), "total_seconds": round(time.perf_counter() - started, 3),
+                 "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())},
+        "stages": recorder.report(),
+        "sqs": {p.stage: dict(p.records) for p in target.pollers},
+        "backend": dict(sorted(backend.stats.items())),
+    }
+    _print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
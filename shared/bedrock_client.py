@@ -0,0 +1,362 @@
+"""
+Shared Bedrock runtime access for the Lambdas. The FAQ bot and the summarizer both
+deploy this directory as a Lambda layer.
+
+`shared()` returns a process-wide Invoker, a drop-in for the bedrock-runtime client
+methods the Lambdas use (converse, converse_stream, invoke_model,
+invoke_model_with_response_stream). Every call goes through:
+
+- one pooled keep-alive boto3 client with botocore's adaptive retry mode (exponential
+  backoff with jitter, plus client-side slowdown once Bedrock starts throttling);
+- a circuit breaker: after BEDROCK_BREAKER_FAILURES consecutive throttling, timeout or
+  5xx errors, calls fail fast with Unavailable for BEDROCK_BREAKER_COOLDOWN seconds,
+  then a single trial call decides whether to close it again;
+- an optional token bucket for requests and tokens per minute (BEDROCK_RPM /
+  BEDROCK_TPM, 0 = off). Waiters are served by priority: INTERACTIVE before BATCH, and
+  BATCH callers leave BEDROCK_BATCH_RESERVE of each bucket for interactive ones. This
+  only orders calls made in one execution environment, such as the FAQ bot's /ask/batch
+  and /ask sharing a container.
+
+Callers of `converse` place their own cache points; `ask` places none, since its short
+instructions are below the minimum prefix Bedrock caches. When a model answers a request
+with cache points with a ValidationException about them, `converse` retries once without
+and remembers the model.
+
+Call latency, limiter waits and input/output tokens are recorded with `metrics`.
+
+Limits and breaker state are per execution environment, so size BEDROCK_RPM/TPM as the
+account quota divided by the function's expected concurrency. Functions share nothing:
+to keep background functions off an interactive one's quota, give them a smaller share.
+"""
+import heapq, itertools, json, logging, os, re, threading, time
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE, BATCH = 0, 1
+_PRIORITIES = {"interactive": INTERACTIVE, "batch": BATCH}
+
+PRIORITY = _PRIORITIES[os.environ.get("BEDROCK_PRIORITY", "interactive")]  # default for calls without one
+MAX_ATTEMPTS = int(os.environ.get("BEDROCK_MAX_ATTEMPTS", "5"))  # adaptive retry attempts per call
+READ_TIMEOUT = int(os.environ.get("BEDROCK_READ_TIMEOUT", "120"))
+RPM = int(os.environ.get("BEDROCK_RPM", "0"))  # requests per minute, 0 = unlimited
+TPM = int(os.environ.get("BEDROCK_TPM", "0"))  # input + output tokens per minute, 0 = unlimited
+BATCH_RESERVE = float(os.environ.get("BEDROCK_BATCH_RESERVE", "0.2"))  # bucket share BATCH calls leave alone
+QUEUE_TIMEOUT = float(os.environ.get("BEDROCK_QUEUE_TIMEOUT", "60"))  # longest wait for the limiter
+BREAKER_FAILURES = int(os.environ.get("BEDROCK_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("BEDROCK_BREAKER_COOLDOWN", "30"))
+
+CHARS_PER_TOKEN = 4
+_OVERLOAD = {"ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException",
+             "ModelNotReadyException", "ModelTimeoutException", "InternalServerException"}
+_CACHE_POINT = "cachePoint"
+
+class Unavailable(Exception):
+    """Bedrock is not called: the circuit is open or the rate limiter timed out."""
+
+def record_usage(usage):
+    """Count input/output tokens from a Converse (inputTokens) or Anthropic (input_tokens) usage block."""
+    if usage:
+        metrics.count("input_tokens", usage.get("inputTokens", usage.get("input_tokens", 0)))
+        metrics.count("output_tokens", usage.get("outputTokens", usage.get("output_tokens", 0)))
+
+def is_overload(error) -> bool:
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in _OVERLOAD
+    return isinstance(error, (BotoConnectionError, HTTPClientError))
+
+class RateLimiter:
+    """Token buckets for requests and model tokens per minute (0 disables a bucket), refilled
+    continuously. Waiters are served in (priority, arrival) order."""
+
+    def __init__(self, rpm=0, tpm=0, batch_reserve=0.0):
+        self.capacity = (float(rpm), float(tpm))
+        self.levels = list(self.capacity)
+        self.batch_reserve = batch_reserve
+        self.updated = time.monotonic()
+        self.cond = threading.Condition()
+        self.waiting = []
+        self.arrivals = itertools.count()
+
+    @property
+    def enabled(self) -> bool:
+        return any(self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self.updated = now - self.updated, now
+        for i, cap in enumerate(self.capacity):
+            if cap:
+                self.levels[i] = min(cap, self.levels[i] + elapsed * cap / 60.0)
+
+    def _wait_time(self, tokens, priority):
+        """Seconds until both buckets cover one request of `tokens` (0 = now)."""
+        wait = 0.0
+        for i, (cap, need) in enumerate(zip(self.capacity, (1.0, float(tokens)))):
+            if not cap:
+                continue
+            floor = cap * self.batch_reserve if priority > INTERACTIVE else 0.0
+            want = min(need + floor, cap)  # a request larger than the bucket waits for a full one
+            if self.levels[i] < want:
+                wait = max(wait, (want - self.levels[i]) * 60.0 / cap)
+        return wait
+
+    def acquire(self, tokens=0, priority=INTERACTIVE, timeout=None):
+        if not self.enabled:
+            return
+        entry = (priority, next(self.arrivals))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            heapq.heappush(self.waiting, entry)
+            try:
+                while True:
+                    self._refill()
+                    wait = self._wait_time(tokens, priority) if self.waiting[0] == entry else None
+                    if wait == 0:
+                        self.levels[0] -= 1
+                        self.levels[1] -= tokens
+                        return
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise Unavailable("Bedrock rate limit: timed out waiting for capacity")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self.cond.wait(wait)
+            finally:
+                self.waiting.remove(entry)
+                heapq.heapify(self.waiting)
+                self.cond.notify_all()
+
+    def settle(self, estimated, actual):
+        """Correct the token bucket once a call reports its real usage."""
+        if not self.capacity[1]:
+            return
+        with self.cond:
+            self.levels[1] = min(self.capacity[1], self.levels[1] + estimated - actual)
+            self.cond.notify_all()
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive overload failures; while open, calls fail fast
+    until `cooldown` has passed, then one trial call is let through (half-open)."""
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.probing else "open"
+
+    def before(self):
+        if not self.threshold:
+            return
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if self.probing or time.monotonic() - self.opened_at < self.cooldown:
+                raise Unavailable("Bedrock circuit open after repeated throttling or errors")
+            self.probing = True
+
+    def success(self):
+        with self.lock:
+            self.failures, self.opened_at, self.probing = 0, None, False
+
+    def failure(self):
+        if not self.threshold:
+            return
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                if self.opened_at is None or self.probing:
+                    logger.warning("Bedrock circuit opened after %d failure(s)", self.failures)
+                self.opened_at, self.probing = time.monotonic(), False
+
+    def release(self):
+        """A call ended without telling anything about Bedrock's health (e.g. a validation error)."""
+        with self.lock:
+            self.probing = False
+
+def _estimate_tokens(kwargs) -> int:
+    if "body" in kwargs:
+        body = kwargs["body"]
+        try:
+            max_tokens = json.loads(body).get("max_tokens", 0)
+        except (ValueError, AttributeError):
+            max_tokens = 0
+        return len(body) // CHARS_PER_TOKEN + int(max_tokens or 0)
+    prompt = json.dumps([kwargs.get("system", []), kwargs.get("messages", [])])
+    return len(prompt) // CHARS_PER_TOKEN + int(kwargs.get("inferenceConfig", {}).get("maxTokens", 0))
+
+class Invoker:
+    """bedrock-runtime methods behind the breaker and limiter; each accepts priority=."""
+
+    def __init__(self, client, limiter, breaker, priority=INTERACTIVE):
+        self.client = client
+        self.limiter = limiter
+        self.breaker = breaker
+        self.priority = priority
+
+    def _call(self, method, kwargs, priority):
+        estimate = _estimate_tokens(kwargs)
+        self.breaker.before()
+        try:
+            if self.limiter.enabled:
+                with metrics.timed("rate_limit_wait"):
+                    self.limiter.acquire(estimate, self.priority if priority is None else priority, QUEUE_TIMEOUT)
+            with metrics.timed("bedrock"):
+                resp = getattr(self.client, method)(**kwargs)
+        except Exception as e:
+            if is_overload(e):
+                metrics.count("bedrock_overload")
+                self.breaker.failure()
+            else:
+                self.breaker.release()
+            raise
+        self.breaker.success()
+        usage = resp.get("usage") if isinstance(resp, dict) else None
+        if usage:
+            record_usage(usage)
+            if "totalTokens" in usage:
+                self.limiter.settle(estimate, usage["totalTokens"])
+        return resp
+
+    def converse(self, priority=None, **kwargs):
+        return self._call("converse", kwargs, priority)
+
+    def converse_stream(self, priority=None, **kwargs):
+        return self._call("converse_stream", kwargs, priority)
+
+    def invoke_model(self, priority=None, **kwargs):
+        return self._call("invoke_model", kwargs, priority)
+
+    def invoke_model_with_response_stream(self, priority=None, **kwargs):
+        return self._call("invoke_model_with_response_stream", kwargs, priority)
+
+_SHARED = None
+_SHARED_LOCK = threading.Lock()
+
+def shared(pool_size=10) -> Invoker:
+    """The process-wide Invoker; `pool_size` (keep-alive connections) is taken from the first
+    caller, so size it for the most concurrent Bedrock calls the Lambda makes."""
+    global _SHARED
+    with _SHARED_LOCK:
+        if _SHARED is None:
+            client = boto3.client("bedrock-runtime", region_name=os.environ.get("AWS_REGION", "us-east-1"), config=Config(
+                retries={"max_attempts": MAX_ATTEMPTS, "mode": "adaptive"}, max_pool_connections=max(10, pool_size),
+                tcp_keepalive=True, connect_timeout=5, read_timeout=READ_TIMEOUT))
+            _SHARED = Invoker(client, RateLimiter(RPM, TPM, BATCH_RESERVE),
+                              CircuitBreaker(BREAKER_FAILURES, BREAKER_COOLDOWN), PRIORITY)
+        return _SHARED
+
+# --- request shapes and parsing shared by the Lambdas ---
+
+_NO_PROMPT_CACHE = set()  # models that rejected cache points
+# how Bedrock words a ValidationException about cache points ("...does not support caching",
+# "extraneous key [cachePoint]..."); other validation errors are the request's own fault
+_CACHE_REJECTED = re.compile(r"cache ?point|prompt cach|caching", re.IGNORECASE)
+
+def prompt_cache_ok(model_id) -> bool:
+    return model_id not in _NO_PROMPT_CACHE
+
+def _without_cache_points(request):
+    return dict(request, system=[b for b in request.get("system", []) if _CACHE_POINT not in b],
+                messages=[dict(m, content=[b for b in m["content"] if _CACHE_POINT not in b])
+                          for m in request["messages"]])
+
+def _rejects_cache_points(request, error) -> bool:
+    err = error.response.get("Error", {})
+    cached = any(_CACHE_POINT in b for b in request.get("system", [])) or any(
+        _CACHE_POINT in b for m in request["messages"] for b in m["content"])
+    return cached and err.get("Code") == "ValidationException" and bool(_CACHE_REJECTED.search(err.get("Message", "")))
+
+def converse(request, stream=False, priority=None, client=None, rebuild=None):
+    """converse/converse_stream; a model that rejects cache points is retried once without
+    them and remembered. `rebuild()`, when given, makes that retry's request (for callers
+    whose uncached request differs). Any other ValidationException is raised as is."""
+    client = client or shared()
+    call = client.converse_stream if stream else client.converse
+    try:
+        return call(priority=priority, **request)
+    except ClientError as e:
+        if not _rejects_cache_points(request, e):
+            raise
+        logger.warning("%s rejected prompt caching; retrying without cache points", request["modelId"])
+        _NO_PROMPT_CACHE.add(request["modelId"])
+        return call(priority=priority, **_without_cache_points(rebuild() if rebuild else request))
+
+def converse_text(resp) -> str:
+    return resp["output"]["message"]["content"][0]["text"].strip()
+
+def invoke_text(body, model_id, priority=None, client=None) -> str:
+    """invoke_model with a provider-native body; returns the generated text."""
+    resp = (client or shared()).invoke_model(
+        priority=priority,
+        modelId=model_id,
+        body=json.dumps(body).encode("utf-8"),
+        contentType="application/json",
+        accept="application/json",
+    )
+    payload = json.loads(resp["body"].read())
+    record_usage(payload.get("usage"))
+    parts = payload.get("content", [])
+    if parts and isinstance(parts, list) and parts[0].get("type") == "text":
+        return parts[0].get("text", "").strip()
+    # Fallback shapes for other providers
+    return payload.get("outputText") or payload.get("generated_text") or json.dumps(payload)
+
+def invoke_text_stream(body, model_id, priority=None, client=None):
+    """invoke_model_with_response_stream; yields text deltas."""
+    resp = (client or shared()).invoke_model_with_response_stream(
+        priority=priority,
+        modelId=model_id,
+        body=json.dumps(body).encode("utf-8"),
+        contentType="application/json",
+        accept="application/json",
+    )
+    for event in resp["body"]:
+        chunk = event.get("chunk")
+        if not chunk:
+            continue
+        payload = json.loads(chunk["bytes"])
+        if payload.get("type") == "message_start":
+            record_usage(payload.get("message", {}).get("usage"))
+        elif payload.get("type") == "message_delta":
+            record_usage(payload.get("usage"))
+        if payload.get("type") == "content_block_delta":
+            text = payload.get("delta", {}).get("text")
+        else:
+            # Fallback shapes for other providers
+            text = payload.get("outputText") or payload.get("generation")
+        if text:
+            yield text
+
+def ask(model_id, instructions, text, max_tokens, temperature=0.2, api="converse", priority=None,
+        client=None) -> str:
+    """One instruction + text completion. Converse puts `instructions` in the system prompt;
+    api="invoke" sends the legacy Anthropic Messages body instead."""
+    if api == "invoke" and model_id.startswith("anthropic."):
+        body = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "messages": [{"role": "user", "content": [{"type": "text", "text": f"{instructions}\n\n{text}"}]}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+        }
+        return invoke_text(body, model_id, priority, client)
+    request = {
+        "modelId": model_id,
+        "system": [{"text": instructions}],
+        "messages": [{"role": "user", "content": [{"text": text}]}],
+        "inferenceConfig": {"maxTokens": max_tokens, "temperature": temperature},
+    }
+    return converse_text(converse(request, priority=priority, client=client))
@@ -0,0 +1,107 @@
+"""
+Per-stage latency and counters for the Lambdas. The FAQ bot and the summarizer both
+deploy this directory as a Lambda layer.
+
+Stages are timed with `with metrics.timed("retrieval"): ...` and counters added with
+`metrics.count("input_tokens", n)` from any thread. `@metrics.invocation` on a handler
+writes everything recorded during the invocation as one CloudWatch Embedded Metric
+Format (EMF) line on stdout, which CloudWatch Logs turns into metrics:
+
+    {"_aws": {...}, "Service": "<function>", "ColdStart": true, "cold_start": 1,
+     "invocation_ms": 812.4, "retrieval_ms": 3.1, "bedrock_ms": [402.2, 388.0], ...}
+
+A stage timed more than once reports every duration (the last 100, EMF's limit).
+The namespace is METRICS_NAMESPACE (default BedrockDemos), with the function name as the
+Service dimension; CloudWatch extracts the metrics from the log, so nothing is called.
+METRICS=off turns timers into a shared no-op and the decorator into a pass-through.
+"""
+import functools, json, os, threading, time
+from contextlib import contextmanager, nullcontext
+
+ENABLED = os.environ.get("METRICS", "on") == "on"
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "BedrockDemos")
+SERVICE = os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local")
+MAX_VALUES = 100  # EMF accepts at most 100 values per metric
+
+_cold = True
+_lock = threading.Lock()
+_timings = {}  # stage -> [ms, ...]
+_counts = {}  # name -> total
+_NOOP = nullcontext()
+
+class _Timer:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.stage, (time.perf_counter() - self.started) * 1000.0)
+
+def timed(stage):
+    """Context manager timing one run of `stage`."""
+    return _Timer(stage) if ENABLED else _NOOP
+
+def record(stage, ms):
+    if not ENABLED:
+        return
+    with _lock:
+        _timings.setdefault(stage, []).append(round(ms, 3))
+
+def count(name, value=1):
+    if not ENABLED or not value:
+        return
+    with _lock:
+        _counts[name] = _counts.get(name, 0) + value
+
+def flush(**properties):
+    """Write everything recorded since the last flush as one EMF line, then reset."""
+    global _timings, _counts
+    with _lock:
+        timings, counts, _timings, _counts = _timings, _counts, {}, {}
+    doc = {"Service": SERVICE}
+    defs = []
+    for stage, values in timings.items():
+        name = f"{stage}_ms"
+        doc[name] = values[0] if len(values) == 1 else values[-MAX_VALUES:]
+        defs.append({"Name": name, "Unit": "Milliseconds"})
+    for name, value in counts.items():
+        doc[name] = value
+        defs.append({"Name": name, "Unit": "Count"})
+    doc.update(properties)
+    doc["_aws"] = {"Timestamp": int(time.time() * 1000),
+                   "CloudWatchMetrics": [{"Namespace": NAMESPACE, "Dimensions": [["Service"]], "Metrics": defs}]}
+    print(json.dumps(doc, separators=(",", ":")), flush=True)
+
+@contextmanager
+def scope(request_id=None):
+    """One invocation (or one request of a long-running server): records cold or warm
+    start and the total time, then flushes."""
+    if not ENABLED:
+        yield
+        return
+    global _cold
+    cold, _cold = _cold, False
+    with _lock:
+        _counts["cold_start"] = 1 if cold else 0  # averages to the cold-start rate
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record("invocation", (time.perf_counter() - started) * 1000.0)
+        flush(ColdStart=cold, RequestId=request_id)
+
+def invocation(handler):
+    """Lambda handler decorator around scope()."""
+    if not ENABLED:
+        return handler
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        with scope(getattr(context, "aws_request_id", None)):
+            return handler(event, context)
+    return wrapper
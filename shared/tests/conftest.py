@@ -0,0 +1,6 @@
+import os, sys
+
+# bedrock_client makes no client until shared() is called; the tests never call AWS
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("METRICS", "off")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
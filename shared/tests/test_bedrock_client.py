@@ -0,0 +1,111 @@
+import threading, time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from bedrock_client import BATCH, INTERACTIVE, CircuitBreaker, Invoker, RateLimiter, Unavailable
+
+def _error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "Converse")
+
+def test_a_disabled_limiter_never_waits():
+    limiter = RateLimiter()
+    assert not limiter.enabled
+    for _ in range(1000):
+        limiter.acquire(10 ** 6, timeout=0)
+
+def test_an_empty_bucket_times_out_then_refills():
+    limiter = RateLimiter(rpm=600)  # 10 requests a second
+    for _ in range(600):
+        limiter.acquire(timeout=0)
+    with pytest.raises(Unavailable):
+        limiter.acquire(timeout=0.01)
+    started = time.monotonic()
+    limiter.acquire(timeout=1)
+    assert 0.02 < time.monotonic() - started < 0.5
+
+def test_batch_calls_leave_the_reserve_to_interactive_ones():
+    limiter = RateLimiter(rpm=10, batch_reserve=0.5)
+    for _ in range(5):
+        limiter.acquire(priority=BATCH, timeout=0)
+    with pytest.raises(Unavailable):
+        limiter.acquire(priority=BATCH, timeout=0.01)
+    for _ in range(5):
+        limiter.acquire(priority=INTERACTIVE, timeout=0)
+
+def test_waiters_are_served_interactive_first():
+    limiter = RateLimiter(rpm=300)  # one request every 0.2 s
+    for _ in range(300):
+        limiter.acquire(timeout=0)
+    order = []
+
+    def wait(priority):
+        limiter.acquire(priority=priority, timeout=2)
+        order.append(priority)
+
+    batch = threading.Thread(target=wait, args=(BATCH,))
+    batch.start()
+    while not limiter.waiting:
+        time.sleep(0.001)
+    interactive = threading.Thread(target=wait, args=(INTERACTIVE,))
+    interactive.start()
+    batch.join(), interactive.join()
+    assert order == [INTERACTIVE, BATCH]
+
+def test_reported_usage_corrects_the_token_bucket():
+    limiter = RateLimiter(tpm=1000)
+    limiter.acquire(800, timeout=0)
+    with pytest.raises(Unavailable):
+        limiter.acquire(500, timeout=0.01)
+    limiter.settle(800, 100)  # the call used far fewer tokens than estimated
+    limiter.acquire(500, timeout=0)
+
+def test_breaker_opens_after_consecutive_failures_and_probes_once():
+    breaker = CircuitBreaker(threshold=3, cooldown=0.05)
+    for _ in range(2):
+        breaker.before()
+        breaker.failure()
+    breaker.before()
+    breaker.success()  # a success resets the count
+    for _ in range(3):
+        breaker.before()
+        breaker.failure()
+    assert breaker.state == "open"
+    with pytest.raises(Unavailable):
+        breaker.before()
+    time.sleep(0.06)
+    breaker.before()  # the trial call
+    assert breaker.state == "half-open"
+    with pytest.raises(Unavailable):
+        breaker.before()  # only one at a time
+    breaker.failure()  # a failed trial reopens at once
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    breaker.before()
+    breaker.success()
+    assert breaker.state == "closed"
+
+class FakeClient:
+    def __init__(self, *errors):
+        self.errors = list(errors)
+
+    def converse(self, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"output": {"message": {"content": [{"text": "ok"}]}}, "usage": {}}
+
+def test_only_overload_errors_count_toward_the_breaker():
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    invoker = Invoker(FakeClient(_error("ValidationException"), _error("ValidationException"),
+                                 _error("ThrottlingException"), _error("ServiceUnavailableException")),
+                      RateLimiter(), breaker)
+    for _ in range(2):
+        with pytest.raises(ClientError):
+            invoker.converse(messages=[])
+    assert breaker.state == "closed"
+    for _ in range(2):
+        with pytest.raises(ClientError):
+            invoker.converse(messages=[])
+    assert breaker.state == "open"
+    with pytest.raises(Unavailable):
+        invoker.converse(messages=[])
@@ -0,0 +1,70 @@
+import json, os, subprocess, sys
+
+import pytest
+
+import metrics
+
+@pytest.fixture
+def emf(monkeypatch, capsys):
+    """metrics switched on, as in a fresh container; returns a reader of the EMF lines printed."""
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    monkeypatch.setattr(metrics, "SERVICE", "faq-qna")
+    monkeypatch.setattr(metrics, "_cold", True)
+    monkeypatch.setattr(metrics, "_timings", {})
+    monkeypatch.setattr(metrics, "_counts", {})
+    return lambda: [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+class Context:
+    aws_request_id = "req-1"
+
+def test_an_invocation_writes_one_emf_line(emf):
+    @metrics.invocation
+    def handler(event, context):
+        with metrics.timed("retrieval"):
+            pass
+        for _ in range(3):
+            metrics.record("bedrock", 2.5)
+        metrics.count("input_tokens", 120)
+        metrics.count("output_tokens", 0)  # zero counts are left out
+        return "ok"
+
+    assert handler({}, Context()) == "ok"
+    (doc,) = emf()
+    spec = doc["_aws"]["CloudWatchMetrics"][0]
+    assert spec["Namespace"] == metrics.NAMESPACE and spec["Dimensions"] == [["Service"]]
+    units = {m["Name"]: m["Unit"] for m in spec["Metrics"]}
+    assert units == {"retrieval_ms": "Milliseconds", "bedrock_ms": "Milliseconds", "invocation_ms": "Milliseconds",
+                     "input_tokens": "Count", "cold_start": "Count"}
+    assert all(name in doc for name in units)  # every declared metric has a value
+    assert doc["Service"] == "faq-qna" and doc["RequestId"] == "req-1"
+    assert doc["bedrock_ms"] == [2.5, 2.5, 2.5] and doc["input_tokens"] == 120
+    assert doc["invocation_ms"] >= doc["retrieval_ms"] >= 0
+    assert isinstance(doc["_aws"]["Timestamp"], int)
+
+def test_only_the_first_invocation_is_a_cold_start(emf):
+    handler = metrics.invocation(lambda event, context: None)
+    for _ in range(3):
+        handler({}, Context())
+    docs = emf()
+    assert [d["ColdStart"] for d in docs] == [True, False, False]
+    assert [d["cold_start"] for d in docs] == [1, 0, 0]
+
+def test_values_past_the_emf_limit_keep_the_latest(emf):
+    for n in range(metrics.MAX_VALUES + 20):
+        metrics.record("page", n)
+    metrics.flush()
+    (doc,) = emf()
+    assert len(doc["page_ms"]) == metrics.MAX_VALUES and doc["page_ms"][-1] == metrics.MAX_VALUES + 19
+
+def test_metrics_off_prints_nothing():
+    code = ("import metrics\n"
+            "handler = metrics.invocation(lambda event, context: metrics.count('x') or 'ok')\n"
+            "with metrics.timed('retrieval'):\n"
+            "    assert handler({}, None) == 'ok'\n"
+            "assert metrics.timed('a') is metrics.timed('b')\n"
+            "metrics.record('retrieval', 1.0)\n"
+            "assert not metrics._timings and not metrics._counts\n")
+    env = dict(os.environ, METRICS="off", PYTHONPATH=os.path.dirname(metrics.__file__))
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout == ""